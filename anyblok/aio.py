@@ -0,0 +1,250 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
+from contextvars import copy_context
+from functools import partial
+from sqlalchemy.orm import Query
+from .environment import EnvironmentManager, ContextVarEnvironment
+from .registry import RegistryException, NamespaceType
+
+
+QUERY_AWAITABLE_METHODS = (
+    'all', 'one', 'first', 'one_or_none', 'count', 'get', 'delete', 'update',
+    'dictone', 'dictfirst', 'dictall',
+)
+
+
+def get_async_namespace(aregistry, value):
+    """ Return the asyncio facade of a model or of an intermediate namespace,
+    None if the value is not a namespace of the registry """
+    if isinstance(value, NamespaceType):
+        return AsyncNamespace(aregistry, value)
+
+    if isinstance(value, type) and hasattr(value, '__registry_name__'):
+        return AsyncModel(aregistry, value)
+
+    return None
+
+
+class AsyncRegistry:
+    """ Asyncio facade of the registry
+
+    The synchronous API is called in the threads of an executor, with the
+    environment and the session of the current task, the event loop is not
+    blocked by the queries::
+
+        aregistry = registry.get_async_registry()
+        blok = await aregistry.System.Blok.query().filter_by(
+            name='anyblok-core').one()
+        await aregistry.System.Parameter.insert(key='key', value=1)
+        await aregistry.commit()
+        await aregistry.close_session()
+
+    The environment must be ``ContextVarEnvironment``, defined before the
+    load of the registry
+    """
+
+    def __init__(self, registry, executor=None):
+        if not issubclass(EnvironmentManager.environment,
+                          ContextVarEnvironment):
+            raise RegistryException(
+                "The asyncio API needs the ContextVarEnvironment, "
+                "the current environment is %r" % (
+                    EnvironmentManager.environment))
+
+        self.registry = registry
+        self.executor = executor
+
+    async def run(self, func, *args, **kwargs):
+        """ Call the function in the executor with the environment and the
+        session of the current task
+
+        :param func: function to call
+        :rtype: the result of the function
+        """
+        loop = asyncio.get_running_loop()
+        scope = ContextVarEnvironment.get_scope()
+        # the values are shared by the task and the copy of its context
+        ContextVarEnvironment.get_values()
+        context = copy_context()
+        return await loop.run_in_executor(
+            self.executor,
+            partial(context.run, ContextVarEnvironment.run_in_scope, scope,
+                    func, *args, **kwargs))
+
+    def awaitable(self, func):
+        """ Return an async wrapper of the function """
+        async def wrapper(*args, **kwargs):
+            return await self.run(func, *args, **kwargs)
+
+        return wrapper
+
+    def get(self, namespace):
+        """ Return the asyncio facade of the model
+
+        :param namespace: namespace of the model
+        :rtype: ``AsyncModel``
+        """
+        return AsyncModel(self, self.registry.get(namespace))
+
+    async def commit(self, *args, **kwargs):
+        """ Commit the session of the task, with the pre and post commit
+        hooks """
+        return await self.run(self.registry.commit, *args, **kwargs)
+
+    async def close_session(self):
+        """ Rollback and remove the session of the task """
+        def close():
+            self.registry.rollback()
+            self.registry.Session.remove()
+
+        return await self.run(close)
+
+    def __getattr__(self, attribute):
+        value = getattr(self.registry, attribute)
+        namespace = get_async_namespace(self, value)
+        if namespace is not None:
+            return namespace
+
+        if callable(value):
+            return self.awaitable(value)
+
+        return value
+
+
+class AsyncNamespace:
+    """ Asyncio facade of an intermediate namespace of the registry """
+
+    def __init__(self, aregistry, namespace):
+        self.aregistry = aregistry
+        self.namespace = namespace
+
+    def __getattr__(self, attribute):
+        value = getattr(self.namespace, attribute)
+        namespace = get_async_namespace(self.aregistry, value)
+        if namespace is None:
+            raise AttributeError(attribute)
+
+        return namespace
+
+
+class AsyncModel:
+    """ Asyncio facade of a model, the methods of the model are awaitable
+    and ``query`` returns an ``AsyncQuery``::
+
+        Blok = aregistry.System.Blok
+        bloks = await Blok.query().filter(Blok.state == 'installed').all()
+    """
+
+    def __init__(self, aregistry, Model):
+        self.aregistry = aregistry
+        self.Model = Model
+
+    def query(self, *elements):
+        """ Return the asyncio facade of the query of the model
+
+        :rtype: ``AsyncQuery``
+        """
+        return AsyncQuery(self.aregistry, self.Model.query(*elements))
+
+    def __getattr__(self, attribute):
+        value = getattr(self.Model, attribute)
+        namespace = get_async_namespace(self.aregistry, value)
+        if namespace is not None:
+            return namespace
+
+        if callable(value) and not isinstance(value, type):
+            return self.aregistry.awaitable(value)
+
+        return value
+
+
+class AsyncQuery:
+    """ Asyncio facade of a query, the methods which build the query are
+    synchronous, the methods which execute it are awaitable::
+
+        query = Blok.query().filter_by(state='installed')
+        count = await query.count()
+        bloks = await query.dictall()
+    """
+
+    def __init__(self, aregistry, query):
+        self.aregistry = aregistry
+        self.query = query
+
+    def __getattr__(self, attribute):
+        value = getattr(self.query, attribute)
+        if attribute in QUERY_AWAITABLE_METHODS:
+            return self.aregistry.awaitable(value)
+
+        if not callable(value):
+            return value
+
+        def wrapper(*args, **kwargs):
+            res = value(*args, **kwargs)
+            if isinstance(res, Query):
+                return AsyncQuery(self.aregistry, res)
+
+            return res
+
+        return wrapper
+
+
+class AsyncSession:
+    """ Asyncio facade of the session of the current task, given by the
+    factory of ``registry.create_async_session_factory()``::
+
+        async_session = registry.create_async_session_factory()
+        async with async_session() as session:
+            Blok = registry.System.Blok
+            blok = await session.query(Blok).filter_by(
+                name='anyblok-core').one()
+            await session.commit()
+
+    The methods of the session are awaitable, ``query`` returns an
+    ``AsyncQuery``. At the exit of the ``async with`` block the session of
+    the task is rolled back and removed
+    """
+
+    def __init__(self, aregistry):
+        self.aregistry = aregistry
+
+    def query(self, *entities):
+        """ Return the asyncio facade of the query
+
+        :rtype: ``AsyncQuery``
+        """
+        return AsyncQuery(self.aregistry,
+                          self.aregistry.registry.query(*entities))
+
+    async def commit(self):
+        """ Commit the session of the task, with the pre and post commit
+        hooks """
+        return await self.aregistry.commit()
+
+    async def close(self):
+        """ Rollback and remove the session of the task """
+        return await self.aregistry.close_session()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def __getattr__(self, attribute):
+        Session = self.aregistry.registry.Session
+        value = getattr(Session(), attribute)
+        if not callable(value):
+            return value
+
+        def method(*args, **kwargs):
+            # the session of the task, found again in the executor
+            return getattr(Session(), attribute)(*args, **kwargs)
+
+        return self.aregistry.awaitable(method)
@@ -10,6 +10,8 @@ from pkg_resources import iter_entry_points
 from anyblok.imp import ImportManager
 from .logging import log
 from anyblok.environment import EnvironmentManager
+from anyblok.config import Configuration
+from anyblok.profiler import StartupProfiler, no_profile_phase
 from time import sleep
 from sys import modules
 from os.path import dirname
@@ -44,6 +46,7 @@ class BlokManager:
     entry_points = None
     ordered_bloks = []
     auto_install = []
+    startup_profiler = None
 
     @classmethod
     def list(cls):
@@ -146,13 +149,14 @@ class BlokManager:
     def blok_importers(cls, blok):
         EnvironmentManager.set('current_blok', blok)
 
-        if not ImportManager.has(blok):
-            # Import only if the blok doesn't exists, do not reload here
-            mod = ImportManager.add(blok)
-            mod.imports()
-        else:
-            mod = ImportManager.get(blok)
-            mod.reload()
+        with cls.profile_phase('BlokManager.load', blok=blok):
+            if not ImportManager.has(blok):
+                # Import only if the blok doesn't exists, do not reload here
+                mod = ImportManager.add(blok)
+                mod.imports()
+            else:
+                mod = ImportManager.get(blok)
+                mod.reload()
 
     @classmethod
     def get_needed_blok(cls, blok):
@@ -208,13 +212,29 @@ class BlokManager:
                 sleep(0.1)
 
         EnvironmentManager.set('current_blok', 'start')
+        cls.startup_profiler = None
+        if Configuration.get('profile_startup', False):
+            cls.startup_profiler = StartupProfiler()
+            cls.startup_profiler.start()
 
+        try:
+            cls.load_entry_points(entry_points)
+        finally:
+            EnvironmentManager.set('current_blok', None)
+            if cls.startup_profiler is not None:
+                cls.startup_profiler.stop()
+
+    @classmethod
+    def load_entry_points(cls, entry_points):
+        """Import the bloks of the entry points and order them"""
         bloks = []
         for entry_point in entry_points:
             count = 0
             for i in iter_entry_points(entry_point):
                 count += 1
-                blok = i.load()
+                with cls.profile_phase('BlokManager.load', blok=i.name):
+                    blok = i.load()
+
                 blok.required_by = []
                 blok.optional_by = []
                 blok.conditional_by = []
@@ -231,13 +251,19 @@ class BlokManager:
         cls.ordered_bloks = []
         bloks.sort()
 
-        try:
+        with cls.profile_phase('BlokManager.load'):
             while bloks:
                 blok = bloks.pop(0)[1]
                 cls.get_needed_blok(blok)
 
-        finally:
-            EnvironmentManager.set('current_blok', None)
+    @classmethod
+    def profile_phase(cls, name, blok=None):
+        """Return a context manager to measure a phase of the load, only
+        if the ``profile_startup`` option is filled"""
+        if cls.startup_profiler is None:
+            return no_profile_phase()
+
+        return cls.startup_profiler.phase(name, blok=blok)
 
     @classmethod
     def getPath(cls, blok):
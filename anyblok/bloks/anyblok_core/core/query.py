@@ -9,6 +9,8 @@ from anyblok import Declarations
 from anyblok.common import anyblok_column_prefix
 from sqlalchemy.orm import query
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.exc import OperationalError
+from anyblok.environment import EnvironmentManager
 from logging import getLogger
 
 
@@ -19,9 +21,46 @@ logger = getLogger(__name__)
 class Query(query.Query):
     """ Overload the SqlAlchemy Query
     """
+    use_replica = False
+
     def set_Model(self, Model):
         self.Model = Model.__registry_name__
 
+    def on_replica(self):
+        """Execute the query on a replica, if the ``db_replica_urls``
+        option is filled::
+
+            Model.query().on_replica().all()
+
+        :rtype: Query
+        """
+        query = self._clone()
+        query.use_replica = True
+        return query
+
+    def __iter__(self):
+        if not (self.use_replica or EnvironmentManager.get('on_replica')):
+            return super(Query, self).__iter__()
+
+        with self.registry.on_replica():
+            while True:
+                try:
+                    return super(Query, self).__iter__()
+                except OperationalError as exc:
+                    # the next replica, or the primary if no replica is
+                    # available, is used to execute the query again, only
+                    # if the replica can not be reached, the other errors
+                    # (timeout, cancellation, ...) are raised
+                    if self.session.replica_engine is None:
+                        raise
+
+                    if not (exc.connection_invalidated or
+                            exc.statement is None):
+                        raise
+
+                    self.registry.set_replica_unavailable(
+                        self.session.replica_engine)
+
     def one(self):
         """Overwrite sqlalchemy one() method to improve exception message
 
@@ -67,9 +106,30 @@ class Query(query.Query):
                      for x in field2get]
         return field2get
 
-    def dictone(self):
+    def with_to_dict_options(self, *fields):
+        """ Return the query with the loader options of ``to_dict(*fields)``
+        on the records, without the lazy loads of the relationships
+
+        :param fields: the fields of ``to_dict``
+        :rtype: Query
+        """
+        if self.get_field_names_in_column_description():
+            return self
+
+        Model = self.column_descriptions[0]['entity']
+        if not (isinstance(Model, type) and
+                hasattr(Model, 'get_to_dict_load_options')):
+            # aliased model or query without model
+            return self
+
+        return self.options(*Model.get_to_dict_load_options(*fields))
+
+    def dictone(self, *fields):
+        """ Return the dict of the record, ``fields`` are the fields of
+        ``to_dict``
+        """
         try:
-            val = self.one()
+            val = self.with_to_dict_options(*fields).one()
         except NoResultFound as exc:
             msg = str(exc).replace('one()', 'dictone()')
             raise exc.__class__(msg)
@@ -78,18 +138,28 @@ class Query(query.Query):
         if field2get:
             return {x: getattr(val, y) for x, y in field2get}
         else:
-            return val.to_dict()
+            return val.to_dict(*fields)
 
-    def dictfirst(self):
-        val = self.first()
+    def dictfirst(self, *fields):
+        """ Return the dict of the first record, ``fields`` are the fields
+        of ``to_dict``
+        """
+        val = self.with_to_dict_options(*fields).first()
         field2get = self.get_field_names_in_column_description()
         if field2get:
             return {x: getattr(val, y) for x, y in field2get}
         else:
-            return val.to_dict()
+            return val.to_dict(*fields)
+
+    def dictall(self, *fields):
+        """ Return the dicts of the records, ``fields`` are the fields of
+        ``to_dict``. The columns and the relationships in the fields are
+        loaded by a constant number of queries::
 
-    def dictall(self):
-        vals = self.all()
+            Order.query().dictall(
+                'id', ('lines', ('quantity', ('product', ('name',)))))
+        """
+        vals = self.with_to_dict_options(*fields).all()
         if not vals:
             return []
 
@@ -97,7 +167,7 @@ class Query(query.Query):
         if field2get:
             return [{x: getattr(y, z) for x, z in field2get} for y in vals]
         else:
-            return vals.to_dict()
+            return vals.to_dict(*fields)
 
     def get(self, primary_keys=None, **kwargs):
         if primary_keys is None:
@@ -6,7 +6,9 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from sqlalchemy.orm import Session as SA_Session
+from sqlalchemy.sql import Select
 from anyblok import Declarations
+from anyblok.environment import EnvironmentManager
 
 
 @Declarations.register(Declarations.Core)
@@ -16,4 +18,27 @@ class Session(SA_Session):
 
     def __init__(self, *args, **kwargs):
         kwargs['query_cls'] = self.registry_query
+        self.replica_engine = None
         super(Session, self).__init__(*args, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        """Return the engine of a replica for the select queries executed
+        on replica, else the bind of the session
+
+        The flushes and the queries with ``with_for_update`` always use the
+        bind of the session
+        """
+        self.replica_engine = None
+        if (
+            self.registry.replica_engines and
+            not self._flushing and
+            isinstance(clause, Select) and
+            clause._for_update_arg is None and
+            EnvironmentManager.get('on_replica')
+        ):
+            self.replica_engine = self.registry.get_replica_engine()
+            if self.replica_engine is not None:
+                return self.replica_engine
+
+        return super(Session, self).get_bind(
+            mapper=mapper, clause=clause, **kwargs)
@@ -7,19 +7,38 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from anyblok.declarations import Declarations, classmethod_cache
-from anyblok.field import FieldException
-from anyblok.column import Column
+from anyblok.field import Field, FieldException
+from anyblok.column import Column, DateTime
 from anyblok.mapper import FakeColumn, FakeRelationShip
 from anyblok.relationship import RelationShip, Many2Many
 from anyblok.common import anyblok_column_prefix
 from ..exceptions import SqlBaseException
-from sqlalchemy.orm import aliased, ColumnProperty, load_only
+from sqlalchemy.orm import (aliased, ColumnProperty, RelationshipProperty,
+                            Load, load_only)
 from sqlalchemy.sql.expression import true
-from sqlalchemy import or_, and_, inspect
+from sqlalchemy import (or_, and_, inspect, bindparam, select, tuple_,
+                        ColumnDefault)
 from sqlalchemy_utils.models import NO_VALUE, NOT_LOADED_REPR
 from sqlalchemy.orm.session import object_state
 
 
+MAX_PARAMETERS_BY_INSERT = {
+    'postgresql': 30000,
+    'mysql': 30000,
+    'mssql': 2000,
+    'sqlite': 999,
+}
+"""Number of parameters by ``INSERT`` query of the bulk insert, by dialect,
+below the limits of the databases (65535 with PostgreSQL and MySQL, 2100
+with MSSQL, 999 with the old versions of SQLite). The other dialects use
+the smallest limit"""
+
+MAX_ROWS_BY_INSERT = {
+    'mssql': 1000,
+}
+"""Number of entries by ``INSERT ... VALUES`` accepted by the databases"""
+
+
 class uniquedict(dict):
 
     def add_in_res(self, key, attrs):
@@ -159,6 +178,61 @@ class SqlMixin:
 
         return [getattr(cls, k) == v for k, v in pks.items()]
 
+    @classmethod
+    def get_where_clause_from_multi_primary_keys(cls, *pks):
+        """ return the where clause to find the objects from the list of
+        pks, ``IN`` on the primary key, or on the tuple of the primary keys
+
+        :param *pks: list of dict [{primary_key: value, ...}]
+        :rtype: where clause
+        :exception: SqlBaseException
+        """
+        _pks = cls.get_primary_keys()
+        for entry in pks:
+            for pk in _pks:
+                if pk not in entry:
+                    raise SqlBaseException("No primary key %s filled for %r" % (
+                        pk, cls.__registry_name__))
+
+        if len(_pks) == 1:
+            return getattr(cls, _pks[0]).in_([x[_pks[0]] for x in pks])
+
+        return tuple_(*[getattr(cls, x) for x in _pks]).in_(
+            [tuple(entry[x] for x in _pks) for entry in pks])
+
+    @classmethod
+    def _get_primary_key_names(cls):
+        """ Return the names of the primary keys in the order of the
+        identity of the instances """
+        mapper = cls.__mapper__
+        names = []
+        for column in mapper.primary_key:
+            name = mapper.get_property_by_column(column).key
+            if name.startswith(anyblok_column_prefix):
+                name = name[len(anyblok_column_prefix):]
+
+            names.append(name)
+
+        return names
+
+    @classmethod
+    def _coerce_primary_keys(cls, identity):
+        """ Return the values of the primary keys in the python types of
+        their columns, as in the identity of the instances, the values
+        which can not be converted are kept """
+        res = []
+        for column, value in zip(cls.__mapper__.primary_key, identity):
+            try:
+                python_type = column.type.python_type
+                if value is not None and not isinstance(value, python_type):
+                    value = python_type(value)
+            except (NotImplementedError, TypeError, ValueError):
+                pass
+
+            res.append(value)
+
+        return tuple(res)
+
     @classmethod
     def query_from_primary_keys(cls, **pks):
         """return a Query object in order to get object from primary keys.
@@ -176,16 +250,16 @@ class SqlMixin:
 
     @classmethod
     def from_primary_keys(cls, **pks):
-        """ return the instance of the model from the primary keys
+        """ return the instance of the model from the primary keys, the
+        instance of the session is returned without query
 
         :param **pks: dict {primary_key: value, ...}
         :rtype: instance of the model
         """
-        query = cls.query_from_primary_keys(**pks)
-        if query.count():
-            return query.first()
+        if sorted(pks) == sorted(cls._get_primary_key_names()):
+            return cls.load_from_multi_primary_keys(pks)[0]
 
-        return None
+        return cls.query_from_primary_keys(**pks).first()
 
     @classmethod
     def from_multi_primary_keys(cls, *pks):
@@ -194,20 +268,83 @@ class SqlMixin:
         :param *pks: list of dict [{primary_key: value, ...}]
         :rtype: instances of the model
         """
-        where_clause = []
-        for _pks in pks:
-            where_clause.append(cls.get_where_clause_from_primary_keys(**_pks))
-
-        if not where_clause:
+        if not pks:
             return []
 
-        where_clause = or_(*[and_(*x) for x in where_clause])
+        names = sorted(cls._get_primary_key_names())
+        if any(sorted(x) != names for x in pks):
+            where_clause = [cls.get_where_clause_from_primary_keys(**x)
+                            for x in pks]
+            return cls.query().filter(
+                or_(*[and_(*x) for x in where_clause])).all()
+
+        res = cls.registry.InstrumentedList()
+        found = set()
+        for instance in cls.load_from_multi_primary_keys(*pks):
+            if instance is not None and id(instance) not in found:
+                found.add(id(instance))
+                res.append(instance)
 
-        query = cls.query().filter(where_clause)
-        if query.count():
-            return query.all()
+        return res
+
+    @classmethod
+    def load_from_multi_primary_keys(cls, *pks, chunk_size=1000):
+        """ return the instances of the model from the primary keys, in the
+        order of the primary keys, None if the primary keys are not found::
+
+            Model.load_from_multi_primary_keys({'id': 1}, {'id': 2})
+            [<Model(id=1)>, None]
+
+        The instances of the session are taken from the identity map, the
+        others, and the expired or deleted instances of the session, are
+        loaded by chunk of ``chunk_size`` primary keys, one ``IN`` query by
+        chunk
+
+        :param *pks: list of dict [{primary_key: value, ...}]
+        :param chunk_size: number of primary keys by query
+        :rtype: list of instances of the model or None
+        :exception: SqlBaseException
+        """
+        mapper = cls.__mapper__
+        session = cls.registry.session
+        identity_map = session.identity_map
+        deleted = session.deleted
+        names = cls._get_primary_key_names()
+        instances = {}
+        identities = []
+        missing = []
+        for entry in pks:
+            for name in names:
+                if name not in entry:
+                    raise SqlBaseException("No primary key %s filled for %r" % (
+                        name, cls.__registry_name__))
+
+            identity = cls._coerce_primary_keys(entry[x] for x in names)
+            identities.append(identity)
+            if identity in instances:
+                continue
+
+            instance = identity_map.get(
+                mapper.identity_key_from_primary_key(identity))
+            # the row of an expired or deleted instance may not exist
+            if (
+                isinstance(instance, cls) and
+                not object_state(instance).expired and
+                instance not in deleted
+            ):
+                instances[identity] = instance
+            else:
+                instances[identity] = None
+                missing.append(dict(zip(names, identity)))
 
-        return []
+        for i in range(0, len(missing), chunk_size):
+            query = cls.query().filter(
+                cls.get_where_clause_from_multi_primary_keys(
+                    *missing[i:i + chunk_size]))
+            for instance in query.all():
+                instances[object_state(instance).identity] = instance
+
+        return [instances[x] for x in identities]
 
     def to_primary_keys(self):
         """ return the primary keys and values for this instance
@@ -267,7 +404,8 @@ class SqlMixin:
 
         return hybrid_property_columns
 
-    def _format_field(self, field):
+    @staticmethod
+    def _format_field(field):
         related_fields = None
         if isinstance(field, (tuple, list)):
             if len(field) == 1:
@@ -358,43 +496,126 @@ class SqlMixin:
              }
         """
         result = {}
-        cls = self.__class__
-        fields = fields if fields else cls.fields_description().keys()
+        for field, uselist, related_fields in self.get_to_dict_plan(*fields):
+            field_value = getattr(self, field)
+            if related_fields is None or field_value is None:
+                # column, field function (hybrid property) or empty
+                # relationship
+                result[field] = field_value
+            elif uselist:
+                # One2Many or Many2Many
+                result[field] = [r.to_dict(*related_fields)
+                                 for r in field_value]
+            else:
+                # One2One or Many2One
+                result[field] = field_value.to_dict(*related_fields)
+
+        return result
+
+    @classmethod
+    def get_to_dict_plan(cls, *fields):
+        """ Return the plan of ``to_dict(*fields)``, compiled once by model
+        and fields
+
+        :param fields: the fields of ``to_dict``
+        :rtype: tuple of (field name, uselist, related fields), the
+            related fields are None if the field is not a relationship
+        """
+        def freeze(field):
+            if isinstance(field, (tuple, list)):
+                return tuple(freeze(x) for x in field)
 
+            return field
+
+        return cls._get_to_dict_plan(*freeze(fields))
+
+    @classmethod_cache()
+    def _get_to_dict_plan(cls, *fields):
+        plan = []
+        fields = fields if fields else cls.fields_description().keys()
         for field in fields:
             # if field is ("relation_name", ("list", "of", "relation",
             # "fields")), deal with it.
-            field, related_fields = self._format_field(field)
-            # Get the actual data
-            field_value, field_property = getattr(self, field), None
+            field, related_fields = cls._format_field(field)
+            field_property = None
             try:
                 field_property = getattr(getattr(cls, field), 'property', None)
             except FieldException:
                 pass
 
-            # Deal with this data
-            if field_property is None:
-                # it is the case of field function (hyprid property)
-                result[field] = field_value
-            elif field_value is None or type(field_property) == ColumnProperty:
-                # If value is None, then do not go any further whatever
-                # the column property tells you.
-                result[field] = field_value
-            else:
-                # it is should be RelationshipProperty
+            if (
+                field_property is None or
+                type(field_property) == ColumnProperty
+            ):
+                # column or field function (hybrid property)
+                plan.append((field, False, None))
+                continue
+
+            # it is should be RelationshipProperty
+            if related_fields is None:
+                # If there is no field list to the relation,
+                # use only primary keys
+                related_fields = field_property.mapper.entity
+                related_fields = related_fields.get_primary_keys()
+
+            plan.append((field, field_property.uselist,
+                         tuple(related_fields)))
+
+        return tuple(plan)
+
+    @classmethod
+    def get_to_dict_load_options(cls, *fields):
+        """ Return the loader options of a query whose records are
+        transformed by ``to_dict(*fields)``. Only the columns in the fields
+        are loaded, and the relationships are loaded by one query for all
+        the records, recursively::
+
+            query = Model.query().options(
+                *Model.get_to_dict_load_options('name', ('lines', ())))
+            [x.to_dict('name', ('lines', ())) for x in query]
+
+        :param fields: the fields of ``to_dict``
+        :rtype: list of loader options
+        """
+        return cls._get_to_dict_load_options(fields, Load(cls))
+
+    @classmethod
+    def _get_to_dict_load_options(cls, fields, path):
+        mapper = cls.__mapper__
+        fields = fields if fields else cls.fields_description().keys()
+        # the columns of the polymorphic models are in several tables
+        only = not (mapper.inherits or mapper.polymorphic_on is not None)
+        columns = []
+        options = [path]
+        for field in fields:
+            field, related_fields = cls._format_field(field)
+            key = field
+            if key not in mapper.attrs:
+                key = anyblok_column_prefix + field
+
+            prop = mapper.attrs.get(key)
+            if isinstance(prop, ColumnProperty):
+                columns.append(key)
+            elif isinstance(prop, RelationshipProperty):
+                # the foreign keys of the record are needed to load the
+                # Many2One
+                columns.extend(mapper.get_property_by_column(column).key
+                               for column in prop.local_columns
+                               if column.table in mapper.tables)
+                Remote = prop.mapper.class_
                 if related_fields is None:
-                    # If there is no field list to the relation,
-                    # use only primary keys
-                    related_fields = field_property.mapper.entity
-                    related_fields = related_fields.get_primary_keys()
-                # One2One, One2Many, Many2One or Many2Many ?
-                if field_property.uselist:
-                    result[field] = [r.to_dict(*related_fields)
-                                     for r in field_value]
-                else:
-                    result[field] = field_value.to_dict(*related_fields)
+                    related_fields = Remote.get_primary_keys()
 
-        return result
+                options.extend(Remote._get_to_dict_load_options(
+                    related_fields, path.selectinload(key)))
+            else:
+                # a field function needs all the columns
+                only = False
+
+        if only and columns:
+            options.append(path.load_only(*columns))
+
+        return options
 
     @classmethod_cache()
     def getFieldType(cls, name):
@@ -637,20 +858,48 @@ class SqlBase(SqlMixin):
         return instance
 
     @classmethod
-    def multi_insert(cls, *args):
+    def multi_insert(cls, *args, returning=True, batch_size=1000):
         """ Insert in the table one or more entry of the model::
 
             MyModel.multi_insert([{...}, ...])
 
         the flush will be done only one time at the end of the insert
 
+        With ``returning=False`` the entries are inserted without the ORM,
+        by batch of ``batch_size`` entries in one ``INSERT ... VALUES``,
+        this mode is much faster to import a lot of entries::
+
+            MyModel.multi_insert(*rows, returning=False)
+            MyModel.multi_insert(*rows, returning=['id'])
+
+        The values are formatted by the ``setter_format_value`` of the
+        fields and the python defaults of the columns are applied, but the
+        entries do not go through the session, so:
+
+        * the ORM events (``before_insert``, ``after_insert``, the
+          ``*_orm_event`` methods and the mapper events) are not called
+        * only the columns are accepted, the relationships must be given
+          by their foreign keys
+        * the attributes of the related instances in the session are not
+          expired
+        * the polymorphic models with a parent model are forbidden
+
+        :param returning: True to return the instances, the names of the
+            columns to return them by entry, False to return the number
+            of entries
+        :param batch_size: number of entries by ``INSERT`` in the bulk mode
         :exception: SqlBaseException
         """
-        instances = cls.registry.InstrumentedList()
         for kwargs in args:
             if not isinstance(kwargs, dict):
                 raise SqlBaseException("multi_insert method wait list of dict")
 
+        if returning is not True:
+            return cls._multi_insert_without_orm(
+                args, returning or (), batch_size)
+
+        instances = cls.registry.InstrumentedList()
+        for kwargs in args:
             instance = cls(**kwargs)
             cls.registry.add(instance)
             instances.append(instance)
@@ -659,3 +908,378 @@ class SqlBase(SqlMixin):
             cls.registry.flush()
 
         return instances
+
+    @classmethod
+    def multi_update(cls, where, values):
+        """ Update the entries found by ``where`` in one ``UPDATE``::
+
+            MyModel.multi_update(MyModel.state == 'draft', {'state': 'done'})
+            MyModel.multi_update([{'id': 1}, {'id': 2}], {'state': 'done'})
+
+        The values are formatted by the ``setter_format_value`` of the
+        fields and the ``DateTime`` columns with ``auto_update`` are
+        updated. The instances of the session are synchronized: the
+        updated fields and the related attributes expired by their setters
+        are expired. The ``after_multi_update`` event is fired once with the
+        primary keys of the updated entries::
+
+            @listen('Model.MyModel', 'after_multi_update')
+            def my_event(cls, pks, values):
+                ...
+
+        The ORM events are not called
+
+        :param where: SQLAlchemy criterion or list of primary keys
+        :param values: dict {field name: value}
+        :rtype: number of updated entries
+        :exception: SqlBaseException
+        """
+        columns = cls._get_columns_without_orm()
+        values = dict(values)
+        for name, field in cls._get_auto_update_fields().items():
+            values.setdefault(name, field.get_auto_update_value())
+
+        query = cls.__table__.update().where(
+            cls._get_where_clause_without_orm(where)).values(
+                cls._format_values_without_orm(columns, values))
+        pks, instances = cls._execute_without_orm(query, where)
+        fields = list(values)
+        todos = cls.registry.expire_attributes.get(cls.__registry_name__, {})
+        todos = [todos[x] for x in fields if todos.get(x)]
+        for instance in instances:
+            # the related entries before the update, like the setters
+            for action_todos in todos:
+                Field.expire_related_attribute(instance, action_todos)
+
+            instance.expire(*fields)
+
+        if instances:
+            # the entries share the updated values, so the related entries
+            # after the update are the same for all of them
+            for action_todos in todos:
+                Field.expire_related_attribute(instances[0], action_todos)
+
+        cls.fire('after_multi_update', pks, values)
+        return len(pks)
+
+    @classmethod
+    def multi_delete(cls, where):
+        """ Delete the entries found by ``where`` in one ``DELETE``::
+
+            MyModel.multi_delete(MyModel.state == 'cancelled')
+            MyModel.multi_delete([{'id': 1}, {'id': 2}])
+
+        The deleted instances of the session are expunged, after the
+        expiration of the related attributes like ``delete``. The
+        ``after_multi_delete`` event is fired once with the primary keys of
+        the deleted entries::
+
+            @listen('Model.MyModel', 'after_multi_delete')
+            def my_event(cls, pks):
+                ...
+
+        The ORM events and the cascades of the relationships are not
+        called, only the ``ondelete`` of the foreign keys are applied by
+        the database
+
+        :param where: SQLAlchemy criterion or list of primary keys
+        :rtype: number of deleted entries
+        :exception: SqlBaseException
+        """
+        cls._get_columns_without_orm()
+        query = cls.__table__.delete().where(
+            cls._get_where_clause_without_orm(where))
+        pks, instances = cls._execute_without_orm(query, where)
+        if instances:
+            model = cls.registry.loaded_namespaces_first_step[
+                cls.__registry_name__]
+            mappers = cls.find_remote_attribute_to_expire(*model.keys())
+            for instance in instances:
+                instance.expire_relationship_mapped(mappers)
+                instance.expunge()
+
+        cls.fire('after_multi_delete', pks)
+        return len(pks)
+
+    @classmethod
+    def _get_where_clause_without_orm(cls, where):
+        """ Return the criterion, the list of primary keys is converted
+        in ``IN`` criterion """
+        if not isinstance(where, (list, tuple)):
+            return where
+
+        return cls.get_where_clause_from_multi_primary_keys(*where)
+
+    @classmethod
+    def _execute_without_orm(cls, query, where):
+        """ Execute the ``UPDATE`` or ``DELETE`` query, and return the
+        primary keys of the entries and the instances of the session
+        linked with them
+
+        :rtype: (list of dict {primary key: value}, list of instances)
+        """
+        pk_columns = list(cls.__mapper__.primary_key)
+        names = cls._get_primary_key_names()
+        # the instances of the session must be saved before
+        cls.registry.flush()
+        if cls.registry.bind.dialect.implicit_returning:
+            rows = cls.registry.execute(
+                query.returning(*pk_columns)).fetchall()
+        else:
+            rows = cls.registry.execute(
+                select(pk_columns).where(
+                    cls._get_where_clause_without_orm(where))).fetchall()
+            cls.registry.execute(query)
+
+        identities = {tuple(row) for row in rows}
+        instances = [
+            instance for instance in cls.registry.session.identity_map.values()
+            if isinstance(instance, cls) and (
+                object_state(instance).identity in identities)
+        ]
+        return [dict(zip(names, row)) for row in rows], instances
+
+    @classmethod
+    def _get_auto_update_fields(cls):
+        """ Return the ``DateTime`` columns with ``auto_update``
+
+        :rtype: dict {field name: field}
+        """
+        model = get_model_information(cls.registry, cls.__registry_name__)
+        return {name: model[name] for name in cls.loaded_columns
+                if isinstance(model.get(name), DateTime) and
+                model[name].auto_update}
+
+    @classmethod
+    def _get_columns_without_orm(cls):
+        """ Return the columns of the table by field name with the
+        ``setter_format_value`` of the field
+
+        :rtype: dict {field name: (column key, formatter)}
+        :exception: SqlBaseException
+        """
+        mapper = cls.__mapper__
+        if mapper.inherits is not None:
+            raise SqlBaseException(
+                "%r: the entries of a polymorphic model with a parent model "
+                "can not be written without the ORM" % cls.__registry_name__)
+
+        table = cls.__table__
+        fields = get_model_information(cls.registry, cls.__registry_name__)
+        columns = {}
+        for prop in mapper.column_attrs:
+            column = prop.columns[0]
+            if getattr(column, 'table', None) is not table:
+                continue
+
+            name = prop.key
+            if name.startswith(anyblok_column_prefix):
+                name = name[len(anyblok_column_prefix):]
+
+            formatter = None
+            field = fields.get(name)
+            if isinstance(field, Column) and (
+                type(field).setter_format_value is not Field.setter_format_value
+            ):
+                formatter = field.setter_format_value
+
+            columns[name] = (column.key, formatter)
+
+        return columns
+
+    @classmethod
+    def _get_python_defaults(cls):
+        """ Return the python defaults of the columns of the table
+
+        :rtype: list of (column key, ColumnDefault)
+        """
+        mapper = cls.__mapper__
+        defaults = [
+            (column.key, column.default) for column in cls.__table__.columns
+            if column.default is not None and (
+                column.default.is_scalar or column.default.is_callable)
+        ]
+        if mapper.polymorphic_identity is not None:
+            defaults.append(
+                (mapper.polymorphic_on.key, ColumnDefault(
+                    mapper.polymorphic_identity)))
+
+        return defaults
+
+    @classmethod
+    def _format_values_without_orm(cls, columns, kwargs):
+        """ Return the values by column key, formatted by the fields """
+        values = {}
+        for name, value in kwargs.items():
+            if name not in columns:
+                raise SqlBaseException(
+                    "%r: %r is not a column, only the columns can be "
+                    "written without the ORM" % (cls.__registry_name__, name))
+
+            key, formatter = columns[name]
+            values[key] = value if formatter is None else formatter(value)
+
+        return values
+
+    @classmethod
+    def _format_values_to_insert(cls, columns, defaults, kwargs):
+        """ Return the values of the entry by column key, formatted and
+        completed by the python defaults """
+        values = cls._format_values_without_orm(columns, kwargs)
+        for key, default in defaults:
+            if key not in values:
+                values[key] = (default.arg if default.is_scalar
+                               else default.arg(None))
+
+        return values
+
+    @classmethod
+    def _get_insert_query(cls, keys, size, returned_columns):
+        """ Return the ``INSERT`` query of ``size`` entries with bind
+        parameters and the names of the parameters by entry, the query and
+        its compiled form are kept by the registry to be compiled only one
+        time """
+        table = cls.__table__
+        query_key = (table.fullname, keys, size,
+                     tuple(x.key for x in returned_columns))
+        res = cls.registry.insert_queries.get(query_key)
+        if res is None:
+            names = [[(key, '%s_m%d' % (key, i)) for key in keys]
+                     for i in range(size)]
+            query = table.insert().values([
+                {key: bindparam(name, type_=table.c[key].type)
+                 for key, name in row_names}
+                for row_names in names
+            ])
+            if returned_columns:
+                query = query.returning(*returned_columns)
+
+            res = cls.registry.insert_queries[query_key] = (query, names)
+
+        return res
+
+    @classmethod
+    def _get_insert_batch_size(cls, dialect, keys, batch_size):
+        """ Return the number of entries by ``INSERT``, reduced to the
+        limits of the database """
+        if not dialect.supports_multivalues_insert:
+            return 1
+
+        max_parameters = MAX_PARAMETERS_BY_INSERT.get(
+            dialect.name, min(MAX_PARAMETERS_BY_INSERT.values()))
+        return max(1, min(batch_size,
+                          MAX_ROWS_BY_INSERT.get(dialect.name, batch_size),
+                          max_parameters // max(1, len(keys))))
+
+    @classmethod
+    def _get_queries_to_insert(cls, batches, batch_size, returned_columns):
+        """ Yield the ``INSERT`` queries, their parameters and their
+        entries by batch """
+        table = cls.__table__
+        dialect = cls.registry.bind.dialect
+        for keys, entries in batches.items():
+            size = cls._get_insert_batch_size(dialect, keys, batch_size)
+            for i in range(0, len(entries), size):
+                batch = entries[i:i + size]
+                if size == 1 or not keys:
+                    # one entry by query, without the multi-row VALUES:
+                    # only the server defaults, or a database which does
+                    # not accept them, the cursor gives the primary key
+                    query = table.insert()
+                    if returned_columns:
+                        query = query.returning(*returned_columns)
+
+                    for entry in batch:
+                        yield query, entry[1] or None, [entry]
+                elif len(batch) == size:
+                    query, names = cls._get_insert_query(
+                        keys, size, returned_columns)
+                    params = {}
+                    for (index, values), row_names in zip(batch, names):
+                        for key, name in row_names:
+                            params[name] = values[key]
+
+                    yield query, params, batch
+                else:
+                    query = table.insert().values([x[1] for x in batch])
+                    if returned_columns:
+                        query = query.returning(*returned_columns)
+
+                    yield query, None, batch
+
+    @classmethod
+    def _multi_insert_without_orm(cls, rows, returning, batch_size):
+        """ Insert the entries with ``INSERT ... VALUES`` by batch, the
+        entries with the same columns are inserted together """
+        columns = cls._get_columns_without_orm()
+        defaults = cls._get_python_defaults()
+        for name in returning:
+            if name not in columns:
+                raise SqlBaseException(
+                    "%r: %r is not a column" % (cls.__registry_name__, name))
+
+        batches = {}
+        for index, kwargs in enumerate(rows):
+            values = cls._format_values_to_insert(columns, defaults, kwargs)
+            batches.setdefault(tuple(sorted(values)), []).append(
+                (index, values))
+
+        # the entries may refer to the pending instances of the session
+        cls.registry.flush()
+        connection = cls.registry.session.connection().execution_options(
+            compiled_cache=cls.registry.insert_compiled_cache)
+        returned_columns = [cls.__table__.c[columns[x][0]] for x in returning]
+        if returning and not connection.dialect.implicit_returning:
+            # without RETURNING, the entries are inserted one by one to get
+            # their primary keys, and their columns are read after
+            return cls._multi_insert_without_returning(
+                connection, batches, len(rows), returning, returned_columns)
+
+        res = [None] * len(rows)
+        for query, params, entries in cls._get_queries_to_insert(
+            batches, batch_size, returned_columns
+        ):
+            result = connection.execute(query, params or {})
+            if returned_columns:
+                for (index, values), row in zip(entries, result.fetchall()):
+                    res[index] = dict(zip(returning, row))
+
+        if returning:
+            return res
+
+        return len(rows)
+
+    @classmethod
+    def _multi_insert_without_returning(cls, connection, batches, nb_rows,
+                                        returning, returned_columns):
+        """ Insert the entries one by one, with the databases which do not
+        accept ``RETURNING``, and read the returned columns by primary key
+        """
+        pks = [None] * nb_rows
+        for query, params, entries in cls._get_queries_to_insert(
+            batches, 1, []
+        ):
+            result = connection.execute(query, params or {})
+            pks[entries[0][0]] = tuple(result.inserted_primary_key)
+
+        pk_columns = list(cls.__table__.primary_key.columns)
+        if len(pk_columns) == 1:
+            where_clause = pk_columns[0].in_
+            values = [pk[0] for pk in pks]
+        else:
+            where_clause = tuple_(*pk_columns).in_
+            values = pks
+
+        # labelled, the primary keys are not merged with the returned columns
+        columns = [column.label('pk_%d' % index)
+                   for index, column in enumerate(pk_columns)]
+        nb_pks = len(columns)
+        rows = {}
+        size = 1000
+        for i in range(0, nb_rows, size):
+            query = select(columns + returned_columns).where(
+                where_clause(values[i:i + size]))
+            for row in connection.execute(query):
+                rows[tuple(row[:nb_pks])] = row[nb_pks:]
+
+        return [dict(zip(returning, rows[pk])) for pk in pks]
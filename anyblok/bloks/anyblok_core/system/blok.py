@@ -262,17 +262,20 @@ class Blok:
             return
 
         logger.info("Loading Blok %r", name)
-        blok_cls(self.registry).load()
+        with self.registry.profile_phase('System.Blok.load_all', blok=name):
+            blok_cls(self.registry).load()
+
         logger.debug("Succesfully loaded Blok %r", name)
 
     @classmethod
     def load_all(cls):
         """ Load all the installed bloks
         """
-        query = cls.query().filter(cls.state == 'installed')
-        bloks = query.order_by(cls.order).all()
-        if bloks:
-            bloks.load()
+        with cls.registry.profile_phase('System.Blok.load_all'):
+            query = cls.query().filter(cls.state == 'installed')
+            bloks = query.order_by(cls.order).all()
+            if bloks:
+                bloks.load()
 
     @classmethod_cache()
     def is_installed(cls, blok_name):
@@ -5,8 +5,19 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import socket
+from time import monotonic
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.exc import IntegrityError
+from anyblok.config import Configuration
 from anyblok.declarations import Declarations
-from anyblok.column import String, Integer
+from anyblok.environment import EnvironmentManager
+from anyblok.column import String, Integer, Text, DateTime
+from anyblok.common import get_cache_key, get_cache_stats, clear_caches
+from anyblok.notification import is_notification_available
 from ..exceptions import CacheException
 
 
@@ -23,6 +34,7 @@ class Cache:
     id = Integer(primary_key=True)
     registry_name = String(nullable=False)
     method = String(nullable=False)
+    key = Text()
 
     @classmethod
     def get_last_id(cls):
@@ -39,48 +51,184 @@ class Cache:
         """ Initialize the last_cache_id known
         """
         super(Cache, cls).initialize_model()
-        cls.last_cache_id = cls.get_last_id()
+        cls.set_last_cache_id(cls.get_last_id())
+        cls.save_watermark(force=True)
 
     @classmethod
-    def invalidate_all(cls):
-        res = []
-        for registry_name, methods in cls.registry.caches.items():
-            for method in methods.keys():
-                res.append(dict(registry_name=registry_name, method=method))
+    def get_last_cache_id(cls):
+        """ Return the last invalidation known, by database when the model
+        is shared by several databases
+        """
+        if cls.registry.template is not None:
+            return cls.registry.last_cache_id
 
-        if res:
-            cls.multi_insert(*res)
+        return cls.last_cache_id
 
-        cls.clear_invalidate_cache()
+    @classmethod
+    def set_last_cache_id(cls, last_cache_id):
+        """ Save the last invalidation known
+        """
+        if cls.registry.template is not None:
+            cls.registry.last_cache_id = last_cache_id
+        else:
+            cls.last_cache_id = last_cache_id
+
+    @classmethod
+    def get_pending_invalidations(cls):
+        """ Return the invalidations of the transaction, not saved yet, by
+        database: a thread which uses several registries saves them in the
+        right database
+
+        :rtype: dict {(registry_name, method, key): None}
+        """
+        pending = EnvironmentManager.get('_cache_invalidations')
+        if pending is None:
+            pending = {}
+            EnvironmentManager.set('_cache_invalidations', pending)
+
+        return pending.setdefault(cls.registry.db_name, {})
+
+    @classmethod
+    def add_invalidations(cls, caches):
+        """ Clear the local caches right away, and keep the invalidations
+        to save them once at precommit
+
+        :param caches: list of (registry_name, method, key)
+        """
+        clear_caches(cls.registry, caches)
+        pending = cls.get_pending_invalidations()
+        pending.update(dict.fromkeys(caches))
+        cls.registry.precommit_hook(cls.__registry_name__,
+                                    'flush_invalidations',
+                                    put_at_the_end_if_exist=True)
 
     @classmethod
-    def invalidate(cls, registry_name, method):
-        """ Call the invalidation for a specific method cached on a model
+    def flush_invalidations(cls):
+        """ Save the invalidations of the transaction in one insert and
+        send them to the other processes, called at precommit
+        """
+        pending = cls.get_pending_invalidations()
+        if not pending:
+            return
+
+        whole = {(registry_name, method)
+                 for registry_name, method, key in pending if key is None}
+        caches = [(registry_name, method, key)
+                  for registry_name, method, key in pending
+                  if key is None or (registry_name, method) not in whole]
+        pending.clear()
+        # the version of the transaction changes with its invalidations
+        cls.registry.session.info.pop('cache_backend_version', None)
+        # one multi-row insert, the instances are not needed
+        cls.registry.execute(cls.__table__.insert().values([
+            dict(registry_name=registry_name, method=method, key=key)
+            for registry_name, method, key in caches]))
+        if cls.registry.cache_listener is not None:
+            cls.registry.cache_listener.send(caches)
+
+        if cls.is_polling():
+            cls.clear_invalidate_cache()
+
+        if cls.registry.cache_backend is not None:
+            # the entries of the previous version are not read anymore
+            cls.registry.postcommit_hook(cls.__registry_name__,
+                                         'clear_cache_backend', caches)
+
+    @classmethod
+    def get_backend_version(cls):
+        """ Return the version of the entries of the backend shared by the
+        processes: the last invalidation saved in the table. An invalidation
+        committed after the read of the version changes the version of the
+        next readers, so the value computed before is not used anymore.
+        The version is read once by transaction
+
+        :rtype: int or None if the transaction has invalidations not saved
+            yet, the values computed with its writes must not be shared
+        """
+        if cls.get_pending_invalidations():
+            return None
+
+        session = cls.registry.session
+        transaction, version = session.info.get(
+            'cache_backend_version', (None, None))
+        if transaction is not session.transaction:
+            version = cls.set_backend_version(cls.get_last_id())
+
+        return version
+
+    @classmethod
+    def set_backend_version(cls, last_id):
+        """ Keep the last invalidation read by the transaction, as the
+        version of the entries of the backend shared by the processes
+
+        :param last_id: primary key of the last invalidation
+        :rtype: int, the last invalidation
+        """
+        session = cls.registry.session
+        session.info['cache_backend_version'] = (session.transaction, last_id)
+        return last_id
+
+    @classmethod
+    def clear_cache_backend(cls, caches):
+        """ Remove the invalidated entries from the backend shared by the
+        processes, called at postcommit by the process which invalidates
+
+        :param caches: list of (registry_name, method, key)
+        """
+        db_name = cls.registry.db_name
+        for registry_name, method, key in caches:
+            cls.registry.cache_backend.invalidate(db_name, registry_name,
+                                                  method, key)
+
+    @classmethod
+    def invalidate_all(cls):
+        """ Invalidate all the methods cached, the local caches are cleared
+        right away, the invalidations are saved at precommit
+        """
+        cls.add_invalidations([
+            (registry_name, method, None)
+            for registry_name, methods in cls.registry.caches.items()
+            for method in methods.keys()])
+
+    @classmethod
+    def invalidate(cls, registry_name, method, *args, **kwargs):
+        """ Call the invalidation for a specific method cached on a model,
+        only the entries of the arguments are invalidated if they are
+        given. The local caches are cleared right away, the invalidations
+        of the transaction are deduplicated and saved in one insert at
+        precommit::
+
+            Cache.invalidate('Model.System.Blok', 'is_installed')
+            Cache.invalidate('Model.System.Blok', 'is_installed',
+                             'anyblok-core')
 
         :param registry_name: namespace of the model
         :param method: name of the method on the model
+        :param args: arguments of the method, without the instance or the
+            class
+        :param kwargs: named arguments of the method
         :exception: CacheException
         """
         caches = cls.registry.caches
+        try:
+            key = get_cache_key(args, kwargs) if args or kwargs else None
+        except TypeError:
+            raise CacheException(
+                "The arguments of the invalidation of %s.%s must be JSON "
+                "serializable: %r, %r" % (registry_name, method, args, kwargs))
 
-        def insert(registry_name=None, method=None):
-            if registry_name in caches:
-                if method in caches[registry_name]:
-                    cls.insert(registry_name=registry_name, method=method)
-                else:
-                    raise CacheException(
-                        "Unknown cached method %r" % method)
-            else:
-                raise CacheException(
-                    "Unknown cached model %r" % registry_name)
+        if hasattr(registry_name, '__registry_name__'):
+            registry_name = registry_name.__registry_name__
+
+        if registry_name not in caches:
+            raise CacheException(
+                "Unknown cached model %r" % registry_name)
 
-        if isinstance(registry_name, str):
-            insert(registry_name=registry_name, method=method)
-        elif hasattr(registry_name, '__registry_name__'):
-            insert(registry_name=registry_name.__registry_name__,
-                   method=method)
+        if method not in caches[registry_name]:
+            raise CacheException(
+                "Unknown cached method %r" % method)
 
-        cls.clear_invalidate_cache()
+        cls.add_invalidations([(registry_name, method, key)])
 
     @classmethod
     def detect_invalidation(cls):
@@ -88,27 +236,255 @@ class Cache:
 
         :rtype: Boolean
         """
-        if cls.last_cache_id is None:
-            cls.last_cache_id = 0
-        return cls.last_cache_id < cls.get_last_id()
+        last_cache_id = cls.get_last_cache_id()
+        if last_cache_id is None:
+            last_cache_id = 0
+            cls.set_last_cache_id(last_cache_id)
+
+        return last_cache_id < cls.set_backend_version(cls.get_last_id())
 
     @classmethod
-    def get_invalidation(cls):
-        """ Return the pointer of the method to invalidate
+    def get_invalidations(cls):
+        """ Return the pointer of the method to invalidate with the key of
+        the entries to invalidate, None to invalidate all the entries
+
+        :rtype: list of (cache, key)
         """
         res = []
         if cls.detect_invalidation():
             caches = cls.registry.caches
-            for i in cls.query().filter(cls.id > cls.last_cache_id).all():
-                res.extend(caches[i.registry_name][i.method])
+            query = cls.query().filter(cls.id > cls.get_last_cache_id())
+            for i in query.all():
+                res.extend((cache, i.key)
+                           for cache in caches[i.registry_name][i.method])
 
-            cls.last_cache_id = cls.get_last_id()
+            cls.set_last_cache_id(cls.get_last_id())
+            cls.save_watermark()
 
         return res
 
+    @classmethod
+    def get_invalidation(cls):
+        """ Return the pointer of the method to invalidate
+        """
+        return [cache for cache, key in cls.get_invalidations()]
+
     @classmethod
     def clear_invalidate_cache(cls):
         """ Invalidate the cache that needs to be invalidated
         """
-        for cache in cls.get_invalidation():
-            cache.cache_clear()
+        for cache, key in cls.get_invalidations():
+            if key is None:
+                cache.cache_invalidate_all()
+            else:
+                cache.cache_invalidate_key(key)
+
+    @classmethod
+    def stats(cls, registry_name=None, method=None):
+        """ Return the counters of the cached methods of this process::
+
+            Cache.stats()
+            {'Model.System.Blok': {'is_installed': {
+                'hits': 10, 'misses': 2, 'maxsize': 128, 'currsize': 2,
+                'evictions': 0, 'expirations': 0, 'invalidations': 0,
+                'time_saved': 0.02}}}
+
+        The counters of the caches of the same method, on the models which
+        inherit it, are added
+
+        :param registry_name: namespace of the model, all the models if None
+        :param method: name of the method, all the methods if None
+        :rtype: dict {registry_name: {method: counters}}
+        """
+        res = {}
+        if hasattr(registry_name, '__registry_name__'):
+            registry_name = registry_name.__registry_name__
+
+        for namespace, methods in cls.registry.caches.items():
+            if registry_name is not None and namespace != registry_name:
+                continue
+
+            for name, caches in methods.items():
+                if method is not None and name != method:
+                    continue
+
+                if caches:
+                    res.setdefault(namespace, {})[name] = get_cache_stats(
+                        caches)._asdict()
+
+        return res
+
+    @classmethod
+    def reset_stats(cls):
+        """ Reset the counters of all the cached methods of this process
+        """
+        for methods in cls.registry.caches.values():
+            for caches in methods.values():
+                for cache in caches:
+                    with cache.lock:
+                        cache.reset_stats()
+
+    @classmethod
+    def is_polling(cls):
+        """ Return True if the invalidations are found by polling the table,
+        False if they are notified. The table is polled while the listener
+        of the notifications is not connected
+
+        :rtype: Boolean
+        """
+        if cls.registry.cache_listener is not None:
+            return not cls.registry.cache_listener.connected
+
+        return not (Configuration.get('cache_invalidation_notify', False) and
+                    is_notification_available(cls.registry.engine))
+
+    @classmethod
+    def save_watermark(cls, force=False):
+        """ Save the last invalidation known by this process, the rows under
+        the watermarks of all the processes can be removed by ``compact``
+
+        The detections of the invalidations are batched: the watermark is
+        saved at most once by ``cache_watermark_interval`` seconds, with the
+        last invalidation known. A watermark late is safe, ``compact`` only
+        removes the rows under it
+
+        :param force: if True, save the watermark now
+        """
+        last_cache_id = cls.get_last_cache_id()
+        if last_cache_id is None or not cls.is_polling():
+            return
+
+        now = monotonic()
+        saved = cls.registry.cache_watermark
+        if not force and saved is not None:
+            interval = Configuration.get('cache_watermark_interval', 60)
+            if saved[0] == last_cache_id or now - saved[1] < interval:
+                return
+
+        cls.registry.System.CacheWatermark.set(last_cache_id)
+        cls.registry.cache_watermark = (last_cache_id, now)
+
+    @classmethod
+    def compact(cls, timeout=None):
+        """ Remove the invalidations known by all the processes which poll
+        the table, the last one is kept::
+
+            registry.System.Cache.compact()
+            registry.commit()
+
+        The watermark of a process which was not saved since ``timeout``
+        seconds is removed, the process is considered as stopped
+
+        :param timeout: number of seconds, by default the
+            ``cache_watermark_timeout`` option
+        :rtype: int, number of removed invalidations
+        """
+        if timeout is None:
+            timeout = Configuration.get('cache_watermark_timeout', 86400)
+
+        Watermark = cls.registry.System.CacheWatermark
+        cls.save_watermark(force=True)
+        Watermark.remove_expired(timeout)
+        watermark = Watermark.query(
+            func.min(Watermark.last_cache_id)).scalar()
+        query = cls.query().filter(cls.id < cls.get_last_id())
+        if watermark is not None:
+            query = query.filter(cls.id <= watermark)
+
+        return query.delete(synchronize_session=False)
+
+
+@register(System)
+class CacheWatermark:
+    """ Last invalidation of ``System.Cache`` known by each process which
+    polls the table
+    """
+
+    reader = String(primary_key=True)
+    last_cache_id = Integer(nullable=False)
+    update_date = DateTime(nullable=False)
+
+    @classmethod
+    def has_table(cls, connection):
+        """ Return True if the table exists, the registry may be loaded
+        without migration. The table is checked once by registry, only
+        checked again while it is not found (created by a transaction not
+        committed yet)
+
+        :param connection: SQLAlchemy connection of the upsert
+        :rtype: Boolean
+        """
+        if not cls.registry.cache_watermark_table:
+            table = cls.__table__
+            cls.registry.cache_watermark_table = connection.dialect.has_table(
+                connection, table.name, schema=table.schema)
+
+        return cls.registry.cache_watermark_table
+
+    @classmethod
+    def get_reader_name(cls):
+        """ Return the name of the process
+
+        :rtype: str
+        """
+        return '%s:%d' % (socket.gethostname(), os.getpid())
+
+    @classmethod
+    def set(cls, last_cache_id):
+        """ Save the last invalidation known by this process, in a short
+        transaction of its own, so the row of the process is not locked
+        until the end of the transaction of the caller
+
+        :param last_cache_id: primary key of ``System.Cache``
+        """
+        values = dict(reader=cls.get_reader_name(),
+                      last_cache_id=last_cache_id,
+                      update_date=datetime.now(timezone.utc))
+        if cls.registry.unittest:
+            # the registry of the unittest has only one connection, in the
+            # transaction of the test
+            cls.upsert(cls.registry.connection(), values)
+        else:
+            with cls.registry.engine.begin() as connection:
+                cls.upsert(connection, values)
+
+    @classmethod
+    def upsert(cls, connection, values):
+        """ Insert or update the watermark of the process, nothing is saved
+        if the table does not exist yet
+
+        :param connection: SQLAlchemy connection
+        :param values: dict of the values of the columns
+        """
+        if not cls.has_table(connection):
+            return
+
+        table = cls.__table__
+        dialect = connection.dialect
+        where = table.c.reader == values['reader']
+        update = {x: y for x, y in values.items() if x != 'reader'}
+        if dialect.name == 'postgresql':
+            query = postgresql.insert(table).values(**values)
+            connection.execute(query.on_conflict_do_update(
+                index_elements=[table.c.reader], set_=update))
+        elif dialect.name == 'mysql':
+            query = mysql.insert(table).values(**values)
+            connection.execute(query.on_duplicate_key_update(**update))
+        elif not connection.execute(
+                table.update().where(where).values(**update)).rowcount:
+            try:
+                connection.execute(table.insert().values(**values))
+            except IntegrityError:
+                # another thread of the process inserted the row
+                connection.execute(
+                    table.update().where(where).values(**update))
+
+    @classmethod
+    def remove_expired(cls, timeout):
+        """ Remove the watermarks not saved since ``timeout`` seconds
+
+        :param timeout: number of seconds
+        """
+        limit = datetime.now(timezone.utc) - timedelta(seconds=timeout)
+        cls.query().filter(cls.update_date < limit).delete(
+            synchronize_session=False)
@@ -47,11 +47,15 @@ class Column(System.Field):
     def add_field(cls, cname, column, model, table, ftype):
         """ Insert a column definition
 
+        The insert is flushed with the other fields of the model by
+        ``System.Model``
+
         :param cname: name of the column
         :param column: instance of the column
         :param model: namespace of the model
         :param table: name of the table of the model
         :param ftype: type of the AnyBlok Field
+        :rtype: list of the added instances
         """
         Model = cls.registry.get(model)
         if hasattr(Model, anyblok_column_prefix + cname):
@@ -76,7 +80,9 @@ class Column(System.Field):
                     ftype=ftype,
                     remote_model=c.info.get('remote_model'),
                     unique=c.unique)
-        cls.insert(**vals)
+        field = cls(**vals)
+        cls.registry.add(field)
+        return [field]
 
     @classmethod
     def alter_field(cls, column, meta_column, ftype):
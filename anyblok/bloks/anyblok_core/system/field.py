@@ -72,14 +72,20 @@ class Field:
     def add_field(cls, rname, label, model, table, ftype):
         """ Insert a field definition
 
+        The insert is flushed with the other fields of the model by
+        ``System.Model``
+
         :param rname: name of the field
         :param label: label of the field
         :param model: namespace of the model
         :param table: name of the table of the model
         :param ftype: type of the AnyBlok Field
+        :rtype: list of the added instances
         """
-        cls.insert(code=table + '.' + rname, model=model, name=rname,
-                   label=label, ftype=ftype)
+        field = cls(code=table + '.' + rname, model=model, name=rname,
+                    label=label, ftype=ftype)
+        cls.registry.add(field)
+        return [field]
 
     @classmethod
     def alter_field(cls, field, label, ftype):
@@ -53,6 +53,15 @@ class Model:
             model, 'find_relationship')
         cls.registry.System.Cache.invalidate(
             model, 'get_hybrid_property_columns')
+        cls.registry.System.Cache.invalidate(model, '_get_to_dict_plan')
+
+    @classmethod
+    def save_registry_snapshot(cls):
+        """ Postcommit hook, save the snapshot of the registry once the
+        System models are commited
+        """
+        if cls.registry.snapshot is not None:
+            cls.registry.snapshot.save()
 
     @classmethod
     def get_field_model(cls, field):
@@ -76,59 +85,135 @@ class Model:
         return field, Field
 
     @classmethod
-    def update_fields(cls, model, table):
-        fsp = cls.registry.loaded_namespaces_first_step
-        m = cls.registry.get(model)
-        # remove useless column
+    def get_existing_fields(cls, *models):
+        """ Return the existing fields of the models, loaded in one query
+
+        :param models: namespaces of the models, all the models if empty
+        :rtype: dict {model: {name: instance of System.Field}}
+        """
         Field = cls.registry.System.Field
-        query = Field.query()
-        query = query.filter(Field.model == model)
-        query = query.filter(Field.name.notin_(m.loaded_columns))
-        for model_ in query.all():
-            if model_.entity_type == 'Model.System.RelationShip':
-                if model_.remote:
+        query = Field.query().with_polymorphic('*')
+        if models:
+            query = query.filter(Field.model.in_(models))
+
+        fields = {}
+        for field in query.all():
+            fields.setdefault(field.model, {})[field.name] = field
+
+        return fields
+
+    @classmethod
+    def add_new_fields(cls, fields, instances):
+        """ Add the fields waiting for the flush in the existing fields
+
+        :param fields: existing fields, see ``get_existing_fields``
+        :param instances: the fields returned by ``add_field``
+        """
+        for instance in instances:
+            fields.setdefault(instance.model, {})[instance.name] = instance
+
+    @classmethod
+    def remove_fields(cls, model, fields, keep):
+        """ Remove the fields of the model which are not in keep, and the
+        remote relationships linked with them
+
+        :param model: namespace of the model
+        :param fields: existing fields, see ``get_existing_fields``
+        :param keep: names of the fields to keep
+        """
+        existing = fields.get(model, {})
+        for name, field in list(existing.items()):
+            if name in keep:
+                continue
+
+            if field.entity_type == 'Model.System.RelationShip':
+                if field.remote:
                     continue
 
-                RelationShip = cls.registry.System.RelationShip
-                Q = RelationShip.query()
-                Q = Q.filter(RelationShip.name == model_.remote_name)
-                Q = Q.filter(RelationShip.model == model_.remote_model)
-                Q.delete()
+                remote = fields.get(field.remote_model, {}).pop(
+                    field.remote_name, None)
+                if remote is not None:
+                    remote.delete(flush=False)
+                else:
+                    RelationShip = cls.registry.System.RelationShip
+                    Q = RelationShip.query()
+                    Q = Q.filter(RelationShip.name == field.remote_name)
+                    Q = Q.filter(RelationShip.model == field.remote_model)
+                    Q.delete()
+
+            del existing[name]
+            field.delete(flush=False)
 
-            model_.delete()
+    @classmethod
+    def update_fields(cls, model, table, fields=None):
+        """ Remove, update or add the fields of the model, the changes are
+        flushed in one batch
+
+        :param model: namespace of the model
+        :param table: name of the table of the model
+        :param fields: existing fields, see ``get_existing_fields``, they
+            are loaded if not given
+        """
+        fsp = cls.registry.loaded_namespaces_first_step
+        m = cls.registry.get(model)
+        if fields is None:
+            fields = cls.get_existing_fields(model)
+
+        # remove useless column
+        cls.remove_fields(model, fields, m.loaded_columns)
 
         # add or update new column
         for cname in m.loaded_columns:
             ftype = fsp[model][cname].__class__.__name__
             field, Field = cls.get_field(m, cname)
             cname = Field.get_cname(field, cname)
-            query = Field.query()
-            query = query.filter(Field.model == model)
-            query = query.filter(Field.name == cname)
-            if query.count():
-                Field.alter_field(query.first(), field, ftype)
+            existing = fields.get(model, {})
+            if cname in existing:
+                Field.alter_field(existing[cname], field, ftype)
             else:
-                Field.add_field(cname, field, model, table, ftype)
+                cls.add_new_fields(
+                    fields, Field.add_field(cname, field, model, table, ftype))
+
+        cls.registry.flush()
 
     @classmethod
-    def add_fields(cls, model, table):
+    def add_fields(cls, model, table, fields=None):
+        """ Add the model and its fields, the fields are flushed in one batch
+
+        :param model: namespace of the model
+        :param table: name of the table of the model
+        :param fields: existing fields, see ``get_existing_fields``
+        """
         fsp = cls.registry.loaded_namespaces_first_step
         m = cls.registry.get(model)
         is_sql_model = len(m.loaded_columns) > 0
         cls.insert(name=model, table=table, schema=m.__db_schema__,
                    is_sql_model=is_sql_model)
+        instances = []
         for cname in m.loaded_columns:
             field, Field = cls.get_field(m, cname)
             cname = Field.get_cname(field, cname)
             ftype = fsp[model][cname].__class__.__name__
-            Field.add_field(cname, field, model, table, ftype)
+            instances.extend(
+                Field.add_field(cname, field, model, table, ftype))
+
+        if fields is not None:
+            cls.add_new_fields(fields, instances)
+
+        cls.registry.flush()
 
     @classmethod
     def update_list(cls):
         """ Insert and update the table of models
 
+        The existing models and fields are loaded in two queries, compared
+        with the assembled models, then the changes are flushed in one batch
+        by model
+
         :exception: Exception
         """
+        models = {x.name: x for x in cls.query().all()}
+        fields = cls.get_existing_fields()
         for model in cls.registry.loaded_namespaces.keys():
             try:
                 # TODO need refactor, then try except pass whenever refactor
@@ -138,11 +223,10 @@ class Model:
                 if hasattr(m, '__tablename__'):
                     table = m.__tablename__
 
-                _m = cls.query('name').filter(cls.name == model)
-                if _m.count():
-                    cls.update_fields(model, table)
+                if model in models:
+                    cls.update_fields(model, table, fields=fields)
                 else:
-                    cls.add_fields(model, table)
+                    cls.add_fields(model, table, fields=fields)
 
                 if m.loaded_columns:
                     cls.fire('Update Model', model)
@@ -151,13 +235,13 @@ class Model:
                 logger.exception(str(e))
 
         # remove model and field which are not in loaded_namespaces
-        query = cls.query()
-        query = query.filter(
-            cls.name.notin_(cls.registry.loaded_namespaces.keys()))
-        Field = cls.registry.System.Field
-        for model_ in query.all():
-            Q = Field.query().filter(Field.model == model_.name)
-            for field in Q.all():
-                field.delete()
+        for name, model_ in models.items():
+            if name in cls.registry.loaded_namespaces:
+                continue
+
+            for field in fields.pop(name, {}).values():
+                field.delete(flush=False)
+
+            model_.delete(flush=False)
 
-            model_.delete()
+        cls.registry.flush()
@@ -51,11 +51,15 @@ class RelationShip(System.Field):
     def add_field(cls, rname, relation, model, table, ftype):
         """ Insert a relationship definition
 
+        The insert is flushed with the other fields of the model by
+        ``System.Model``
+
         :param rname: name of the relationship
         :param relation: instance of the relationship
         :param model: namespace of the model
         :param table: name of the table of the model
         :param ftype: type of the AnyBlok Field
+        :rtype: list of the added instances, with the remote relationship
         """
         local_columns = ','.join(relation.info.get('local_columns', []))
         remote_columns = ','.join(relation.info.get('remote_columns', []))
@@ -69,7 +73,8 @@ class RelationShip(System.Field):
                     remote_model=remote_model, remote_name=remote_name,
                     remote_columns=remote_columns, label=label,
                     nullable=nullable, ftype=ftype)
-        cls.insert(**vals)
+        fields = [cls(**vals)]
+        cls.registry.add(fields[0])
 
         if remote_name:
             remote_type = "Many2One"
@@ -88,7 +93,10 @@ class RelationShip(System.Field):
                         remote_columns=local_columns,
                         label=remote_name.capitalize().replace('_', ' '),
                         nullable=True, ftype=remote_type, remote=True)
-            cls.insert(**vals)
+            fields.append(cls(**vals))
+            cls.registry.add(fields[1])
+
+        return fields
 
     @classmethod
     def alter_field(cls, field, field_, ftype):
@@ -47,6 +47,17 @@ class TestCoreSqlBase:
                                            name=column.name)
         assert column == column2
 
+    def test_load_from_multi_primary_keys(self, rollback_registry):
+        registry = rollback_registry
+        Column = registry.System.Column
+        columns = Column.query().order_by(Column.name).limit(3).all()
+        pks = [x.to_primary_keys() for x in reversed(columns)]
+        pks.insert(1, dict(model='Model.System.Unknown', name='unknown'))
+        registry.expunge_all()
+        res = Column.load_from_multi_primary_keys(*pks, chunk_size=2)
+        assert [x and x.to_primary_keys() for x in res] == [
+            pks[0], None, pks[2], pks[3]]
+
     def test_get_primary_key(self, rollback_registry):
         registry = rollback_registry
         assert registry.System.Model.get_primary_keys() == ['name']
@@ -1,12 +1,86 @@
 # This file is a part of the AnyBlok project
 #
 #    Copyright (C) 2014 Jean-Sebastien SUZANNE <jssuzanne@anybox.fr>
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
 #
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
-from anyblok.tests.testcase import BlokTestCase
+import pytest
+from sqlalchemy import event
 
 
-class TestSystemModel(BlokTestCase):
-    pass
+@pytest.mark.usefixtures('rollback_registry')
+class TestSystemModel:
+
+    def test_get_existing_fields(self, rollback_registry):
+        registry = rollback_registry
+        Model = registry.System.Model
+        fields = Model.get_existing_fields('Model.System.Blok')
+        assert list(fields.keys()) == ['Model.System.Blok']
+        assert isinstance(fields['Model.System.Blok']['name'],
+                          registry.System.Column)
+
+    def test_update_list_loads_the_fields_once(self, rollback_registry):
+        registry = rollback_registry
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(registry.bind, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            registry.System.Model.update_list()
+        finally:
+            event.remove(registry.bind, 'before_cursor_execute',
+                         before_cursor_execute)
+
+        selects = [x for x in statements
+                   if x.startswith('SELECT') and 'FROM system_field' in x]
+        assert len(selects) == 1
+        assert not [x for x in statements
+                    if x.startswith('INSERT INTO system_field')]
+
+    def test_update_list_adds_the_missing_field(self, rollback_registry):
+        registry = rollback_registry
+        Column = registry.System.Column
+        Column.query().filter_by(
+            model='Model.System.Blok', name='author').one().delete()
+        registry.System.Model.update_list()
+        column = Column.query().filter_by(
+            model='Model.System.Blok', name='author').one()
+        assert column.ftype == 'String'
+
+    def test_update_list_updates_the_field(self, rollback_registry):
+        registry = rollback_registry
+        Column = registry.System.Column
+        column = Column.query().filter_by(
+            model='Model.System.Blok', name='author').one()
+        column.ftype = 'Integer'
+        registry.flush()
+        registry.System.Model.update_list()
+        registry.expire(column)
+        assert column.ftype == 'String'
+
+    def test_update_list_removes_the_unexisting_field(self,
+                                                      rollback_registry):
+        registry = rollback_registry
+        Field = registry.System.Field
+        Field.insert(model='Model.System.Blok', name='unexisting',
+                     label='Unexisting', ftype='String')
+        registry.System.Model.update_list()
+        assert not Field.query().filter_by(
+            model='Model.System.Blok', name='unexisting').count()
+
+    def test_update_list_removes_the_unexisting_model(self,
+                                                      rollback_registry):
+        registry = rollback_registry
+        Model = registry.System.Model
+        Field = registry.System.Field
+        Model.insert(name='Model.Unexisting', table='unexisting')
+        Field.insert(model='Model.Unexisting', name='name', label='Name',
+                     ftype='String')
+        Model.update_list()
+        assert not Model.query().filter_by(name='Model.Unexisting').count()
+        assert not Field.query().filter_by(model='Model.Unexisting').count()
@@ -24,6 +24,16 @@ class TestSystemSequence:
         assert seq.nextval() == '3'
         assert seq.current == 3
 
+    def test_multi_insert_without_orm(self, rollback_registry):
+        registry = rollback_registry
+        Sequence = registry.System.Sequence
+        res = Sequence.multi_insert(
+            {'code': 'test.sequence'}, {'code': 'test.sequence2'},
+            returning=['id'])
+        seq = Sequence.query().get(res[1]['id'])
+        assert seq.code == 'test.sequence2'
+        assert seq.nextval() == '1'
+
     def test_nextval_with_start_value(self, rollback_registry):
         registry = rollback_registry
         Sequence = registry.System.Sequence
@@ -0,0 +1,164 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import os
+import pickle
+import sqlite3
+from logging import getLogger
+from threading import local
+from time import time
+
+logger = getLogger(__name__)
+
+
+class CacheBackend:
+    """ Store of the cached classmethods shared by the processes, the
+    entries are keyed by database, namespace, method and the key of the
+    arguments returned by ``anyblok.common.get_cache_key``
+
+    The in-process cache of ``MethodCache`` is still used first, the
+    backend is read on the local misses. The backend to use is defined by
+    ``Configuration.set('CacheBackend', MyBackend)``
+
+    The entries are versioned, an entry is found only with the version it
+    was saved with. ``MethodCache`` uses the last invalidation of the
+    ``System.Cache`` table, so the entries saved before an invalidation are
+    not used anymore, even by the processes of the other hosts
+    """
+
+    def get(self, db_name, namespace, method, key, version=None):
+        """ Return the cached value
+
+        :param version: version of the entry
+        :rtype: tuple (found, value)
+        """
+        raise NotImplementedError
+
+    def set(self, db_name, namespace, method, key, value, ttl=None,
+            version=None):
+        """ Save the value
+
+        :param ttl: number of seconds before the expiry of the entry
+        :param version: version of the entry
+        """
+        raise NotImplementedError
+
+    def invalidate(self, db_name, namespace, method, key=None):
+        """ Remove the entries of the key, all the entries of the method
+        if the key is None """
+        raise NotImplementedError
+
+    def clear(self, db_name=None):
+        """ Remove all the entries of the database, all the entries if
+        the database is None """
+        raise NotImplementedError
+
+    def close(self):
+        """ Release the resources of the process """
+
+
+class FileCacheBackend(CacheBackend):
+    """ Backend saved in a SQLite file shared by the processes of the host,
+    the file is memory-mapped and written in WAL mode, the readers do not
+    wait for the writers::
+
+        backend = FileCacheBackend('/dev/shm/anyblok-cache.sqlite')
+        backend.set('db', 'Model.System.Blok', 'is_installed', key, True)
+        backend.get('db', 'Model.System.Blok', 'is_installed', key)
+
+    The values are pickled, the values which can not be pickled are not
+    shared
+    """
+
+    def __init__(self, path, mmap_size=256 * 1024 * 1024, timeout=5):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        self.local = local()
+
+    def get_connection(self):
+        """ Return the connection of the thread, a forked process opens
+        its own connection """
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None and self.local.pid == os.getpid():
+            return connection
+
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.execute('PRAGMA mmap_size=%d' % self.mmap_size)
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS anyblok_cache ('
+            'entry_key TEXT PRIMARY KEY, db_name TEXT, namespace TEXT, '
+            'method TEXT, key TEXT, value BLOB, expire_at REAL, '
+            'version INTEGER)')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS anyblok_cache_method '
+            'ON anyblok_cache (db_name, namespace, method, key)')
+        self.local.connection = connection
+        self.local.pid = os.getpid()
+        return connection
+
+    def get_entry_key(self, db_name, namespace, method, key):
+        return json.dumps([db_name, namespace, method, key])
+
+    def get(self, db_name, namespace, method, key, version=None):
+        row = self.get_connection().execute(
+            'SELECT value, expire_at, version FROM anyblok_cache '
+            'WHERE entry_key = ?',
+            (self.get_entry_key(db_name, namespace, method, key),)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time()):
+            return False, None
+
+        if row[2] != version:
+            return False, None
+
+        return True, pickle.loads(row[0])
+
+    def set(self, db_name, namespace, method, key, value, ttl=None,
+            version=None):
+        try:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            logger.debug('The value of %s.%s can not be shared', namespace,
+                         method)
+            return
+
+        expire_at = None if ttl is None else time() + ttl
+        self.get_connection().execute(
+            'INSERT OR REPLACE INTO anyblok_cache '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.get_entry_key(db_name, namespace, method, key), db_name,
+             namespace, method, key, value, expire_at, version))
+
+    def invalidate(self, db_name, namespace, method, key=None):
+        query = ('DELETE FROM anyblok_cache '
+                 'WHERE db_name = ? AND namespace = ? AND method = ?')
+        params = (db_name, namespace, method)
+        if key is not None:
+            query += ' AND key = ?'
+            params += (key,)
+
+        self.get_connection().execute(query, params)
+
+    def clear(self, db_name=None):
+        if db_name is None:
+            self.get_connection().execute('DELETE FROM anyblok_cache')
+        else:
+            self.get_connection().execute(
+                'DELETE FROM anyblok_cache WHERE db_name = ?', (db_name,))
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            if self.local.pid == os.getpid():
+                connection.close()
+
+            self.local.connection = None
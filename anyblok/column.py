@@ -574,6 +574,14 @@ class DateTime(Column):
         value = convert_string_to_datetime(value)
         return add_timezone_on_datetime(value, self.default_timezone)
 
+    def get_auto_update_value(self):
+        """Return the value of the column updated with ``auto_update``: the
+        current datetime, in the default timezone
+
+        :return: datetime with timezone
+        """
+        return datetime.now(self.default_timezone)
+
     def autodoc_get_properties(self):
         """Return properties for autodoc
 
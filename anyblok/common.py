@@ -6,11 +6,23 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import sys
-from functools import lru_cache
+import json
+from logging import getLogger
+from collections import OrderedDict, namedtuple
+from functools import update_wrapper
+from threading import RLock
+from time import monotonic, perf_counter
+from types import MethodType
 from sqlalchemy.schema import ForeignKeyConstraint
 from sqlalchemy.sql.naming import ConventionDict
 from sqlalchemy.exc import InvalidRequestError
 
+logger = getLogger(__name__)
+
+
+"""Separate the arguments and the named arguments in the keys of the
+cached methods"""
+KWD_MARK = object()
 
 """Define the prefix for the mapper attribute of the column"""
 anyblok_column_prefix = '__anyblok_field_'
@@ -152,6 +164,389 @@ class TypeList(list):
             super(TypeList, self).extend(newbases)
 
 
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+CacheStats = namedtuple('CacheStats', [
+    'hits', 'misses', 'maxsize', 'currsize', 'evictions', 'expirations',
+    'invalidations', 'time_saved'])
+
+
+def get_cache_key(args, kwargs):
+    """Return the key of the invalidation of the entries of a cached
+    method, saved in the ``system_cache`` table
+
+    :param args: arguments of the method, without the instance or the class
+    :param kwargs: named arguments of the method
+    :rtype: str
+    :exception: TypeError if the arguments are not JSON serializable
+    """
+    return json.dumps([list(args), kwargs], sort_keys=True)
+
+
+def get_size(value, seen=None):
+    """Return the estimated size of the value in bytes, with the size of
+    the items of the containers
+
+    :param value: value to measure
+    :rtype: int
+    """
+    if seen is None:
+        seen = set()
+
+    if id(value) in seen:
+        return 0
+
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(get_size(k, seen) + get_size(v, seen)
+                    for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(get_size(x, seen) for x in value)
+    elif hasattr(value, '__dict__'):
+        size += get_size(value.__dict__, seen)
+
+    return size
+
+
+class CacheEntry:
+    """Entry of ``MethodCache``"""
+
+    __slots__ = ('key', 'value', 'expire_at', 'size', 'uses', 'duration')
+
+    def __init__(self, key, value, expire_at, size, duration):
+        self.key = key
+        self.value = value
+        self.expire_at = expire_at
+        self.size = size
+        self.uses = 1
+        self.duration = duration
+
+
+class MethodCache:
+    """Cache of a method of a model, the entries can be invalidated by
+    key::
+
+        Blok.is_installed('anyblok-core')
+        Blok.is_installed.cache_invalidate('anyblok-core')
+        Blok.is_installed.cache_clear()
+
+    The key of the invalidation is made with the arguments of the method
+    without the instance or the class. If ``by_database`` is True, the
+    models are shared by several databases and the name of the database is
+    added in the key of the entries.
+
+    The entries expire after ``ttl`` seconds. When the cache has more than
+    ``maxsize`` entries or when the estimated size of the values is bigger
+    than ``max_bytes``, the least recently used entry (``lru`` policy) or
+    the least frequently used entry (``lfu`` policy) is evicted.
+
+    If a ``CacheBackend`` is given, the backend shared by the processes is
+    read on the local misses and saves the computed values, with the last
+    invalidation of the ``System.Cache`` table as version.
+
+    The entries of the arguments which are not JSON serializable have no
+    key of invalidation: they are not shared and only the invalidation of
+    all the entries of the method removes them
+    """
+
+    indentify = None
+
+    def __init__(self, method, maxsize=128, by_database=False, ttl=None,
+                 max_bytes=None, policy='lru', backend=None):
+        self.method = method
+        self.backend = backend
+        self.maxsize = maxsize
+        self.by_database = by_database
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.entries = OrderedDict()
+        # lfu policy: the keys of the entries by number of uses, in the
+        # order of use, and the smallest number of uses
+        self.frequencies = {}
+        self.min_uses = 1
+        self.keys = {}
+        self.bytes = 0
+        self.reset_stats()
+        self.lock = RLock()
+        update_wrapper(self, method)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        return MethodType(self, instance)
+
+    def get_entry_key(self, args, kwargs):
+        key = args
+        if kwargs:
+            key += (KWD_MARK,) + tuple(sorted(kwargs.items()))
+
+        if self.by_database:
+            key = (args[0].registry.db_name,) + key
+
+        return key
+
+    def __call__(self, *args, **kwargs):
+        entry_key = self.get_entry_key(args, kwargs)
+        with self.lock:
+            entry = self.entries.get(entry_key)
+            if entry is not None:
+                if entry.expire_at is None or entry.expire_at > monotonic():
+                    self.hits += 1
+                    self.time_saved += entry.duration
+                    self.use_entry(entry_key, entry)
+                    return entry.value
+
+                self.remove_entry(entry_key)
+                self.expirations += 1
+
+            self.misses += 1
+
+        try:
+            key = get_cache_key(args[1:], kwargs)
+        except TypeError:
+            key = None
+
+        start = perf_counter()
+        version = self.get_shared_version(args, key)
+        found, value = self.get_shared(args, key, version)
+        if not found:
+            value = self.method(*args, **kwargs)
+            self.set_shared(args, key, value, version)
+
+        duration = perf_counter() - start
+        expire_at = None if self.ttl is None else monotonic() + self.ttl
+        size = 0 if self.max_bytes is None else get_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # the value is bigger than the cache
+            return value
+
+        with self.lock:
+            if entry_key in self.entries:
+                self.remove_entry(entry_key)
+
+            entry = self.entries[entry_key] = CacheEntry(
+                key, value, expire_at, size, duration)
+            if self.policy == 'lfu':
+                self.frequencies.setdefault(
+                    entry.uses, OrderedDict())[entry_key] = None
+                self.min_uses = entry.uses
+
+            if key is not None:
+                self.keys.setdefault(key, set()).add(entry_key)
+            self.bytes += size
+            self.evict()
+
+        return value
+
+    def get_shared_version(self, args, key):
+        """Return the version of the entry in the backend, read before
+        computing the value: an invalidation saved meanwhile changes the
+        version of the readers
+
+        :rtype: int or None if the entry is not shared
+        """
+        if self.backend is None or key is None:
+            return None
+
+        namespace, method = self.indentify
+        try:
+            return args[0].registry.System.Cache.get_backend_version()
+        except Exception:
+            logger.exception('The version of %s.%s in the cache backend can '
+                             'not be read', namespace, method)
+            return None
+
+    def get_shared(self, args, key, version):
+        """Return the value saved in the backend by the other processes
+
+        :rtype: tuple (found, value)
+        """
+        if version is None:
+            return False, None
+
+        namespace, method = self.indentify
+        try:
+            return self.backend.get(args[0].registry.db_name, namespace,
+                                    method, key, version=version)
+        except Exception:
+            logger.exception('The cache backend can not get %s.%s',
+                             namespace, method)
+            return False, None
+
+    def set_shared(self, args, key, value, version):
+        """Save the value in the backend for the other processes"""
+        if version is None:
+            return
+
+        namespace, method = self.indentify
+        try:
+            self.backend.set(args[0].registry.db_name, namespace, method,
+                             key, value, ttl=self.ttl, version=version)
+        except Exception:
+            logger.exception('The cache backend can not set %s.%s',
+                             namespace, method)
+
+    def evict(self):
+        """Remove the entries over the limits of the cache, the lock must
+        be acquired"""
+        while (
+            (self.maxsize is not None and len(self.entries) > self.maxsize) or
+            (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            if self.policy == 'lfu':
+                # the oldest entry is evicted between the less used entries
+                if self.min_uses not in self.frequencies:
+                    # the less used entries have been removed
+                    self.min_uses = min(self.frequencies)
+
+                entry_key = next(iter(self.frequencies[self.min_uses]))
+            else:
+                entry_key = next(iter(self.entries))
+
+            self.remove_entry(entry_key)
+            self.evictions += 1
+
+    def use_entry(self, entry_key, entry):
+        """Count one use of the entry, the lock must be acquired"""
+        self.entries.move_to_end(entry_key)
+        if self.policy != 'lfu':
+            entry.uses += 1
+            return
+
+        self.remove_frequency(entry_key, entry.uses)
+        if entry.uses == self.min_uses and entry.uses not in self.frequencies:
+            self.min_uses += 1
+
+        entry.uses += 1
+        self.frequencies.setdefault(
+            entry.uses, OrderedDict())[entry_key] = None
+
+    def remove_frequency(self, entry_key, uses):
+        """Remove the entry from its number of uses, the lock must be
+        acquired"""
+        entry_keys = self.frequencies[uses]
+        del entry_keys[entry_key]
+        if not entry_keys:
+            del self.frequencies[uses]
+
+    def remove_entry(self, entry_key):
+        """Remove the entry from the cache, the lock must be acquired
+
+        :param entry_key: key of the entry
+        """
+        entry = self.entries.pop(entry_key)
+        self.bytes -= entry.size
+        if self.policy == 'lfu':
+            self.remove_frequency(entry_key, entry.uses)
+
+        if entry.key is None:
+            return
+
+        entry_keys = self.keys[entry.key]
+        entry_keys.discard(entry_key)
+        if not entry_keys:
+            del self.keys[entry.key]
+
+    def cache_invalidate_key(self, key):
+        """Remove the entries of the key of the invalidation
+
+        :param key: key returned by ``get_cache_key``
+        """
+        with self.lock:
+            for entry_key in list(self.keys.get(key, ())):
+                self.remove_entry(entry_key)
+                self.invalidations += 1
+
+    def cache_invalidate(self, *args, **kwargs):
+        """Remove the entries of the arguments, without the instance or the
+        class
+
+        :exception: TypeError if the arguments are not JSON serializable
+        """
+        self.cache_invalidate_key(get_cache_key(args, kwargs))
+
+    def cache_invalidate_all(self):
+        """Remove all the entries, the statistics are kept"""
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.frequencies.clear()
+            self.keys.clear()
+            self.bytes = 0
+
+    def cache_clear(self):
+        """Remove all the entries and reset the statistics"""
+        with self.lock:
+            self.entries.clear()
+            self.frequencies.clear()
+            self.keys.clear()
+            self.bytes = 0
+            self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the counters of the cache"""
+        self.hits = self.misses = 0
+        self.evictions = self.expirations = self.invalidations = 0
+        self.time_saved = 0.
+
+    def cache_info(self):
+        """Return the counters of the cache
+
+        :rtype: CacheInfo(hits, misses, maxsize, currsize)
+        """
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self.entries))
+
+    def cache_stats(self):
+        """Return the counters of the cache, ``time_saved`` is the sum of
+        the durations, in seconds, of the calls replaced by the hits
+
+        :rtype: CacheStats(hits, misses, maxsize, currsize, evictions,
+            expirations, invalidations, time_saved)
+        """
+        with self.lock:
+            return CacheStats(self.hits, self.misses, self.maxsize,
+                              len(self.entries), self.evictions,
+                              self.expirations, self.invalidations,
+                              self.time_saved)
+
+
+def get_cache_stats(caches):
+    """Return the sum of the counters of the caches of the same method
+
+    :param caches: list of ``MethodCache``
+    :rtype: CacheStats
+    """
+    stats = [cache.cache_stats() for cache in caches]
+    return CacheStats(*(
+        stats[0].maxsize if field == 'maxsize' else sum(values)
+        for field, values in zip(CacheStats._fields, zip(*stats))))
+
+
+def clear_caches(registry, caches=None):
+    """Clear the caches of the methods of the registry
+
+    :param registry: the registry
+    :param caches: list of (namespace, method, key), the key is None to
+        clear all the entries of the method, None to clear all the caches
+    """
+    registry_caches = registry.caches
+    if caches is None:
+        caches = [(registry_name, method, None)
+                  for registry_name, methods in registry_caches.items()
+                  for method in methods]
+
+    for registry_name, method, key in caches:
+        for cache in registry_caches.get(registry_name, {}).get(method, []):
+            if key is None:
+                cache.cache_invalidate_all()
+            else:
+                cache.cache_invalidate_key(key)
+
+
 def apply_cache(attr, method, registry, namespace, base, properties):
     """Find the cached methods in the base to apply the real cache decorator.
 
@@ -167,9 +562,15 @@ def apply_cache(attr, method, registry, namespace, base, properties):
         elif attr not in registry.caches[namespace]:
             registry.caches[namespace][attr] = []
 
-        @lru_cache(maxsize=method.size)
-        def wrapper(*args, **kwargs):
-            return method(*args, **kwargs)
+        options = getattr(method, 'cache_options', {})
+        wrapper = MethodCache(method, maxsize=method.size,
+                              by_database=registry.share_template,
+                              ttl=options.get('ttl'),
+                              max_bytes=options.get('max_bytes'),
+                              policy=options.get('policy', 'lru'),
+                              backend=(registry.cache_backend
+                                       if method.is_cache_classmethod
+                                       else None))
 
         wrapper.indentify = (namespace, attr)
         registry.caches[namespace][attr].append(wrapper)
@@ -782,6 +782,11 @@ def add_plugins(group):
                        type=AnyBlokPlugin,
                        default='anyblok.migration:Migration',
                        help="Migration class to use")
+    group.add_argument('--cache-backend-cls', dest='CacheBackend',
+                       type=AnyBlokPlugin,
+                       default='anyblok.cache_backend:FileCacheBackend',
+                       help="Class of the cache shared by the processes, "
+                            "used if --cache-backend-path is filled")
     group.add_argument('--get-url-fnct', dest='get_url',
                        type=AnyBlokPlugin,
                        default='anyblok.config:get_url',
@@ -799,6 +804,48 @@ def add_configuration_file(parser):
                         help="Relative path of the config file")
     parser.add_argument('--without-auto-migration', dest='withoutautomigration',
                         action='store_true')
+    parser.add_argument('--force-auto-migration', action='store_true',
+                        help="Compare the models with the database even if "
+                             "the schema did not change since the last "
+                             "migration")
+    parser.add_argument('--registry-snapshot-dir',
+                        default=os.environ.get('ANYBLOK_REGISTRY_SNAPSHOT_DIR'),
+                        help="Directory where the snapshots of the assembled "
+                             "registries are saved to speed up the next "
+                             "starts")
+    parser.add_argument('--registry-pool-size', type=int,
+                        help="Maximum number of loaded registries, the least "
+                             "recently used registry is disposed when a new "
+                             "one is loaded")
+    parser.add_argument('--cache-invalidation-notify', action='store_true',
+                        help="With PostgreSQL, the invalidations of the "
+                             "cache are sent to the other processes by "
+                             "NOTIFY, instead of polling the System.Cache "
+                             "table")
+    parser.add_argument('--cache-backend-path',
+                        help="Path of the store of the cached classmethods "
+                             "shared by the processes of the host, e.g. "
+                             "/dev/shm/anyblok-cache.sqlite")
+    parser.add_argument('--cache-watermark-timeout', type=int, default=86400,
+                        help="Number of seconds after which a process which "
+                             "did not save its last known invalidation is "
+                             "considered as stopped by the compaction of "
+                             "the System.Cache table")
+    parser.add_argument('--cache-watermark-interval', type=int, default=60,
+                        help="Minimum number of seconds between two saves "
+                             "of the last invalidation known by a process "
+                             "which polls the System.Cache table")
+    parser.add_argument('--share-registry-template', action='store_true',
+                        help="The registries loaded without migration use "
+                             "the assembled models of a loaded registry "
+                             "whose installed bloks are the same")
+    parser.add_argument('--lazy-model-assembly', action='store_true',
+                        help="When the registry is loaded without migration, "
+                             "assemble the models at the first access")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Measure the time, the SQL statements and the "
+                             "memory of each phase of the start of the "
+                             "registry")
     parser.add_argument('--isolation-level',
                         default="READ_COMMITTED",
                         choices=["SERIALIZABLE", "REPEATABLE_READ",
@@ -843,6 +890,12 @@ def add_database(group):
     group.add_argument('--db-query', type=parse_qs,
                        default=os.environ.get('ANYBLOK_DATABASE_QUERY'),
                        help="Query string to add parameter to the connection")
+    group.add_argument('--db-replica-urls', nargs='+',
+                       help="Complete URLs of the read-only replicas, used "
+                            "in round robin by the queries on replica")
+    group.add_argument('--db-replica-retry-delay', type=int, default=30,
+                       help="Delay in seconds before using again an "
+                            "unavailable replica")
     group.add_argument('--db-echo', action="store_true",
                        default=(os.environ.get(
                            'ANYBLOK_DATABASE_ECHO') or False))
@@ -885,6 +938,9 @@ def add_install_bloks(parser):
     """
     parser.add_argument('--install-bloks', nargs="+", help="blok to install")
     parser.add_argument('--install-all-bloks', action='store_true')
+    parser.add_argument('--batch-install-bloks', action='store_true',
+                        help="Install all the bloks with one assembly of "
+                             "the registry and one migration")
     parser.add_argument('--test-blok-at-install', action='store_true')
 
 
@@ -933,6 +989,19 @@ def add_interpreter(parser):
                         help="Python script to execute")
 
 
+@Configuration.add('startup-profile', label="Startup profile")
+def add_startup_profile(group):
+    """Add arguments to 'startup-profile' configuration group
+
+    :param group:
+    """
+    group.add_argument('--profile-sort-by', default='duration',
+                       choices=('duration', 'sql', 'memory', 'calls'),
+                       help="Column used to sort the phases and the bloks")
+    group.add_argument('--profile-limit', type=int,
+                       help="Maximum number of phases and bloks to display")
+
+
 @Configuration.add('schema', label="Schema options")
 def add_schema(group):
     """Add arguments to 'schema' configuration group
@@ -996,3 +1065,6 @@ def define_preload_option(group):
     """
     group.add_argument('--databases', dest='db_names', nargs="+",
                        help='List of the database allow to be load')
+    group.add_argument('--preload-parallel', type=int, default=1,
+                       help='Number of registries loaded at the same time '
+                            'by RegistryManager.preload')
@@ -137,7 +137,29 @@ class Declarations:
             return wrapper
 
 
-def cache(size=128):
+CACHE_POLICIES = ('lru', 'lfu')
+
+
+def cache_options(size, ttl, max_bytes, policy):
+    """Check and return the options of the cached methods"""
+    if policy not in CACHE_POLICIES:
+        raise DeclarationsException(
+            "Unknown cache policy %r, waiting one of %r" % (
+                policy, CACHE_POLICIES))
+
+    return dict(size=size, ttl=ttl, max_bytes=max_bytes, policy=policy)
+
+
+def cache(size=128, ttl=None, max_bytes=None, policy='lru'):
+    """Cache the method by instance and arguments
+
+    :param size: maximum number of entries, None for no limit
+    :param ttl: number of seconds before the expiry of an entry
+    :param max_bytes: maximum size of the cached values, estimated in bytes
+    :param policy: ``lru`` evicts the least recently used entry, ``lfu``
+        the least frequently used entry
+    """
+    options = cache_options(size, ttl, max_bytes, policy)
     autodoc = """
     **Cached method** with size=%(size)s
     """ % dict(size=size)
@@ -147,12 +169,22 @@ def cache(size=128):
         method.is_cache_method = True
         method.is_cache_classmethod = False
         method.size = size
+        method.cache_options = options
         return method
 
     return wrapper
 
 
-def classmethod_cache(size=128):
+def classmethod_cache(size=128, ttl=None, max_bytes=None, policy='lru'):
+    """Cache the classmethod by arguments
+
+    :param size: maximum number of entries, None for no limit
+    :param ttl: number of seconds before the expiry of an entry
+    :param max_bytes: maximum size of the cached values, estimated in bytes
+    :param policy: ``lru`` evicts the least recently used entry, ``lfu``
+        the least frequently used entry
+    """
+    options = cache_options(size, ttl, max_bytes, policy)
     autodoc = """
     **Cached classmethod** with size=%(size)s
     """ % dict(size=size)
@@ -162,6 +194,7 @@ def classmethod_cache(size=128):
         method.is_cache_method = True
         method.is_cache_classmethod = True
         method.size = size
+        method.cache_options = options
         return method
 
     return wrapper
@@ -5,8 +5,12 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
 import threading
+from contextvars import ContextVar
 from inspect import ismethod
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.util import ScopedRegistry, ThreadLocalRegistry
 
 
 class EnvironmentException(AttributeError):
@@ -115,4 +119,162 @@ class ThreadEnvironment:
         return cls.values[str(threading.current_thread())].get(key, default)
 
 
+class ScopedSessionRegistry(ScopedRegistry):
+    """ Registry of the sessions by scope, the sessions out of a scope
+    (``None``) are kept by thread in a ``threading.local``, and the
+    sessions of the asyncio tasks are closed and released when the task is
+    done
+    """
+
+    def __init__(self, createfunc, scopefunc):
+        super(ScopedSessionRegistry, self).__init__(createfunc, scopefunc)
+        self.thread_registry = ThreadLocalRegistry(createfunc)
+
+    def __call__(self):
+        key = self.scopefunc()
+        if key is None:
+            return self.thread_registry()
+
+        try:
+            return self.registry[key]
+        except KeyError:
+            self.set(self.createfunc(), key=key)
+            return self.registry[key]
+
+    def has(self):
+        key = self.scopefunc()
+        if key is None:
+            return self.thread_registry.has()
+
+        return key in self.registry
+
+    def set(self, obj, key=None):
+        if key is None:
+            key = self.scopefunc()
+
+        if key is None:
+            return self.thread_registry.set(obj)
+
+        if key not in self.registry and isinstance(key, asyncio.Future):
+            key.add_done_callback(self.release)
+
+        self.registry[key] = obj
+
+    def clear(self):
+        key = self.scopefunc()
+        if key is None:
+            return self.thread_registry.clear()
+
+        self.registry.pop(key, None)
+
+    def release(self, task):
+        """ Close and forget the session of the done task """
+        session = self.registry.pop(task, None)
+        if session is not None:
+            session.close()
+
+
+class ScopedSession(scoped_session):
+    """ ``scoped_session`` with the ``ScopedSessionRegistry`` when a scope
+    function is given """
+
+    def __init__(self, session_factory, scopefunc=None):
+        super(ScopedSession, self).__init__(session_factory, scopefunc)
+        if scopefunc:
+            self.registry = ScopedSessionRegistry(session_factory, scopefunc)
+
+
+class ContextVarEnvironment:
+    """ Use the context variables, to get the environment
+
+    Each thread and each asyncio task has its own environment, a task does
+    not see the values of the thread or the task which created it. The
+    values are released with the thread or the task::
+
+        EnvironmentManager.define_environment_cls(ContextVarEnvironment)
+
+    In an event loop, the session is scoped by task, it is closed when the
+    task is done. Out of an event loop, the session is kept by thread
+    """
+
+    values = ContextVar('anyblok_environment', default=(None, None))
+    scope = ContextVar('anyblok_environment_scope', default=None)
+
+    @classmethod
+    def get_scope(cls):
+        """ Return the current asyncio task, None out of an event loop """
+        scope = cls.scope.get()
+        if scope is not None:
+            return scope
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+        return asyncio.current_task(loop)
+
+    @classmethod
+    def run_in_scope(cls, scope, func, *args, **kwargs):
+        """ Call the function with the environment and the session of the
+        scope, used to call the synchronous API of a task in another thread,
+        in a copy of the context of the task::
+
+            scope = ContextVarEnvironment.get_scope()
+            ContextVarEnvironment.get_values()
+            context = contextvars.copy_context()
+            executor.submit(context.run, ContextVarEnvironment.run_in_scope,
+                            scope, func)
+
+        :param scope: asyncio task
+        :param func: function to call
+        """
+        cls.scope.set(scope)
+        return func(*args, **kwargs)
+
+    @classmethod
+    def scoped_function_for_session(cls):
+        """ Return the current asyncio task, None out of an event loop to
+        keep the session by thread, see ``ScopedSessionRegistry`` """
+        return cls.get_scope()
+
+    @classmethod
+    def get_values(cls):
+        """ Return the values of the current thread or task
+
+        :rtype: dict
+        """
+        scope = cls.get_scope()
+        owner, values = cls.values.get()
+        if values is None or owner is not scope:
+            # the context is copied from the creator of the task
+            values = {}
+            cls.values.set((scope, values))
+
+        return values
+
+    @classmethod
+    def setter(cls, key, value):
+        """ Save the value of the key in the environment
+
+        :param key: the key of the value to save
+        :param value: the value to save
+        """
+        cls.get_values()[key] = value
+
+    @classmethod
+    def getter(cls, key, default):
+        """ Get the value of the key in the environment
+
+        :param key: the key of the value to retrieve
+        :param default: return this value if no value loaded for the key
+        :rtype: the value of the key
+        """
+        owner, values = cls.values.get()
+        if values is None or owner is not cls.get_scope():
+            return default
+
+        return values.get(key, default)
+
+
 EnvironmentManager.define_environment_cls(ThreadEnvironment)
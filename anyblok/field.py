@@ -117,7 +117,8 @@ class Field:
 
         return expr_column
 
-    def expire_related_attribute(self, model_self, action_todos):
+    @staticmethod
+    def expire_related_attribute(model_self, action_todos):
         for action_todo in action_todos:
             if len(action_todo) == 1:
                 obj = model_self
@@ -119,7 +119,7 @@ class ModelAttribute:
         :rtype: instance of the attribute
         :exceptions: ModelAttributeException
         """
-        if self.model_name not in registry.loaded_namespaces:
+        if not registry.has(self.model_name):
             raise ModelAttributeException(
                 "Unknow model %r, maybe the model doesn't exist or is not"
                 "assembled yet" % self.model_name)
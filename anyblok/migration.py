@@ -17,11 +17,13 @@ from alembic.migration import MigrationContext
 from alembic.autogenerate import compare_metadata
 from alembic.operations import Operations
 from contextlib import contextmanager
+from hashlib import sha256
 from sqlalchemy import func, select, update, join, and_, text
 from anyblok.config import Configuration
 from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy.ext.compiler import compiles
-from sqlalchemy.sql.ddl import CreateSchema, DropSchema
+from sqlalchemy.sql.ddl import (
+    CreateSchema, DropSchema, CreateTable, CreateIndex)
 from .common import sgdb_in
 from sqlalchemy.schema import (
     DDLElement, PrimaryKeyConstraint, CheckConstraint, UniqueConstraint)
@@ -1403,8 +1405,13 @@ class Migration:
         c = t.column('My column name from t')
     """
 
+    schema_fingerprint_key = 'anyblok.migration.schema_fingerprint'
+
     def __init__(self, registry):
+        self.registry = registry
         self.withoutautomigration = registry.withoutautomigration
+        self.force_auto_migration = Configuration.get(
+            'force_auto_migration', False)
         self.conn = registry.connection()
         self.loaded_views = registry.loaded_views
         self.metadata = registry.declarativebase.metadata
@@ -1449,6 +1456,72 @@ class Migration:
         report = self.detect_changed(schema_only=schema_only)
         report.apply_change()
 
+    def get_metadata_fingerprint(self):
+        """ Return the hash of the rendered metadata
+
+        The DDL of the tables and of the indexes are compiled with the
+        dialect of the database, the comments and the tables ignored by
+        the migration are added too
+
+        :rtype: hexadecimal string
+        """
+        dialect = self.conn.dialect
+        res = sha256()
+        for table in sorted(self.metadata.tables.values(),
+                            key=lambda x: x.fullname):
+            res.update(str(CreateTable(table).compile(
+                dialect=dialect)).encode('utf-8'))
+            res.update(('%s;' % table.comment).encode('utf-8'))
+            for column in table.columns:
+                res.update(('%s:%s;' % (
+                    column.name, column.comment)).encode('utf-8'))
+
+            for index in sorted(table.indexes, key=lambda x: x.name or ''):
+                res.update(str(CreateIndex(index).compile(
+                    dialect=dialect)).encode('utf-8'))
+
+        for tablename in sorted(self.ignore_migration_for):
+            ignored = self.ignore_migration_for[tablename]
+            if ignored is not True:
+                ignored = sorted(ignored)
+
+            res.update(('%s:%s;' % (tablename, ignored)).encode('utf-8'))
+
+        return res.hexdigest()
+
+    def is_schema_up_to_date(self):
+        """ Return True if the metadata is the same as the metadata
+        saved after the last successful migration, in this case the
+        detection of the changes can be skipped
+
+        :rtype: bool
+        """
+        if self.force_auto_migration or self.reinit_all or any([
+            self.reinit_tables, self.reinit_columns, self.reinit_indexes,
+            self.reinit_constraints
+        ]):
+            return False
+
+        Parameter = self.registry.System.Parameter
+        if not self.conn.dialect.has_table(
+            self.conn, Parameter.__tablename__,
+            schema=Parameter.__db_schema__
+        ):
+            # the database is not initialized yet
+            return False
+
+        fingerprint = Parameter.get(self.schema_fingerprint_key, None)
+        return fingerprint == self.get_metadata_fingerprint()
+
+    def save_schema_fingerprint(self):
+        """ Save the fingerprint of the metadata after a migration """
+        if self.withoutautomigration:
+            # the changes are not all applied
+            return
+
+        self.registry.System.Parameter.set(
+            self.schema_fingerprint_key, self.get_metadata_fingerprint())
+
     def detect_changed(self, schema_only=False):
         """ Detect the difference between the metadata and the database
 
@@ -153,7 +153,19 @@ class Model:
                 if hasattr(plugin, method):
                     getattr(plugin, method)(*args, **kwargs)
 
-        registry.call_plugins = call_plugins
+        def profile_call_plugins(method, *args, **kwargs):
+            """call the method on each plugin and measure each call"""
+            for plugin in plugins:
+                if hasattr(plugin, method):
+                    phase = 'Model.plugins.%s.%s' % (
+                        plugin.__class__.__name__, method)
+                    with registry.profile_phase(phase):
+                        getattr(plugin, method)(*args, **kwargs)
+
+        if registry.startup_profiler is None:
+            registry.call_plugins = call_plugins
+        else:
+            registry.call_plugins = profile_call_plugins
 
     @classmethod
     def register(self, parent, name, cls_, **kwargs):
@@ -519,11 +531,120 @@ class Model:
         for namespace in registry.loaded_registries['Model_names']:
             cls.load_namespace_first_step(registry, namespace)
 
+        if registry.is_lazy_assembly():
+            cls.init_lazy_assembly(registry)
+            return
+
         # create the namespace with all the information come from first
         # step
         for namespace in registry.loaded_registries['Model_names']:
             cls.load_namespace_second_step(registry, namespace)
 
+    @classmethod
+    def has_event_listener(cls, registry, bases, seen=None):
+        """ Return True if one of the bases or of their mixins declares an
+        event listener
+
+        :param registry: the current registry
+        :param bases: list of the bases of the namespace
+        :rtype: bool
+        """
+        if seen is None:
+            seen = set()
+
+        for base in bases:
+            for attr in base.__dict__.values():
+                method = getattr(attr, '__func__', attr)
+                if getattr(method, 'is_an_event_listener', False):
+                    return True
+
+                if getattr(method, 'is_an_sqlalchemy_event_listener', False):
+                    return True
+
+            for b_ns in getattr(base, '__anyblok_bases__', []):
+                brn = b_ns.__registry_name__
+                if brn in seen:
+                    continue
+
+                seen.add(brn)
+                if brn in registry.loaded_registries['Mixin_names']:
+                    if cls.has_event_listener(
+                        registry, registry.loaded_registries[brn]['bases'],
+                        seen=seen
+                    ):
+                        return True
+
+        return False
+
+    @classmethod
+    def get_namespaces_links(cls, registry):
+        """ Return for each namespace the namespaces to assemble with it
+
+        * the inherited models and the models which inherit it
+        * the remote models of the relationships, and the models which
+          add a backref on it
+        * the parent namespaces
+
+        :param registry: the current registry
+        :rtype: dict {namespace: set of namespaces}
+        """
+        names = registry.loaded_registries['Model_names']
+        links = {namespace: set() for namespace in names}
+
+        def link(namespace, other, both=True):
+            if other in links and other != namespace:
+                links[namespace].add(other)
+                if both:
+                    links[other].add(namespace)
+
+        for namespace in names:
+            properties = registry.loaded_namespaces_first_step[namespace]
+            for depend in properties['__depends__']:
+                link(namespace, depend)
+
+            for field in properties.values():
+                if isinstance(field, RelationShip):
+                    link(namespace, field.model.model_name,
+                         both=bool(field.kwargs.get('backref')))
+                    join_model = getattr(field, 'join_model', None)
+                    if join_model:
+                        link(namespace, join_model.model_name)
+
+            parts = namespace.split('.')
+            for i in range(2, len(parts)):
+                link(namespace, '.'.join(parts[:i]), both=False)
+
+        return links
+
+    @classmethod
+    def init_lazy_assembly(cls, registry):
+        """ Save the namespaces to assemble at the first access, only the
+        models with event listeners are assembled now, because the
+        listeners must exist before the events are fired
+
+        :param registry: registry to update
+        """
+        registry.lazy_namespaces = cls.get_namespaces_links(registry)
+        registry.lazy_assemble_callback = cls.load_namespace_second_step
+        for namespace in registry.loaded_registries['Model_names']:
+            # add the intermediate namespaces in the registry, the
+            # models are added by the assembly
+            parts = namespace.split('.')
+            parent = registry
+            for i in range(1, len(parts) - 1):
+                if '.'.join(parts[:i + 1]) in registry.lazy_namespaces:
+                    break
+
+                parent = registry.get_namespace(parent, parts[i])
+
+        for namespace in registry.loaded_registries['Model_names']:
+            if namespace not in registry.lazy_namespaces:
+                continue
+
+            bases = registry.loaded_registries[namespace]['bases']
+            if cls.has_event_listener(registry, bases):
+                registry.assemble_lazy_namespace(namespace)
+
     @classmethod
     def initialize_callback(cls, registry):
         """ initialize callback is called after assembling all entries
@@ -539,6 +660,14 @@ class Model:
         for Model in registry.loaded_namespaces.values():
             Model.initialize_model()
 
+        if registry.loaded_from_snapshot:
+            if registry.snapshot.match_models():
+                # Nothing changed since the snapshot, the System models and
+                # the states of the bloks are already up to date
+                return False
+
+            registry.loaded_from_snapshot = False
+
         Blok = registry.System.Blok
         if not registry.withoutautomigration:
             Model = registry.System.Model
@@ -8,7 +8,6 @@
 from .plugins import ModelPluginBase
 from anyblok.column import DateTime
 from anyblok.mapper import ModelMapper
-from datetime import datetime
 
 
 class AutoUpdatePlugin(ModelPluginBase):
@@ -23,21 +22,20 @@ class AutoUpdatePlugin(ModelPluginBase):
         """
         namespaces = [namespace]
         namespaces.extend(list(base.__depends__))
-        fields = []
+        fields = {}
         for ns in namespaces:
             for c in self.registry.get(ns).loaded_columns:
                 f = self.registry.loaded_namespaces_first_step[namespace].get(c)
                 if isinstance(f, DateTime) and f.auto_update:
                     # TimeStamp inherit of DateTime so it works too
-                    fields.append(c)
+                    fields[c] = f
 
         if fields:
             e = ModelMapper(namespace, 'after_update')
 
             def auto_update_listen(mapper, connection, target):
-                now = datetime.now()
-                for field in fields:
-                    setattr(target, field, now)
+                for name, field in fields.items():
+                    setattr(target, name, field.get_auto_update_value())
 
             self.registry._sqlalchemy_known_events.append(
                 (e, namespace, auto_update_listen))
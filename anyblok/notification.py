@@ -0,0 +1,184 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+from logging import getLogger
+from select import select
+from threading import Event, Thread
+from sqlalchemy import text
+from .common import clear_caches
+
+logger = getLogger(__name__)
+
+CACHE_INVALIDATION_CHANNEL = 'anyblok_cache_invalidation'
+"""Name of the PostgreSQL channel of the invalidations of the cache"""
+
+MAX_PAYLOAD_SIZE = 7900
+"""The payload of PostgreSQL notifications must be shorter than 8000 bytes,
+the bigger invalidations invalidate all the caches"""
+
+
+def is_notification_available(engine):
+    """Return True if the database can send the notifications
+
+    :param engine: SQLAlchemy engine
+    :rtype: bool
+    """
+    return (engine.dialect.name == 'postgresql' and
+            engine.dialect.driver == 'psycopg2')
+
+
+class CacheInvalidationListener:
+    """ Listen the invalidations of the cache sent by ``NOTIFY`` with
+    PostgreSQL, and clear the caches of the registry::
+
+        listener = CacheInvalidationListener(registry)
+        listener.start()
+        ...
+        listener.stop()
+
+    The notifications are sent in the transaction of the invalidation,
+    PostgreSQL delivers them only after the commit. The listener uses its
+    own connection, outside of the pool, in a thread.
+
+    When the connection is lost, the registry polls the ``System.Cache``
+    table while the listener connects again, waiting ``retry_delay``
+    seconds, doubled after each failure up to ``max_retry_delay``
+    """
+
+    def __init__(self, registry, timeout=1, retry_delay=1,
+                 max_retry_delay=60):
+        self.registry = registry
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.connection = None
+        self.connected = False
+        self.thread = None
+        self.stopped = Event()
+
+    def start(self):
+        """Open the connection, listen the channel and start the thread"""
+        self.connect()
+        self.stopped.clear()
+        self.thread = Thread(
+            target=self.run, daemon=True,
+            name='anyblok-cache-listener-%s' % self.registry.db_name)
+        self.thread.start()
+
+    def connect(self):
+        """Open the connection, outside of the pool, and listen the
+        channel"""
+        connection = self.registry.engine.raw_connection()
+        connection.detach()
+        self.connection = connection.connection
+        self.connection.autocommit = True
+        cursor = self.connection.cursor()
+        cursor.execute('LISTEN %s' % CACHE_INVALIDATION_CHANNEL)
+        cursor.close()
+        self.connected = True
+
+    def disconnect(self):
+        """Close the connection, the registry polls the table until the
+        next connection"""
+        self.connected = False
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+
+            self.connection = None
+
+    def stop(self):
+        """Stop the thread and close the connection"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.disconnect()
+
+    def run(self):
+        """Wait the notifications until the listener is stopped, the
+        connection is opened again when it is lost"""
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('The listener of the invalidations of the '
+                                 'cache of %r lost its connection',
+                                 self.registry.db_name)
+                self.reconnect()
+
+    def poll(self):
+        """Wait the notifications during ``timeout`` seconds and clear the
+        caches"""
+        connection = self.connection
+        if select([connection], [], [], self.timeout) == ([], [], []):
+            return
+
+        connection.poll()
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            try:
+                self.clear(json.loads(notify.payload))
+            except Exception:
+                logger.exception('Invalid invalidation of the cache %r',
+                                 notify.payload)
+
+    def reconnect(self):
+        """Connect again until it succeeds or the listener is stopped. The
+        notifications sent without connection are lost, so all the caches
+        are cleared once connected"""
+        self.disconnect()
+        delay = self.retry_delay
+        while not self.stopped.wait(delay):
+            try:
+                self.connect()
+            except Exception:
+                delay = min(delay * 2, self.max_retry_delay)
+                logger.warning('The listener of the invalidations of the '
+                               'cache of %r can not connect, next try in '
+                               '%s seconds', self.registry.db_name, delay)
+                continue
+
+            self.clear()
+            return
+
+    def clear(self, caches=None):
+        """Clear the caches of the registry
+
+        :param caches: list of (namespace, method, key), the key is None to
+            clear all the entries of the method, None to clear all the caches
+        """
+        clear_caches(self.registry, caches)
+
+    def notify(self, caches=None):
+        """Clear the caches of the registry and send the invalidation to
+        the other processes, the notification is sent on commit
+
+        :param caches: list of (namespace, method, key), the key is None to
+            clear all the entries of the method, None to clear all the caches
+        """
+        self.clear(caches)
+        self.send(caches)
+
+    def send(self, caches=None):
+        """Send the invalidation to the other processes, the notification
+        is sent on commit
+
+        :param caches: list of (namespace, method, key), the key is None to
+            clear all the entries of the method, None to clear all the caches
+        """
+        payload = json.dumps(caches)
+        if len(payload) > MAX_PAYLOAD_SIZE:
+            payload = json.dumps(None)
+
+        self.registry.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            dict(channel=CACHE_INVALIDATION_CHANNEL, payload=payload))
@@ -0,0 +1,209 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+from sqlalchemy import event
+from texttable import Texttable
+import tracemalloc
+
+
+class StartupProfilerException(Exception):
+    """ Simple Exception for StartupProfiler """
+
+
+@contextmanager
+def no_profile_phase():
+    """Context manager used when the start is not profiled"""
+    yield
+
+
+class StartupProfiler:
+    """Measure the phases of the start of a registry
+
+    For each phase and each blok, the profiler counts the calls, the wall
+    time, the SQL statements and the memory allocated. The measures are
+    exclusive: what is spent in a nested phase is only counted in the nested
+    phase, so the sum of the report is the whole start::
+
+        profiler = StartupProfiler()
+        profiler.start(engine)
+        with profiler.phase('My phase', blok='my-blok'):
+            ...
+
+        profiler.stop()
+        report = profiler.report(sort_by='sql')
+    """
+
+    columns = ('calls', 'duration', 'sql', 'memory')
+
+    def __init__(self):
+        self.measures = OrderedDict()
+        self.stack = []
+        self.engines = []
+        self.sql_count = 0
+        self.running = False
+        self.tracemalloc_started = False
+
+    def start(self, *engines):
+        """Start to measure the phases
+
+        :param engines: the SQLAlchemy engines where the SQL statements
+            are counted
+        """
+        for engine in engines:
+            self.listen_engine(engine)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracemalloc_started = True
+
+        self.running = True
+
+    def stop(self):
+        """Stop to measure the phases, the measures are kept"""
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute',
+                         self.count_sql_statement)
+
+        self.engines = []
+        if self.tracemalloc_started:
+            tracemalloc.stop()
+            self.tracemalloc_started = False
+
+        self.running = False
+
+    def listen_engine(self, engine):
+        if engine not in self.engines:
+            event.listen(engine, 'before_cursor_execute',
+                         self.count_sql_statement)
+            self.engines.append(engine)
+
+    def count_sql_statement(self, *args, **kwargs):
+        self.sql_count += 1
+
+    def get_counters(self):
+        memory = 0
+        if tracemalloc.is_tracing():
+            memory = tracemalloc.get_traced_memory()[0]
+
+        return [perf_counter(), self.sql_count, memory]
+
+    @contextmanager
+    def phase(self, name, blok=None):
+        """Measure one phase
+
+        :param name: name of the phase
+        :param blok: name of the blok concerned by the phase
+        """
+        if not self.running:
+            yield
+            return
+
+        children = [0., 0, 0]
+        self.stack.append(children)
+        start = self.get_counters()
+        try:
+            yield
+        finally:
+            total = [x - y for x, y in zip(self.get_counters(), start)]
+            self.stack.pop()
+            if self.stack:
+                parent = self.stack[-1]
+                for i, value in enumerate(total):
+                    parent[i] += value
+
+            duration, sql, memory = [
+                x - y for x, y in zip(total, children)]
+            self.add_measure(name, blok, 1, duration, sql, memory)
+
+    def add_measure(self, name, blok, calls, duration, sql, memory):
+        key = (name, blok)
+        if key not in self.measures:
+            self.measures[key] = dict(phase=name, blok=blok, calls=0,
+                                      duration=0., sql=0, memory=0)
+
+        measure = self.measures[key]
+        measure['calls'] += calls
+        measure['duration'] += duration
+        measure['sql'] += sql
+        measure['memory'] += memory
+
+    def merge(self, profiler):
+        """Add the measures of another profiler
+
+        :param profiler: StartupProfiler instance
+        """
+        for measure in profiler.measures.values():
+            self.add_measure(measure['phase'], measure['blok'],
+                             *[measure[x] for x in self.columns])
+
+    def check_sort_by(self, sort_by):
+        if sort_by not in self.columns:
+            raise StartupProfilerException(
+                "Unknown column %r to sort the report, the allowed columns "
+                "are %r" % (sort_by, self.columns))
+
+    def report(self, sort_by='duration'):
+        """Return the measures by phase and by blok
+
+        :param sort_by: column used to sort the report in descending order
+        :rtype: list of dict(phase, blok, calls, duration, sql, memory),
+            the duration is in seconds and the memory in bytes
+        :exception: StartupProfilerException
+        """
+        self.check_sort_by(sort_by)
+        return sorted((dict(measure) for measure in self.measures.values()),
+                      key=lambda measure: measure[sort_by], reverse=True)
+
+    def report_by_blok(self, sort_by='duration'):
+        """Return the measures of all the phases grouped by blok, the
+        phases without blok are grouped under ``None``
+
+        :param sort_by: column used to sort the report in descending order
+        :rtype: list of dict(blok, calls, duration, sql, memory)
+        :exception: StartupProfilerException
+        """
+        self.check_sort_by(sort_by)
+        bloks = OrderedDict()
+        for measure in self.measures.values():
+            blok = bloks.setdefault(measure['blok'], dict(
+                blok=measure['blok'], calls=0, duration=0., sql=0, memory=0))
+            for column in self.columns:
+                blok[column] += measure[column]
+
+        return sorted(bloks.values(), key=lambda blok: blok[sort_by],
+                      reverse=True)
+
+    def format(self, sort_by='duration', limit=None):
+        """Return the reports as text tables
+
+        :param sort_by: column used to sort the reports in descending order
+        :param limit: maximum number of rows by table
+        :rtype: str
+        """
+        def format_table(title, measures, with_phase=True):
+            table = Texttable(max_width=0)
+            header = ['Phase'] if with_phase else []
+            header += ['Blok', 'Calls', 'Time (ms)', 'SQL', 'Memory (KiB)']
+            table.set_cols_dtype(['t'] * len(header))
+            table.header(header)
+            for measure in measures[:limit]:
+                row = [measure['phase']] if with_phase else []
+                row += [measure['blok'] or '', measure['calls'],
+                        '%.2f' % (measure['duration'] * 1000),
+                        measure['sql'], '%.1f' % (measure['memory'] / 1024)]
+                table.add_row(row)
+
+            return '%s\n\n%s' % (title, table.draw())
+
+        return '\n\n'.join([
+            format_table('Phases', self.report(sort_by=sort_by)),
+            format_table('Bloks', self.report_by_blok(sort_by=sort_by),
+                         with_phase=False),
+        ])
@@ -8,16 +8,31 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from logging import getLogger
-from sqlalchemy import create_engine, event, MetaData
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import cycle
+from threading import RLock
+from time import time
+from sqlalchemy import create_engine, event, MetaData, and_, or_, select
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import (ProgrammingError, OperationalError,
                             InvalidRequestError)
 from sqlalchemy_utils.functions import database_exists
+from sqlalchemy.util import LRUCache
 from .config import Configuration, get_url
 from .migration import Migration
 from .blok import BlokManager
-from .environment import EnvironmentManager
+from .snapshot import (RegistrySnapshot, get_installed_bloks,
+                       get_bloks_fingerprint)
+from .profiler import no_profile_phase, StartupProfiler
+from .cache_backend import FileCacheBackend
+from .notification import (CacheInvalidationListener,
+                           is_notification_available)
+from .environment import EnvironmentManager, ScopedSession
 from .authorization.query import QUERY_WITH_NO_RESULTS, PostFilteredQuery
 from anyblok.common import anyblok_column_prefix, naming_convention
 from pkg_resources import iter_entry_points
@@ -89,6 +104,26 @@ class RegistryManager:
 
         registry = RegistryManager.get('my database')
 
+    The registries are built only once by database, even if several threads
+    get the same database at the same time, and can be loaded in parallel::
+
+        RegistryManager.preload(['db1', 'db2'], parallel=2)
+
+    If the ``registry_pool_size`` option is filled, only this number of
+    registries are kept loaded, the least recently used registry is disposed
+    when a new registry is loaded. A registry used in a scope is not
+    disposed before the end of the scope::
+
+        with RegistryManager.use('my database') as registry:
+            ...
+
+    The counters are returned by::
+
+        RegistryManager.get_stats()
+
+    If the ``share_registry_template`` option is filled, the registries
+    loaded without migration share the assembled models of a loaded registry
+    whose installed bloks are the same, see ``SharedRegistry``
     """
 
     loaded_bloks = {}
@@ -98,7 +133,11 @@ class RegistryManager:
     callback_assemble_entries = {}
     callback_initialize_entries = {}
     callback_unload_entries = {}
-    registries = {}
+    registries = OrderedDict()
+    loading_locks = {}
+    registries_lock = RLock()
+    stats = dict(hits=0, misses=0, evictions=0)
+    templates = {}
 
     @classmethod
     def has_blok(cls, blok):
@@ -140,21 +179,269 @@ class RegistryManager:
         :rtype: ``Registry``
         """
         EnvironmentManager.set('db_name', db_name)
-        if db_name in cls.registries:
-            if loadwithoutmigration and log_repeat:
-                logger.warning(
-                    "Ignoring loadwithoutmigration=True for database %r "
-                    "because its registry is already loaded", db_name)
-            return cls.registries[db_name]
-
-        _Registry = Configuration.get('Registry', Registry)
-        logger.info("Loading registry for database %r with class %r",
-                    db_name, _Registry)
-        registry = _Registry(
-            db_name, loadwithoutmigration=loadwithoutmigration, **kwargs)
-        cls.registries[db_name] = registry
+        registry = cls.registries.get(db_name)
+        if registry is None:
+            with cls.get_loading_lock(db_name):
+                # another thread may have built the registry while this one
+                # was waiting for the lock
+                registry = cls.registries.get(db_name)
+                if registry is None:
+                    with cls.registries_lock:
+                        cls.stats['misses'] += 1
+
+                    return cls.load_registry(
+                        db_name, loadwithoutmigration=loadwithoutmigration,
+                        **kwargs)
+
+        with cls.registries_lock:
+            cls.stats['hits'] += 1
+            if db_name in cls.registries:
+                cls.registries.move_to_end(db_name)
+
+        if loadwithoutmigration and log_repeat:
+            logger.warning(
+                "Ignoring loadwithoutmigration=True for database %r "
+                "because its registry is already loaded", db_name)
+
+        return registry
+
+    @classmethod
+    @contextmanager
+    def use(cls, db_name, **kwargs):
+        """ Return the registry of the database, the LRU pool does not
+        dispose it before the end of the scope::
+
+            with RegistryManager.use('my database') as registry:
+                ...
+
+        :param db_name: the name of the database linked to this registry
+        :rtype: ``Registry``
+        """
+        registry = cls.acquire(db_name, **kwargs)
+        try:
+            yield registry
+        finally:
+            cls.release(registry)
+
+    @classmethod
+    def acquire(cls, db_name, **kwargs):
+        """ Return the registry of the database and mark it as used, the LRU
+        pool does not dispose it until ``release`` is called
+
+        :param db_name: the name of the database linked to this registry
+        :rtype: ``Registry``
+        """
+        while True:
+            registry = cls.get(db_name, **kwargs)
+            with cls.registries_lock:
+                # the registry may have been evicted by another thread
+                # between the get and the lock
+                if cls.registries.get(db_name) is registry:
+                    registry.in_use += 1
+                    return registry
+
+    @classmethod
+    def release(cls, registry):
+        """ Mark the registry as not used anymore, it is disposed if its
+        eviction was deferred or if the pool is full
+
+        :param registry: ``Registry`` returned by ``acquire``
+        """
+        with cls.registries_lock:
+            registry.in_use -= 1
+            if registry.in_use:
+                return
+
+        if registry.evict_on_release:
+            cls.evict(registry.db_name)
+        else:
+            cls.evict_registries()
+
+    @classmethod
+    def get_loading_lock(cls, db_name):
+        """ Return the lock used to build the registry of the database
+
+        :param db_name: the name of the database
+        :rtype: ``threading.RLock``
+        """
+        with cls.registries_lock:
+            if db_name not in cls.loading_locks:
+                cls.loading_locks[db_name] = RLock()
+
+            return cls.loading_locks[db_name]
+
+    @classmethod
+    def load_registry(cls, db_name, **kwargs):
+        """ Create the Registry and add it in the registries dict, the
+        loading lock of the database must be acquired
+
+        :param db_name: the name of the database linked to this registry
+        :rtype: ``Registry``
+        """
+        registry = None
+        if (
+            kwargs.get('loadwithoutmigration') and
+            Configuration.get('share_registry_template')
+        ):
+            registry = cls.load_shared_registry(db_name, **kwargs)
+
+        if registry is None:
+            _Registry = Configuration.get('Registry', Registry)
+            logger.info("Loading registry for database %r with class %r",
+                        db_name, _Registry)
+            registry = _Registry(db_name, **kwargs)
+            cls.add_registry_template(registry)
+
+        with cls.registries_lock:
+            cls.registries[db_name] = registry
+
+        cls.evict_registries()
         return registry
 
+    @classmethod
+    def load_shared_registry(cls, db_name, **kwargs):
+        """ Create a ``SharedRegistry`` on the assembled models of the
+        registry which has the same installed bloks, the loading lock of the
+        database must be acquired
+
+        :param db_name: the name of the database linked to this registry
+        :rtype: ``SharedRegistry`` or None if no registry can be shared
+        """
+        with cls.registries_lock:
+            if not cls.templates:
+                return None
+
+        registry = SharedRegistry(db_name, **kwargs)
+        fingerprint = registry.get_bloks_fingerprint()
+        with cls.registries_lock:
+            template = cls.templates.get(fingerprint)
+
+        if template is None:
+            registry.close()
+            return None
+
+        logger.info("Loading registry for database %r with the models of "
+                    "the database %r", db_name, template.db_name)
+        registry.share(template)
+        return registry
+
+    @classmethod
+    def add_registry_template(cls, registry):
+        """ Keep the registry as the template of the next registries loaded
+        on the databases with the same installed bloks
+
+        :param registry: ``Registry`` instance
+        """
+        if not registry.share_template:
+            return
+
+        fingerprint = registry.get_bloks_fingerprint()
+        if fingerprint is None:
+            return
+
+        with cls.registries_lock:
+            cls.templates.setdefault(fingerprint, registry)
+
+    @classmethod
+    def remove_registry_template(cls, registry):
+        """ Do not use the registry as template anymore
+
+        :param registry: ``Registry`` instance
+        """
+        with cls.registries_lock:
+            for fingerprint, template in list(cls.templates.items()):
+                if template is registry:
+                    del cls.templates[fingerprint]
+
+    @classmethod
+    def evict_registries(cls):
+        """Dispose the least recently used registries, to keep only
+        ``registry_pool_size`` loaded registries"""
+        size = Configuration.get('registry_pool_size')
+        if not size:
+            return
+
+        with cls.registries_lock:
+            # the used registries and the most recently used one are kept,
+            # the pool is over its size until they are released
+            db_names = [db_name for db_name in list(cls.registries)[:-1]
+                        if not cls.registries[db_name].in_use]
+            db_names = db_names[:max(len(cls.registries) - size, 0)]
+
+        for db_name in db_names:
+            cls.evict(db_name)
+
+    @classmethod
+    def evict(cls, db_name):
+        """Dispose the registry of the database, the next ``get`` loads
+        a new registry. If the registry is used, it is disposed when it is
+        released
+
+        :param db_name: the name of the database
+        """
+        with cls.registries_lock:
+            registry = cls.registries.get(db_name)
+            if registry is None:
+                return
+
+            if registry.in_use:
+                logger.info("The registry of the database %r is used, it "
+                            "will be evicted when released", db_name)
+                registry.evict_on_release = True
+                return
+
+            cls.registries.pop(db_name)
+            cls.stats['evictions'] += 1
+
+        logger.info("Evict the registry of the database %r", db_name)
+        registry.dispose()
+
+    @classmethod
+    def get_stats(cls):
+        """Return the counters of the registries
+
+        :rtype: dict(hits, misses, evictions, size)
+        """
+        with cls.registries_lock:
+            return dict(cls.stats, size=len(cls.registries))
+
+    @classmethod
+    def reset_stats(cls):
+        """Reset the hits, misses and evictions counters"""
+        with cls.registries_lock:
+            cls.stats = dict(hits=0, misses=0, evictions=0)
+
+    @classmethod
+    def preload(cls, db_names, parallel=None, **kwargs):
+        """ Load and commit the registries of the databases
+
+        ::
+
+            registries = RegistryManager.preload(['db1', 'db2'], parallel=2)
+
+        :param db_names: the names of the databases
+        :param parallel: number of registries loaded at the same time, by
+            default the ``preload_parallel`` option
+        :rtype: dict {db_name: ``Registry``}
+        """
+        if parallel is None:
+            parallel = Configuration.get('preload_parallel') or 1
+
+        def load(db_name):
+            registry = cls.get(db_name, **kwargs)
+            registry.commit()
+            return registry
+
+        if parallel <= 1:
+            return {db_name: load(db_name) for db_name in db_names}
+
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = {db_name: executor.submit(load, db_name)
+                       for db_name in db_names}
+
+        return {db_name: future.result()
+                for db_name, future in futures.items()}
+
     @classmethod
     def reload(cls):
         """ Reload the blok
@@ -163,7 +450,12 @@ class RegistryManager:
         file
 
         """
-        for registry in cls.registries.values():
+        for registry in list(cls.registries.values()):
+            if registry.template is not None:
+                # the shared registry is loaded again by the next get
+                registry.close()
+                continue
+
             registry.close_session()
             registry.Session = None
             registry.blok_list_is_loaded = False
@@ -423,6 +715,94 @@ class RegistryManager:
             del cls.loaded_bloks[blok]['properties'][property_]
 
 
+class NamespaceType(type):
+    """ Type of the intermediate namespaces added in the registry
+
+    The models not assembled yet by the lazy assembly are assembled at the
+    first access::
+
+        registry.System.Blok
+    """
+
+    def __getattr__(cls, attribute):
+        namespace = '%s.%s' % (cls.__namespace__, attribute)
+        registry = cls.__registry__
+        if namespace in registry.lazy_namespaces:
+            registry.assemble_lazy_namespace(namespace)
+            return getattr(cls, attribute)
+
+        raise AttributeError(attribute)
+
+
+class LazyNamespaceDescriptor:
+    """ Descriptor added on an assembled model for each sub namespace not
+    assembled yet by the lazy assembly, the descriptor is replaced by the
+    model at the first access
+    """
+
+    def __init__(self, registry, namespace):
+        self.registry = registry
+        self.namespace = namespace
+
+    def __get__(self, instance, owner):
+        if self.namespace in self.registry.lazy_namespaces:
+            return self.registry.get(self.namespace)
+
+        return self.registry.loaded_namespaces.get(self.namespace)
+
+
+class SessionAttributeDescriptor:
+    """ Descriptor of the registry which returns the attribute of the
+    session of the current scope without ``Registry.__getattr__``, used for
+    the session methods called on the hot paths::
+
+        registry.add(instance)
+
+    The bound method is not cached: the session depends on the scope
+    (thread or asyncio task) and is replaced by ``Session.remove()``, a
+    cache would need a lookup by session, which costs the same as the call
+    of ``Session()`` (a ``threading.local`` attribute or a dict lookup)
+    """
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+
+    def __get__(self, registry, owner):
+        if registry is None:
+            return self
+
+        Session = registry.Session
+        if Session is None:
+            # Registry.__getattr__ raises the AttributeError
+            raise AttributeError(self.attribute)
+
+        return getattr(Session(), self.attribute)
+
+
+class SharedRegistryDescriptor:
+    """ Descriptor of the ``registry`` attribute of the models when they
+    are shared by several databases, it returns the registry of the current
+    database (``db_name`` in the environment)
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __get__(self, instance, owner):
+        db_name = EnvironmentManager.get('db_name')
+        if db_name == self.registry.db_name:
+            return self.registry
+
+        registry = self.registry.tenants.get(db_name)
+        if registry is None:
+            raise RegistryException(
+                "The models of the database %r are not shared with the "
+                "database %r, its registry must be got with "
+                "RegistryManager.get" % (self.registry.db_name, db_name))
+
+        return registry
+
+
 class Registry:
     """ Define one registry
 
@@ -432,24 +812,135 @@ class Registry:
         registry = Registry('My database')
     """
 
+    template = None
+    in_use = 0
+    evict_on_release = False
+    query = SessionAttributeDescriptor('query')
+    add = SessionAttributeDescriptor('add')
+    add_all = SessionAttributeDescriptor('add_all')
+    merge = SessionAttributeDescriptor('merge')
+    begin_nested = SessionAttributeDescriptor('begin_nested')
+    connection = SessionAttributeDescriptor('connection')
+    no_autoflush = SessionAttributeDescriptor('no_autoflush')
+
     def __init__(self, db_name, loadwithoutmigration=False, unittest=False,
                  **kwargs):
+        self.share_template = Configuration.get(
+            'share_registry_template', False)
+        self.init_database(db_name, loadwithoutmigration=loadwithoutmigration,
+                           unittest=unittest, **kwargs)
+        self.withoutautomigration = Configuration.get('withoutautomigration')
+        self.batch_install_bloks = Configuration.get(
+            'batch_install_bloks', False)
+        self.lazy_model_assembly = Configuration.get(
+            'lazy_model_assembly', False)
+        self.ini_var()
+        self.init_snapshot()
+        try:
+            self.pre_assemble_entries()
+            with self.profile_phase('Registry.load'):
+                self.load()
+        finally:
+            if self.startup_profiler is not None:
+                self.startup_profiler.stop()
+
+        self.init_cache_listener()
+
+    def init_database(self, db_name, loadwithoutmigration=False,
+                      unittest=False, **kwargs):
+        """Initialize the engines, the bind and the session state of the
+        database, before loading or sharing the models
+
+        :param db_name: name of the database to link
+        """
         self.db_name = db_name
+        self.tenants = {}
+        self.cache_listener = None
+        # True once the table of System.CacheWatermark is found, and
+        # (last_cache_id, time) of the last save of the watermark
+        self.cache_watermark_table = None
+        self.cache_watermark = None
         self.loadwithoutmigration = loadwithoutmigration
         self.unittest = unittest
         self.additional_setting = kwargs
         self.init_engine(db_name=db_name)
+        self.init_replica_engines()
+        self.init_cache_backend()
+        self.init_startup_profiler()
         self.init_bind()
         self.registry_base = type("RegistryBase", tuple(), {
-            'registry': self,
+            'registry': (SharedRegistryDescriptor(self)
+                         if self.share_template else self),
             'Env': EnvironmentManager})
-        self.withoutautomigration = Configuration.get('withoutautomigration')
-        self.ini_var()
         self.Session = None
         self.nb_query_bases = self.nb_session_bases = 0
         self.blok_list_is_loaded = False
-        self.pre_assemble_entries()
-        self.load()
+
+    def init_cache_listener(self):
+        """Start the listener of the invalidations of the cache sent by the
+        other processes, only if the ``cache_invalidation_notify`` option is
+        filled and if the database can send the notifications, else the
+        invalidations are found by polling the ``System.Cache`` table"""
+        if not Configuration.get('cache_invalidation_notify', False):
+            return
+
+        if not is_notification_available(self.engine):
+            logger.warning("The database %r can not notify the invalidations "
+                           "of the cache, they are found by polling",
+                           self.db_name)
+            return
+
+        self.cache_listener = CacheInvalidationListener(self)
+        self.cache_listener.start()
+
+    def init_cache_backend(self):
+        """Initialize the store of the cached classmethods shared by the
+        processes, only if the ``cache_backend_path`` option is filled"""
+        path = Configuration.get('cache_backend_path')
+        self.cache_backend = None
+        if path:
+            self.cache_backend = Configuration.get(
+                'CacheBackend', FileCacheBackend)(path)
+
+    def init_snapshot(self):
+        """Initialize the on-disk snapshot of the registry, only if the
+        ``registry_snapshot_dir`` option is filled"""
+        directory = Configuration.get('registry_snapshot_dir')
+        self.snapshot = None
+        if directory:
+            self.snapshot = RegistrySnapshot(self, directory)
+
+    def init_startup_profiler(self):
+        """Initialize the profiler of the start of the registry, only if
+        the ``profile_startup`` option is filled. The measures of the last
+        ``BlokManager.load`` are added to the registry's measures"""
+        self.startup_profiler = None
+        if Configuration.get('profile_startup', False):
+            self.startup_profiler = StartupProfiler()
+            if BlokManager.startup_profiler is not None:
+                self.startup_profiler.merge(BlokManager.startup_profiler)
+
+            self.startup_profiler.start(self.engine)
+
+    @property
+    def startup_profile(self):
+        """Return the measures of the start of the registry by phase and
+        by blok, sorted by duration, None if the start is not profiled"""
+        if self.startup_profiler is None:
+            return None
+
+        return self.startup_profiler.report()
+
+    def profile_phase(self, name, blok=None):
+        """Return a context manager to measure a phase of the start
+
+        :param name: name of the phase
+        :param blok: name of the blok concerned by the phase
+        """
+        if self.startup_profiler is None:
+            return no_profile_phase()
+
+        return self.startup_profiler.phase(name, blok=blok)
 
     def init_bind(self):
         """Initialize the bind"""
@@ -487,11 +978,99 @@ class Registry:
         kwargs = self.init_engine_options(url)
         self.rw_engine = create_engine(url, **kwargs)
 
+    def init_replica_engines(self):
+        """Define the engines of the read-only replicas, only if the
+        ``db_replica_urls`` option is filled. Each replica has its own pool
+        """
+        self.replica_engines = []
+        self.unavailable_replicas = {}
+        for url in Configuration.get('db_replica_urls') or []:
+            url = make_url(url)
+            kwargs = self.init_engine_options(url)
+            self.replica_engines.append(create_engine(url, **kwargs))
+
+        self.replica_cycle = cycle(self.replica_engines)
+
     @property
     def engine(self):
         """property to get the engine"""
         return self.rw_engine
 
+    def get_replica_engine(self):
+        """Return the next available replica engine, the replicas are
+        used in round robin
+
+        :rtype: engine or None if no replica is available
+        """
+        now = time()
+        for i in range(len(self.replica_engines)):
+            engine = next(self.replica_cycle)
+            if self.unavailable_replicas.get(engine, 0) <= now:
+                return engine
+
+        return None
+
+    def set_replica_unavailable(self, engine):
+        """Do not use the replica during ``db_replica_retry_delay``
+        seconds, the queries go to the next replica or to the primary
+
+        :param engine: engine of the replica
+        """
+        delay = Configuration.get('db_replica_retry_delay', 30)
+        logger.warning("The replica %r is unavailable, it will not be used "
+                       "during %r seconds", engine.url, delay)
+        self.unavailable_replicas[engine] = time() + delay
+
+    @contextmanager
+    def on_replica(self):
+        """Run the select queries of the scope on the replicas::
+
+            with registry.on_replica():
+                registry.System.Blok.query().all()
+
+        The flushes, the commits and the queries with ``with_for_update``
+        always go to the primary
+        """
+        previous = EnvironmentManager.get('on_replica', False)
+        EnvironmentManager.set('on_replica', True)
+        try:
+            yield
+        finally:
+            EnvironmentManager.set('on_replica', previous)
+
+    def get_async_registry(self, executor=None):
+        """Return the asyncio facade of the registry, the queries are
+        executed in the threads of the executor::
+
+            aregistry = registry.get_async_registry()
+            await aregistry.System.Blok.query().all()
+            await aregistry.commit()
+
+        :param executor: ``concurrent.futures.Executor``, by default the
+            executor of the event loop
+        :rtype: ``anyblok.aio.AsyncRegistry``
+        """
+        from .aio import AsyncRegistry
+        return AsyncRegistry(self, executor=executor)
+
+    def create_async_session_factory(self, executor=None):
+        """Return the factory of the asyncio sessions, the asyncio
+        counterpart of ``create_session_factory``. SQLAlchemy 1.3 has no
+        asyncio session, the session of the task is used in the threads of
+        the executor::
+
+            async_session = registry.create_async_session_factory()
+            async with async_session() as session:
+                await session.execute(query)
+                await session.commit()
+
+        :param executor: ``concurrent.futures.Executor``, by default the
+            executor of the event loop
+        :rtype: callable which returns an ``anyblok.aio.AsyncSession``
+        """
+        from .aio import AsyncSession
+        return partial(AsyncSession, self.get_async_registry(executor))
+
     def ini_var(self):
         """ Initialize the var to load the registry """
         self.loaded_namespaces = {}
@@ -508,8 +1087,15 @@ class Registry:
         self.removed = []
         EnvironmentManager.set('_precommit_hook', [])
         EnvironmentManager.set('_postcommit_hook', [])
+        self.clear_cache_invalidations()
         self._sqlalchemy_known_events = []
+        self.sqlalchemy_known_events_listened = False
+        self.lazy_namespaces = {}
         self.expire_attributes = {}
+        self.loaded_from_snapshot = False
+        # the INSERT queries of multi_insert without the ORM
+        self.insert_queries = LRUCache(100)
+        self.insert_compiled_cache = LRUCache(100)
 
         # key = tablename
         # value = True if all table else list of columns names
@@ -523,14 +1109,16 @@ class Registry:
         url = Configuration.get('get_url', get_url)(db_name=db_name)
         return database_exists(url)
 
-    def listen_sqlalchemy_known_event(self):
-        for e, namespace, method in self._sqlalchemy_known_events:
+    def listen_sqlalchemy_known_event(self, start=0):
+        for e, namespace, method in self._sqlalchemy_known_events[start:]:
             if hasattr(method, 'get_attribute'):
                 method = method.get_attribute(self)
 
             event.listen(e.mapper(self, namespace, usehybrid=False), e.event,
                          method, *e.args, **e.kwargs)
 
+        self.sqlalchemy_known_events_listened = True
+
     def remove_sqlalchemy_known_event(self):
         for e, namespace, method in self._sqlalchemy_known_events:
             try:
@@ -549,6 +1137,9 @@ class Registry:
         :rtype: namespace cls
         :exception: RegistryManagerException
         """
+        if namespace in self.lazy_namespaces:
+            self.assemble_lazy_namespace(namespace)
+
         if namespace not in self.loaded_namespaces:
             raise RegistryManagerException(
                 "No namespace %r loaded" % namespace)
@@ -556,7 +1147,59 @@ class Registry:
         return self.loaded_namespaces[namespace]
 
     def has(self, namespace):
-        return True if namespace in self.loaded_namespaces else False
+        if namespace in self.loaded_namespaces:
+            return True
+
+        return True if namespace in self.lazy_namespaces else False
+
+    def is_lazy_assembly(self):
+        """ Return True if the models must be assembled at the first access
+
+        The lazy assembly is only used when the registry is loaded without
+        migration, the migration needs all the models
+        """
+        return bool(self.lazy_model_assembly and self.loadwithoutmigration)
+
+    def assemble_lazy_namespace(self, namespace):
+        """ Assemble the model of the namespace and all the models linked
+        to it, (inheritance, relationships, sub namespaces)
+
+        :param namespace: the namespace of the model
+        """
+        namespaces = set()
+        todo = [namespace]
+        while todo:
+            ns = todo.pop()
+            if ns in namespaces or ns not in self.lazy_namespaces:
+                continue
+
+            namespaces.add(ns)
+            todo.extend(self.lazy_namespaces[ns])
+
+        for ns in namespaces:
+            del self.lazy_namespaces[ns]
+
+        nb_events = len(self._sqlalchemy_known_events)
+        for ns in self.loaded_registries['Model_names']:
+            if ns in namespaces:
+                logger.debug('Lazy assembly of %r', ns)
+                self.lazy_assemble_callback(self, ns)
+
+        for ns in self.lazy_namespaces:
+            parent, child = ns.rsplit('.', 1)
+            if parent in namespaces:
+                setattr(self.loaded_namespaces[parent], child,
+                        LazyNamespaceDescriptor(self, ns))
+
+        if self.sqlalchemy_known_events_listened:
+            self.listen_sqlalchemy_known_event(start=nb_events)
+
+    def assemble_lazy_namespaces(self):
+        """ Assemble all the models not assembled yet, the registry is
+        the same as without lazy assembly
+        """
+        while self.lazy_namespaces:
+            self.assemble_lazy_namespace(next(iter(self.lazy_namespaces)))
 
     def get_bloks_by_states(self, *states):
         """ Return the bloks in these states
@@ -583,6 +1226,30 @@ class Registry:
 
         return []
 
+    def get_bloks_states(self):
+        """ Return the states of all the bloks known by the database
+
+        :rtype: list of (blok's name, state, installed version)
+        """
+        query = """SELECT name, state, installed_version"""
+        query += """ FROM system_blok ORDER BY "order", name"""
+        try:
+            return self.execute(query, fetchall=True)
+        except (ProgrammingError, OperationalError, PyODBCProgrammingError):
+            # During the first connection the database is empty
+            return []
+
+    def get_bloks_fingerprint(self):
+        """ Return the fingerprint of the installed bloks of the database
+
+        :rtype: hexadecimal string or None if one blok must be changed
+        """
+        installed = get_installed_bloks(self.get_bloks_states())
+        if installed is None:
+            return None
+
+        return get_bloks_fingerprint(installed)
+
     def get_bloks_to_load(self):
         """ Return the bloks to load by the registry
 
@@ -763,20 +1430,22 @@ class Registry:
         if blok not in BlokManager.bloks:
             return False
 
-        b = BlokManager.bloks[blok](self)
-        self.load_bloks(b.required + b.conditional, toinstall, toload)
-        self.load_bloks(b.optional, toinstall, toload, required=False)
+        with self.profile_phase('Registry.load_bloks', blok=blok):
+            b = BlokManager.bloks[blok](self)
+            self.load_bloks(b.required + b.conditional, toinstall, toload)
+            self.load_bloks(b.optional, toinstall, toload, required=False)
 
-        for core in RegistryManager.declared_cores:
-            self.load_core(blok, core)
+            for core in RegistryManager.declared_cores:
+                self.load_core(blok, core)
 
-        for entry in RegistryManager.declared_entries:
-            self.load_entry(blok, entry)
+            for entry in RegistryManager.declared_entries:
+                self.load_entry(blok, entry)
+
+            self.load_properties(blok)
+            self.load_removed(blok)
+            self.loaded_bloks[blok] = b
+            self.ordered_loaded_bloks.append(blok)
 
-        self.load_properties(blok)
-        self.load_removed(blok)
-        self.loaded_bloks[blok] = b
-        self.ordered_loaded_bloks.append(blok)
         logger.debug("Blok %r loaded" % blok)
         return True
 
@@ -850,7 +1519,17 @@ class Registry:
         if hasattr(parent, child) and getattr(parent, child):
             return getattr(parent, child)
 
-        tmpns = type(child, tuple(), {'children_namespaces': {}})
+        if parent is self:
+            namespace = 'Model'
+        else:
+            namespace = getattr(parent, '__namespace__', None) or getattr(
+                parent, '__registry_name__', None)
+
+        tmpns = NamespaceType(child, tuple(), {
+            'children_namespaces': {},
+            '__registry__': self,
+            '__namespace__': '%s.%s' % (namespace, child),
+        })
         if hasattr(parent, 'children_namespaces'):
             parent.children_namespaces[child] = tmpns
 
@@ -917,7 +1596,7 @@ class Registry:
             extension = self.additional_setting.get('sa.session.extension')
             if extension:
                 extension = extension()
-            self.Session = scoped_session(
+            self.Session = ScopedSession(
                 sessionmaker(bind=bind, class_=Session, extension=extension),
                 EnvironmentManager.scoped_function_for_session())
 
@@ -950,32 +1629,39 @@ class Registry:
         Update Blok, Model, Column rows
         """
         mustreload = False
-        blok2install = None
+        bloks2install = []
         try:
             self.declarativebase = declarative_base(
                 metadata=MetaData(naming_convention=naming_convention),
                 class_registry=dict(registry=self))
-            toload = self.get_bloks_to_load()
-            toinstall = self.get_bloks_to_install(toload)
-            if self.update_to_install_blok_dependencies_state(toinstall):
-                toinstall = self.get_bloks_to_install(toload)
+            toload, toinstall = self.get_bloks_to_load_and_to_install()
             if self.loadwithoutmigration and not toload and toinstall:
                 logger.warning("Impossible to use loadwithoumigration")
                 self.loadwithoutmigration = False
 
             self.load_bloks(toload, False, toload)
             if toinstall and not self.loadwithoutmigration:
-                blok2install = toinstall[0]
-                self.load_blok(blok2install, True, toload)
+                if self.batch_install_bloks:
+                    # the dependencies are already in toinstall, all the
+                    # bloks are installed with only one assembly
+                    bloks2install = toinstall
+                else:
+                    bloks2install = toinstall[:1]
+
+                for blok2install in bloks2install:
+                    self.load_blok(blok2install, True, toload)
 
             instrumentedlist_base = [] + self.loaded_cores['InstrumentedList']
             instrumentedlist_base += [list]
             self.InstrumentedList = type(
                 'InstrumentedList', tuple(instrumentedlist_base), {})
             self.assemble_entries()
-            self.create_session_factory()
+            with self.profile_phase('Registry.create_session_factory'):
+                self.create_session_factory()
+
+            with self.profile_phase('Registry.apply_model_schema_on_table'):
+                self.apply_model_schema_on_table(bloks2install)
 
-            self.apply_model_schema_on_table(blok2install)
             self.listen_sqlalchemy_known_event()
             mustreload = self.is_reload_needed() or mustreload
 
@@ -983,13 +1669,47 @@ class Registry:
             self.close()
             raise e
 
-        if len(toinstall) > 1 or mustreload:
+        if len(toinstall) > len(bloks2install) or mustreload:
             self.reload()
         else:
             self.System.Blok.load_all()
+            if self.must_save_snapshot():
+                # the snapshot is saved only if the data are commited
+                self.postcommit_hook('Model.System.Model',
+                                     'save_registry_snapshot')
 
         self.loadwithoutmigration = False
 
+    def get_bloks_to_load_and_to_install(self):
+        """ Return the bloks to load and the bloks to install, from the
+        snapshot if it is up to date else from the database
+
+        :rtype: tuple (list of blok's name, list of blok's name)
+        """
+        if self.snapshot is not None and self.snapshot.is_up_to_date():
+            logger.info("Load the registry from the snapshot %r",
+                        self.snapshot.path)
+            self.loaded_from_snapshot = True
+            return self.snapshot.bloks, []
+
+        toload = self.get_bloks_to_load()
+        toinstall = self.get_bloks_to_install(toload)
+        if self.update_to_install_blok_dependencies_state(toinstall):
+            toinstall = self.get_bloks_to_install(toload)
+
+        return toload, toinstall
+
+    def must_save_snapshot(self):
+        """Return True if the snapshot of the registry must be saved"""
+        if self.snapshot is None or self.loaded_from_snapshot:
+            return False
+
+        if self.loadwithoutmigration or self.withoutautomigration:
+            # the System models have not been updated
+            return False
+
+        return True
+
     def apply_session_events(self):
         """Add session events
 
@@ -1010,7 +1730,8 @@ class Registry:
         for entry in RegistryManager.declared_entries:
             if entry in RegistryManager.callback_assemble_entries:
                 logger.debug('Assemble %r entry' % entry)
-                RegistryManager.callback_assemble_entries[entry](self)
+                with self.profile_phase('Registry.assemble_entries.' + entry):
+                    RegistryManager.callback_assemble_entries[entry](self)
 
     def pre_assemble_entries(self):
         for entry in RegistryManager.declared_entries:
@@ -1018,7 +1739,11 @@ class Registry:
                 logger.debug('Pre assemble %r entry' % entry)
                 RegistryManager.callback_pre_assemble_entries[entry](self)
 
-    def apply_model_schema_on_table(self, blok2install):
+    def apply_model_schema_on_table(self, bloks2install):
+        """ Apply the migration of the models on the database
+
+        :param bloks2install: list of the bloks to install
+        """
         # replace the engine by the session.connection for bind attribute
         # because session.connection is already the connection use
         # by blok, migration and all write on the data base
@@ -1029,19 +1754,24 @@ class Registry:
         if self.loadwithoutmigration:
             return
 
-        if not self.withoutautomigration and blok2install == 'anyblok-core':
+        if not self.withoutautomigration and 'anyblok-core' in bloks2install:
             self.declarativebase.metadata.tables['system_blok'].create(
                 bind=self.connection(), checkfirst=True)
 
         self.migration = Configuration.get('Migration', Migration)(self)
-        query = """
-            SELECT name, installed_version
-            FROM system_blok
-            WHERE
-                (state = 'toinstall' AND name = '%s')
-                OR state = 'toupdate'""" % blok2install
-        res = self.execute(query, fetchall=True)
+        system_blok = self.declarativebase.metadata.tables['system_blok']
+        where_clause = system_blok.c.state == 'toupdate'
+        if bloks2install:
+            where_clause = or_(where_clause, and_(
+                system_blok.c.state == 'toinstall',
+                system_blok.c.name.in_(bloks2install)))
+
+        query = select([system_blok.c.name, system_blok.c.installed_version])
+        res = self.execute(query.where(where_clause), fetchall=True)
         if res:
+            # the migration hooks are called in the order of the dependencies
+            order = {x: i for i, x in enumerate(self.ordered_loaded_bloks)}
+            res.sort(key=lambda x: order.get(x[0], len(order)))
             for blok, installed_version in res:
                 b = BlokManager.get(blok)(self)
                 parsed_version = (
@@ -1064,8 +1794,12 @@ class Registry:
                     else None)
                 b.post_migration(parsed_version)
 
+            self.migration.save_schema_fingerprint()
+        elif self.migration.is_schema_up_to_date():
+            logger.debug('The schema is up to date, no migration')
         else:
             self.migration.auto_upgrade_database()
+            self.migration.save_schema_fingerprint()
 
     def is_reload_needed(self):
 
@@ -1078,8 +1812,12 @@ class Registry:
         for entry in RegistryManager.declared_entries:
             if entry in RegistryManager.callback_initialize_entries:
                 logger.debug('Initialize %r entry' % entry)
-                r = RegistryManager.callback_initialize_entries[entry](
-                    self)
+                with self.profile_phase(
+                    'Registry.initialize_entries.' + entry
+                ):
+                    r = RegistryManager.callback_initialize_entries[entry](
+                        self)
+
                 mustreload = mustreload or r
 
         return mustreload
@@ -1170,6 +1908,15 @@ class Registry:
         self.session.rollback(*args, **kwargs)
         EnvironmentManager.set('_precommit_hook', [])
         EnvironmentManager.set('_postcommit_hook', [])
+        self.clear_cache_invalidations()
+
+    def clear_cache_invalidations(self):
+        """ Drop the invalidations of the cache of this database which are
+        not saved yet, the invalidations are kept by database in the
+        environment """
+        pending = EnvironmentManager.get('_cache_invalidations')
+        if pending:
+            pending.pop(self.db_name, None)
 
     def close_session(self):
         """ Close only the session, not the registry
@@ -1192,12 +1939,66 @@ class Registry:
 
     def close(self):
         """Release the session, connection and engine"""
+        if self.cache_listener is not None:
+            self.cache_listener.stop()
+            self.cache_listener = None
+
+        if self.cache_backend is not None and self.template is None:
+            # the backend of a shared registry belongs to the template
+            self.cache_backend.close()
+
         self.close_session()
         self.engine.dispose()
-        if self.db_name in RegistryManager.registries:
-            del RegistryManager.registries[self.db_name]
+        for engine in self.replica_engines:
+            engine.dispose()
+
+        with RegistryManager.registries_lock:
+            RegistryManager.registries.pop(self.db_name, None)
+
+        RegistryManager.remove_registry_template(self)
+
+    def unshare(self):
+        """Stop sharing the models with the other databases, their
+        registries are closed and are loaded again by the next get"""
+        RegistryManager.remove_registry_template(self)
+        for tenant in list(self.tenants.values()):
+            tenant.close()
+
+    def dispose(self):
+        """Close the registry and unmap the classes of the models, the
+        registry can not be used anymore. The classes are kept if they are
+        shared with other databases"""
+        if self.tenants:
+            self.close()
+            return
+
+        self.remove_sqlalchemy_known_event()
+        self.close()
+        for Model in self.loaded_namespaces.values():
+            mapper = getattr(Model, '__mapper__', None)
+            if mapper is not None:
+                mapper.dispose()
+
+        self.clean_model()
+        self.loaded_namespaces = {}
+        self.lazy_namespaces = {}
+        self.children_namespaces = {}
+        self.declarativebase = None
+
+    @property
+    def session(self):
+        """Return the session of the current scope"""
+        if self.Session is None:
+            raise AttributeError('session')
+
+        return self.Session()
 
     def __getattr__(self, attribute):
+        namespace = 'Model.' + attribute
+        if namespace in self.__dict__.get('lazy_namespaces', ()):
+            self.assemble_lazy_namespace(namespace)
+            return getattr(self, attribute)
+
         # TODO safe the call of session for reload
         if self.Session:
             session = self.Session()
@@ -1268,18 +2069,28 @@ class Registry:
         EnvironmentManager.set('_postcommit_hook', _postcommit_hook)
 
     def apply_precommit_hook(self):
-        hooks = []
-        _precommit_hook = EnvironmentManager.get('_precommit_hook')
-        if _precommit_hook:
-            hooks.extend(_precommit_hook)
+        """ Call the precommit hooks until none is left, the hooks added by
+        a hook or by the events of the flush of the session (like the
+        invalidations of the cache) are called too
+        """
+        while True:
+            _precommit_hook = EnvironmentManager.get('_precommit_hook')
+            while _precommit_hook:
+                hook = _precommit_hook[0]
+                Model = self.loaded_namespaces[hook[0]]
+                method = hook[1]
+                a = hook[2]
+                kw = hook[3]
+                getattr(Model, method)(*a, **kw)
+                if hook in _precommit_hook:
+                    _precommit_hook.remove(hook)
 
-        for hook in hooks:
-            Model = self.loaded_namespaces[hook[0]]
-            method = hook[1]
-            a = hook[2]
-            kw = hook[3]
-            getattr(Model, method)(*a, **kw)
-            _precommit_hook.remove(hook)
+            if self.Session is None:
+                return
+
+            self.flush()
+            if not EnvironmentManager.get('_precommit_hook'):
+                return
 
     def apply_postcommit_hook(self, withexception=False):
         hooks = []
@@ -1324,8 +2135,9 @@ class Registry:
             raise e
 
     def flush(self):
-        if not self.session._flushing:
-            self.session.flush()
+        session = self.session
+        if not session._flushing:
+            session.flush()
 
     def session_commit(self, *args, **kwargs):
         if self.Session:
@@ -1334,7 +2146,7 @@ class Registry:
 
     def clean_model(self):
         """ Clean the registry of all the namespaces """
-        for model in self.loaded_namespaces.keys():
+        for model in list(self.loaded_namespaces) + list(self.lazy_namespaces):
             name = model.split('.')[1]
             if hasattr(self, name) and getattr(self, name):
                 setattr(self, name, None)
@@ -1349,6 +2161,13 @@ class Registry:
     def reload(self):
         """ Reload the registry, close session, clean registry, reinit var """
         # self.close_session()
+        self.unshare()
+        Cache = self.loaded_namespaces.get('Model.System.Cache')
+        if Cache is not None and EnvironmentManager.get(
+                '_cache_invalidations', {}).get(self.db_name):
+            # ini_var drops the invalidations which are not saved yet
+            Cache.flush_invalidations()
+
         self.remove_sqlalchemy_known_event()
         self.clean_model()
         self.ini_var()
@@ -1472,3 +2291,87 @@ class Registry:
         if not self.blok_list_is_loaded:
             self.System.Blok.update_list()
             self.blok_list_is_loaded = True
+
+
+class SharedRegistry(Registry):
+    """ Registry of a database which uses the assembled models of the
+    registry of another database with the same installed bloks (the
+    template). The engine, the bind and the session belong to the database,
+    the models, the mappers and the metadata are the template's ones::
+
+        registry = SharedRegistry('my database')
+        registry.share(template)
+
+    The ``registry`` attribute of the models returns the registry of the
+    current database, the databases must be switched with
+    ``RegistryManager.get``. The installed bloks can not be changed, a
+    reload of the template closes the shared registries
+    """
+
+    def __init__(self, db_name, loadwithoutmigration=True, unittest=False,
+                 **kwargs):
+        self.share_template = False
+        self.init_database(db_name, loadwithoutmigration=loadwithoutmigration,
+                           unittest=unittest, **kwargs)
+        self.snapshot = None
+        self.loaded_from_snapshot = False
+        self.migration = None
+        self.last_cache_id = None
+
+    def init_cache_backend(self):
+        """The backend of the cache is the template's one"""
+        self.cache_backend = None
+
+    def init_startup_profiler(self):
+        """The start of a shared registry is not profiled"""
+        self.startup_profiler = None
+
+    def share(self, template):
+        """ Use the assembled models of the template
+
+        :param template: ``Registry`` instance
+        """
+        template.assemble_lazy_namespaces()
+        self.template = template
+        self.cache_backend = template.cache_backend
+        template.tenants[self.db_name] = self
+        try:
+            self.create_session_factory()
+            self.System.Blok.load_all()
+        except Exception as e:
+            self.close()
+            raise e
+
+        self.loadwithoutmigration = False
+        self.init_cache_listener()
+
+    def __getattr__(self, attribute):
+        template = self.__dict__.get('template')
+        if template is not None and attribute in template.__dict__:
+            return template.__dict__[attribute]
+
+        return super(SharedRegistry, self).__getattr__(attribute)
+
+    def close(self):
+        """Release the session, connection and engine, the models stay
+        in the template"""
+        super(SharedRegistry, self).close()
+        if self.template is not None:
+            self.template.tenants.pop(self.db_name, None)
+
+    def dispose(self):
+        """Close the registry, the models are not unmapped because they
+        belong to the template"""
+        self.close()
+
+    def reload(self):
+        raise RegistryException(
+            "The registry of the database %r shares the models of the "
+            "database %r, it can not be reloaded" % (
+                self.db_name, self.template.db_name))
+
+    def upgrade(self, install=None, update=None, uninstall=None):
+        raise RegistryException(
+            "The registry of the database %r shares the models of the "
+            "database %r, the bloks can not be changed" % (
+                self.db_name, self.template.db_name))
@@ -73,6 +73,20 @@ Configuration.add_application_properties(
                   "an interactive ipython one.")
 )
 
+Configuration.add_application_properties(
+    'startup_profile', ['logging', 'startup-profile'],
+    prog='AnyBlok startup profile, version %r' % version,
+    description="Load the registry and display the time, the SQL statements "
+                "and the memory of each phase and each blok of the start"
+)
+
+Configuration.add_application_properties(
+    'compact_cache', ['logging'],
+    prog='AnyBlok cache compaction, version %r' % version,
+    description="Remove the invalidations of the cache known by all the "
+                "processes from the System.Cache table"
+)
+
 Configuration.add_application_properties(
     'autodoc', ['logging', 'doc', 'schema'],
     prog='AnyBlok auto documentation, version %r' % version,
@@ -171,6 +185,35 @@ def anyblok_interpreter():
                 code.interact(local=locals())
 
 
+def anyblok_startup_profile():
+    """Display the profile of the start of the registry
+    """
+    load_init_function_from_entry_points()
+    Configuration.load('startup_profile')
+    configuration_post_load()
+    Configuration.set('profile_startup', True)
+    BlokManager.load()
+    registry = RegistryManager.get(get_db_name())
+    if registry:
+        print(registry.startup_profiler.format(
+            sort_by=Configuration.get('profile_sort_by', 'duration'),
+            limit=Configuration.get('profile_limit')))
+        # the profile does not commit what the start may have changed
+        registry.rollback()
+        registry.close()
+
+
+def anyblok_compact_cache():
+    """Remove the invalidations of the cache known by all the processes
+    """
+    registry = anyblok.start('compact_cache', loadwithoutmigration=True)
+    if registry:
+        removed = registry.System.Cache.compact()
+        registry.commit()
+        logger.info("%d invalidations of the cache removed", removed)
+        registry.close()
+
+
 def anyblok2doc():
     """Return auto documentation for the registry
     """
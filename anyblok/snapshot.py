@@ -0,0 +1,208 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import json
+from hashlib import sha256
+from os.path import join, isfile, relpath, dirname
+from logging import getLogger
+from .blok import BlokManager, UndefinedBlok
+from .release import version
+
+logger = getLogger(__name__)
+
+
+def get_blok_declaration_hash(blok):
+    """Return the hash of the python modules of the blok package, from their
+    relative path, their size and their modification time, the modules are
+    not read
+
+    :param blok: name of the blok
+    :rtype: hexadecimal string
+    """
+    res = sha256()
+    if issubclass(BlokManager.get(blok), UndefinedBlok):
+        return res.hexdigest()
+
+    path = BlokManager.getPath(blok)
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file_name in sorted(files):
+            if not file_name.endswith('.py'):
+                continue
+
+            file_path = join(root, file_name)
+            stat = os.stat(file_path)
+            res.update(('%s:%d:%d;' % (
+                relpath(file_path, path), stat.st_size,
+                stat.st_mtime_ns)).encode('utf-8'))
+
+    return res.hexdigest()
+
+
+def get_bloks_fingerprint(installed_bloks):
+    """Return the fingerprint of the installed bloks
+
+    The fingerprint takes care of:
+
+    * the version of AnyBlok
+    * the name and the version of the available bloks
+    * the name, the installed version and the hash of the declaration
+      modules (path, size and modification time) of the installed bloks
+
+    :param installed_bloks: ordered list of (name, installed version)
+    :rtype: hexadecimal string or None if one blok is not available
+    """
+    res = sha256(version.encode('utf-8'))
+    for blok in BlokManager.list():
+        res.update(('%s:%s;' % (
+            blok, BlokManager.bloks[blok].version)).encode('utf-8'))
+
+    for blok, installed_version in installed_bloks:
+        if not BlokManager.has(blok):
+            return None
+
+        res.update(('%s:%s:%s;' % (
+            blok, installed_version,
+            get_blok_declaration_hash(blok))).encode('utf-8'))
+
+    return res.hexdigest()
+
+
+def get_installed_bloks(bloks_states):
+    """Return the installed bloks or None if one blok must be changed
+
+    :param bloks_states: list of (name, state, installed version)
+    :rtype: ordered list of (name, installed version)
+    """
+    installed = []
+    for name, state, installed_version in bloks_states:
+        if state in ('toinstall', 'toupdate', 'touninstall'):
+            return None
+
+        if state == 'installed':
+            installed.append((name, installed_version))
+
+    names = [x[0] for x in installed]
+    if not names or set(BlokManager.auto_install) - set(names):
+        return None
+
+    return installed
+
+
+class RegistrySnapshot:
+    """On-disk snapshot of the assembled registry of one database
+
+    The snapshot is saved in the ``registry_snapshot_dir`` directory after
+    the first commit of a fully loaded registry. At the next load, if the
+    fingerprint of the bloks is the same, the registry skips:
+
+    * the discovery of the bloks to load, install and their dependencies
+    * the reconciliation of ``System.Model``, ``System.Field``,
+      ``System.Blok`` with the assembled models
+
+    The mapped classes of SQLAlchemy are built dynamically and can not be
+    saved, so the bloks are still imported and the models are still
+    assembled at each load.
+
+    If the fingerprint changed, the registry is fully built and a new
+    snapshot is saved::
+
+        registry.snapshot.is_up_to_date()
+    """
+
+    def __init__(self, registry, directory):
+        self.registry = registry
+        self.path = join(directory, '%s.json' % registry.db_name)
+        self.data = self.read()
+
+    @property
+    def bloks(self):
+        """Ordered list of the bloks to load"""
+        return list(self.data['bloks'])
+
+    def read(self):
+        """Return the data saved in the snapshot file"""
+        if not isfile(self.path):
+            return None
+
+        try:
+            with open(self.path, 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            logger.warning('Invalid registry snapshot %r', self.path)
+            return None
+
+    def get_installed_bloks(self):
+        """Return the installed bloks or None if one blok must be changed
+
+        :rtype: ordered list of (name, installed version)
+        """
+        return get_installed_bloks(self.registry.get_bloks_states())
+
+    def is_up_to_date(self):
+        """Return True if the snapshot can be used to load the registry"""
+        if self.data is None:
+            return False
+
+        installed = self.get_installed_bloks()
+        if installed is None:
+            return False
+
+        if self.data.get('bloks') != [x[0] for x in installed]:
+            return False
+
+        fingerprint = get_bloks_fingerprint(installed)
+        return fingerprint is not None and (
+            fingerprint == self.data.get('fingerprint'))
+
+    def get_models(self):
+        """Return the description of the assembled models
+
+        :rtype: dict {namespace: {'table': ..., 'fields': {name: type}}}
+        """
+        fsp = self.registry.loaded_namespaces_first_step
+        res = {}
+        for namespace, Model in self.registry.loaded_namespaces.items():
+            res[namespace] = {
+                'table': getattr(Model, '__tablename__', None),
+                'fields': {
+                    x: fsp[namespace][x].__class__.__name__
+                    for x in getattr(Model, 'loaded_columns', [])
+                },
+            }
+
+        return res
+
+    def match_models(self):
+        """Return True if the assembled models are the saved models"""
+        return self.data is not None and (
+            self.data.get('models') == self.get_models())
+
+    def save(self):
+        """Write the snapshot of the registry on the disk"""
+        installed = self.get_installed_bloks()
+        if installed is None:
+            return
+
+        fingerprint = get_bloks_fingerprint(installed)
+        if fingerprint is None:
+            return
+
+        data = {
+            'fingerprint': fingerprint,
+            'bloks': [x[0] for x in installed],
+            'models': self.get_models(),
+        }
+        os.makedirs(dirname(self.path), exist_ok=True)
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            json.dump(data, fp, sort_keys=True)
+
+        os.replace(tmp_path, self.path)
+        self.data = data
+        logger.info('Registry snapshot saved in %r', self.path)
@@ -0,0 +1,40 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2020 Jean-Sebastien SUZANNE <jssuzanne@anybox.fr>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Benchmark of the bulk insert without the ORM, outside of the unit tests
+because it depends on the load of the machine::
+
+    pytest anyblok/tests/benchmark_multi_insert.py
+"""
+import pytest
+from timeit import repeat
+from .conftest import init_registry
+from .test_core_sqlbase import declare_model
+
+
+@pytest.fixture(scope="module")
+def registry_declare_model(request, bloks_loaded):
+    registry = init_registry(declare_model)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+def test_multi_insert_without_orm_is_faster(registry_declare_model):
+    registry = registry_declare_model
+    transaction = registry.begin_nested()
+    try:
+        rows = [{'id2': x} for x in range(5000)]
+        # before the ORM, whose instances stay in the session, the first
+        # call compiles the query of the batches
+        without_orm = min(repeat(
+            lambda: registry.Test.multi_insert(*rows, returning=False),
+            number=1, repeat=5))
+        with_orm = min(repeat(
+            lambda: registry.Test.multi_insert(*rows), number=1, repeat=3))
+        assert without_orm * 10 < with_orm
+    finally:
+        transaction.rollback()
@@ -0,0 +1,30 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Benchmark of the session attributes of the registry given by descriptors,
+outside of the unit tests because it depends on the load of the machine::
+
+    pytest anyblok/tests/benchmark_session_attributes.py
+"""
+from timeit import repeat
+from anyblok.registry import Registry
+
+
+def test_descriptor_is_faster_than_getattr(registry_blok):
+    registry = registry_blok
+    with_descriptor = min(
+        repeat(lambda: registry.add, number=100000, repeat=5))
+    # the same attribute given by Registry.__getattr__, without descriptor
+    descriptor = Registry.__dict__['add']
+    del Registry.add
+    try:
+        with_getattr = min(
+            repeat(lambda: registry.add, number=100000, repeat=5))
+    finally:
+        Registry.add = descriptor
+
+    assert with_descriptor < with_getattr
@@ -88,6 +88,28 @@ def testbloks_loaded(request, base_loaded):
     BlokManager.load(entry_points=('bloks', 'test_bloks'))
 
 
+@pytest.fixture(scope="class")
+def commited_db_name(request, bloks_loaded):
+    """Name of a dedicated database where the bloks are installed and
+    commited"""
+    db_name = Configuration.get('db_name') + '_commited'
+    url = Configuration.get('get_url')(db_name=db_name)
+    if database_exists(url):
+        drop_database(url)
+
+    create_database(url)
+    registry = RegistryManager.get(db_name)
+    registry.commit()
+    registry.close()
+
+    def drop():
+        RegistryManager.clear()
+        drop_database(url)
+
+    request.addfinalizer(drop)
+    return db_name
+
+
 def reset_db():
     if sgdb_in(['MySQL', 'MariaDB']):
         url = Configuration.get('get_url')()
@@ -0,0 +1,103 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
+import pytest
+from anyblok.aio import AsyncQuery, AsyncSession
+from anyblok.environment import (EnvironmentManager, ThreadEnvironment,
+                                 ContextVarEnvironment)
+from anyblok.registry import RegistryManager, RegistryException
+
+
+class TestAsyncRegistry:
+
+    @pytest.fixture(autouse=True)
+    def registry(self, request, commited_db_name):
+        RegistryManager.clear()
+        EnvironmentManager.define_environment_cls(ContextVarEnvironment)
+
+        def reset():
+            RegistryManager.clear()
+            EnvironmentManager.define_environment_cls(ThreadEnvironment)
+
+        request.addfinalizer(reset)
+        self.registry = RegistryManager.get(commited_db_name, unittest=True)
+        self.aregistry = self.registry.get_async_registry()
+
+    def test_environment_is_required(self):
+        EnvironmentManager.define_environment_cls(ThreadEnvironment)
+        with pytest.raises(RegistryException):
+            self.registry.get_async_registry()
+
+    def test_query(self):
+        Blok = self.aregistry.System.Blok
+
+        async def main():
+            query = Blok.query().filter_by(name='anyblok-core')
+            assert isinstance(query, AsyncQuery)
+            blok = await query.one()
+            count = await query.count()
+            bloks = await Blok.query('name').filter(
+                Blok.name == 'anyblok-core').dictall()
+            return blok.state, count, bloks
+
+        assert asyncio.run(main()) == (
+            'installed', 1, [{'name': 'anyblok-core'}])
+
+    def test_insert_and_commit_with_hooks(self):
+        Parameter = self.aregistry.System.Parameter
+
+        async def main():
+            await Parameter.insert(key='inserted', value={'value': 1})
+            await self.aregistry.precommit_hook(
+                'Model.System.Parameter', 'set', 'hooked', True)
+            await self.aregistry.commit()
+            hooked = await Parameter.get('hooked')
+            inserted = await Parameter.get('inserted')
+            await self.aregistry.close_session()
+            return hooked, inserted
+
+        assert asyncio.run(main()) == (True, 1)
+
+    def test_session_by_task(self):
+
+        async def task():
+            session = await self.aregistry.run(self.registry.Session)
+            await asyncio.sleep(0)
+            same_session = await self.aregistry.run(self.registry.Session)
+            await self.aregistry.close_session()
+            return session, same_session
+
+        async def main():
+            return await asyncio.gather(task(), task())
+
+        (session1, same1), (session2, same2) = asyncio.run(main())
+        assert session1 is same1
+        assert session2 is same2
+        assert session1 is not session2
+
+    def test_async_session_factory(self):
+        async_session = self.registry.create_async_session_factory()
+        Blok = self.registry.System.Blok
+        table = self.registry.System.Parameter.__table__
+
+        async def main():
+            async with async_session() as session:
+                assert isinstance(session, AsyncSession)
+                blok = await session.query(Blok).filter_by(
+                    name='anyblok-core').one()
+                state = blok.state
+                await session.execute(table.insert().values(
+                    key='async', value={'value': 1}, multi=False))
+                await session.commit()
+                inserted = await session.execute(
+                    table.delete().where(table.c.key == 'async'))
+                await session.commit()
+
+            return state, inserted.rowcount
+
+        assert asyncio.run(main()) == ('installed', 1)
@@ -11,7 +11,14 @@
 import pytest
 from anyblok.testing import sgdb_in
 from anyblok.blok import BlokManager
-from anyblok.registry import RegistryException, RegistryConflictingException
+from anyblok.registry import (
+    Registry, RegistryException, RegistryConflictingException)
+
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
 
 
 @pytest.mark.skipif(sgdb_in(['MySQL', 'MariaDB']),
@@ -746,6 +753,48 @@ class TestBlokOrder:
         self.check_order(registry, 'install', [
             'test-blok1', 'test-blok2', 'test-blok3'])
 
+    def test_install_1by1(self, registry_testblok):
+        registry = registry_testblok
+        with patch.object(Registry, 'load', autospec=True,
+                          side_effect=Registry.load) as load:
+            registry.upgrade(install=('test-blok3',))
+
+        assert load.call_count == 3
+        self.check_order(registry, 'install', [
+            'test-blok1', 'test-blok2', 'test-blok3'])
+
+    def test_batch_install(self, registry_testblok):
+        registry = registry_testblok
+        from anyblok.blok import Blok
+        migrations = []
+
+        def pre_migration(self, latest_version):
+            migrations.append(('pre', self.name))
+
+        def post_migration(self, latest_version):
+            migrations.append(('post', self.name))
+
+        registry.batch_install_bloks = True
+        try:
+            with patch.object(Registry, 'load', autospec=True,
+                              side_effect=Registry.load) as load, \
+                    patch.object(Blok, 'pre_migration', pre_migration), \
+                    patch.object(Blok, 'post_migration', post_migration):
+                registry.upgrade(install=('test-blok3',))
+        finally:
+            registry.batch_install_bloks = False
+
+        assert load.call_count == 1
+        bloks = ['test-blok1', 'test-blok2', 'test-blok3']
+        assert migrations == (
+            [('pre', x) for x in bloks] + [('post', x) for x in bloks])
+        self.check_order(registry, 'install', [
+            'test-blok1', 'test-blok2', 'test-blok3'])
+        self.check_order(registry, 'load', [
+            'anyblok-core', 'test-blok1', 'test-blok2', 'test-blok3'])
+        Blok = registry.System.Blok
+        assert not Blok.list_by_state('toinstall')
+
     def test_uninstall(self, registry_testblok):
         from anyblok.blok import Blok, BlokManager
         old_uninstall = Blok.uninstall
@@ -6,8 +6,18 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+from datetime import datetime, timedelta, timezone
 from random import random
-from anyblok.declarations import Declarations, cache, classmethod_cache
+from time import sleep
+from unittest.mock import patch
+from sqlalchemy import event, select, text
+from anyblok.config import Configuration
+from anyblok.environment import EnvironmentManager
+from anyblok.declarations import (
+    Declarations, DeclarationsException, cache, classmethod_cache)
+from anyblok.common import MethodCache, get_cache_key, get_size
+from anyblok.notification import CACHE_INVALIDATION_CHANNEL
+from anyblok.registry import RegistryManager
 from anyblok.bloks.anyblok_core.exceptions import CacheException
 from anyblok.column import Integer
 import pytest
@@ -68,8 +78,10 @@ class TestCache:
     def test_cache_invalidation(self, registry_method_cached):
         registry = registry_method_cached
         Cache = registry.System.Cache
+        Cache.flush_invalidations()
         nb_invalidation = Cache.query().count()
         Cache.invalidate('Model.Test', 'method_cached')
+        Cache.flush_invalidations()
         assert Cache.query().count() == nb_invalidation + 1
 
     def test_invalid_cache_invalidation(self, registry_method_cached):
@@ -234,6 +246,24 @@ class TestSimpleCache:
         registry = self.init_registry(self.add_model_with_method_cached)
         self.check_method_cached(registry.Test, 'Model.Test')
 
+    def test_model_with_cache_options(self):
+
+        def add_model():
+
+            @register(Model)
+            class Test:
+
+                @classmethod_cache(size=None, ttl=60, max_bytes=1000,
+                                   policy='lfu')
+                def method_cached(cls):
+                    return 1
+
+        registry = self.init_registry(add_model)
+        cached = registry.Test.method_cached
+        assert registry.Test.method_cached() == 1
+        assert (cached.maxsize, cached.ttl, cached.max_bytes,
+                cached.policy) == (None, 60, 1000, 'lfu')
+
     def test_model2(self):
         registry = self.init_registry(self.add_model_with_method_cached)
         from anyblok import Declarations
@@ -1060,3 +1090,595 @@ class TestSQLModelCache:
         Cache = registry.System.Cache
         Cache.invalidate('Model.Test', 'get_id2')
         assert t.get_id2() == 2
+
+
+class TestMethodCache:
+
+    def get_cls(self, maxsize=128, **kwargs):
+        calls = []
+
+        def method(cls, key, value=0):
+            calls.append((key, value))
+            return len(calls)
+
+        class Test:
+            cached = classmethod(MethodCache(method, maxsize=maxsize,
+                                             **kwargs))
+
+        return Test, calls
+
+    def test_cache(self):
+        Test, calls = self.get_cls()
+        assert Test.cached('a') == 1
+        assert Test.cached('a') == 1
+        assert Test.cached('a', value=1) == 2
+        assert Test.cached.cache_info() == (1, 2, 128, 2)
+
+    def test_invalidate_key(self):
+        Test, calls = self.get_cls()
+        Test.cached('a')
+        Test.cached('b')
+        Test.cached.cache_invalidate('a')
+        assert Test.cached.cache_info().currsize == 1
+        assert Test.cached('b') == 2
+        assert Test.cached('a') == 3
+
+    def test_invalidate_key_with_named_arguments(self):
+        Test, calls = self.get_cls()
+        Test.cached('a', value=1)
+        Test.cached('a')
+        Test.cached.cache_invalidate_key(get_cache_key(('a',), {'value': 1}))
+        assert Test.cached.cache_info().currsize == 1
+        assert Test.cached('a') == 2
+
+    def test_key_of_arguments_not_serializable(self):
+        with pytest.raises(TypeError):
+            get_cache_key((object(),), {})
+
+    def test_cache_arguments_not_serializable(self):
+        Test, calls = self.get_cls()
+        key = object()
+        assert Test.cached(key) == 1
+        assert Test.cached(key) == 1
+        assert not Test.cached.keys
+        Test.cached.cache_invalidate_all()
+        assert Test.cached(key) == 2
+
+    def test_lru(self):
+        Test, calls = self.get_cls(maxsize=2)
+        Test.cached('a')
+        Test.cached('b')
+        Test.cached('a')
+        Test.cached('c')
+        assert Test.cached.cache_info().currsize == 2
+        assert Test.cached('a') == 1
+        assert Test.cached('b') == 4
+        assert Test.cached.keys.keys() == {
+            get_cache_key(('a',), {}), get_cache_key(('b',), {})}
+
+    def test_clear(self):
+        Test, calls = self.get_cls()
+        Test.cached('a')
+        Test.cached.cache_clear()
+        assert Test.cached.cache_info() == (0, 0, 128, 0)
+        assert Test.cached('a') == 2
+
+    def test_ttl(self):
+        Test, calls = self.get_cls(ttl=60)
+        Test.cached('a')
+        assert Test.cached('a') == 1
+        entry = next(iter(Test.cached.entries.values()))
+        entry.expire_at -= 61
+        assert Test.cached('a') == 2
+        assert Test.cached.cache_info() == (1, 2, 128, 1)
+
+    def test_max_bytes(self):
+        Test, calls = self.get_cls(max_bytes=get_size(1) * 2)
+        Test.cached('a')
+        Test.cached('b')
+        Test.cached('c')
+        assert Test.cached.cache_info().currsize == 2
+        assert Test.cached.bytes == get_size(2) + get_size(3)
+        assert Test.cached('a') == 4
+
+    def test_max_bytes_with_a_too_big_value(self):
+        Test, calls = self.get_cls(max_bytes=1)
+        Test.cached('a')
+        assert Test.cached.cache_info().currsize == 0
+        assert Test.cached.bytes == 0
+
+    def test_lfu(self):
+        Test, calls = self.get_cls(maxsize=2, policy='lfu')
+        Test.cached('a')
+        Test.cached('a')
+        Test.cached('b')
+        Test.cached('c')
+        assert Test.cached('a') == 1
+        assert Test.cached('b') == 4
+
+    def test_lfu_evicts_the_oldest_of_the_less_used(self):
+        Test, calls = self.get_cls(maxsize=3, policy='lfu')
+        for x in 'abcb':
+            Test.cached(x)
+
+        Test.cached.cache_invalidate('a')
+        Test.cached('d')
+        Test.cached('e')
+        # c and d are used once, c is the oldest
+        assert sorted(x[1] for x in Test.cached.entries) == [
+            'b', 'd', 'e']
+        assert Test.cached.frequencies.keys() == {1, 2}
+
+    def test_invalidate_keeps_the_size(self):
+        Test, calls = self.get_cls(max_bytes=1000)
+        Test.cached('a')
+        Test.cached('b')
+        Test.cached.cache_invalidate('a')
+        assert Test.cached.bytes == get_size(2)
+        Test.cached.cache_clear()
+        assert Test.cached.bytes == 0
+
+    def test_get_size(self):
+        value = ['a' * 100]
+        assert get_size(value) > get_size([]) + 100
+        assert get_size([value, value]) < 2 * get_size(value) + get_size([])
+
+    def test_stats(self):
+        Test, calls = self.get_cls(maxsize=1, ttl=60)
+        Test.cached('a')
+        Test.cached('a')
+        Test.cached('b')
+        next(iter(Test.cached.entries.values())).expire_at -= 61
+        Test.cached('b')
+        Test.cached.cache_invalidate('b')
+        stats = Test.cached.cache_stats()
+        assert stats[:7] == (1, 3, 1, 0, 1, 1, 1)
+        assert stats.time_saved > 0
+
+    def test_invalidate_all_keeps_the_stats(self):
+        Test, calls = self.get_cls()
+        Test.cached('a')
+        Test.cached('a')
+        Test.cached.cache_invalidate_all()
+        assert Test.cached.cache_stats()[:7] == (1, 1, 128, 0, 0, 0, 1)
+        with Test.cached.lock:
+            Test.cached.reset_stats()
+
+        assert Test.cached.cache_stats() == (0, 0, 128, 0, 0, 0, 0, 0)
+
+    def test_unknown_policy(self):
+        with pytest.raises(DeclarationsException):
+            cache(policy='unknown')
+
+        with pytest.raises(DeclarationsException):
+            classmethod_cache(policy='unknown')
+
+
+@pytest.mark.usefixtures('rollback_registry')
+class TestCacheInvalidationByKey:
+
+    def test_invalidate_key(self, rollback_registry):
+        registry = rollback_registry
+        Blok = registry.System.Blok
+        Cache = registry.System.Cache
+        Blok.is_installed.cache_clear()
+        assert Blok.is_installed('anyblok-core')
+        assert not Blok.is_installed('unexisting-blok')
+        Cache.invalidate('Model.System.Blok', 'is_installed',
+                         'unexisting-blok')
+        assert Blok.is_installed.cache_info().currsize == 1
+        Cache.flush_invalidations()
+        assert Cache.query().order_by(Cache.id.desc()).first().key == (
+            get_cache_key(('unexisting-blok',), {}))
+
+    def test_invalidations_saved_once(self, rollback_registry):
+        registry = rollback_registry
+        Blok = registry.System.Blok
+        Cache = registry.System.Cache
+        Cache.flush_invalidations()
+        Blok.is_installed('anyblok-core')
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(registry.bind, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            for i in range(3):
+                Cache.invalidate('Model.System.Blok', 'is_installed',
+                                 'anyblok-core')
+                Cache.invalidate('Model.System.Blok', 'is_installed',
+                                 'unexisting-blok')
+
+            assert not Blok.is_installed.cache_info().currsize
+            assert not statements
+            nb_invalidation = Cache.query().count()
+            Cache.flush_invalidations()
+        finally:
+            event.remove(registry.bind, 'before_cursor_execute',
+                         before_cursor_execute)
+
+        assert len([x for x in statements
+                    if x.startswith('INSERT INTO system_cache (')]) == 1
+        assert Cache.query().count() == nb_invalidation + 2
+
+    def test_invalidation_of_all_the_entries_first(self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        Cache.flush_invalidations()
+        nb_invalidation = Cache.query().count()
+        Cache.invalidate('Model.System.Blok', 'is_installed',
+                         'anyblok-core')
+        Cache.invalidate('Model.System.Blok', 'is_installed')
+        Cache.flush_invalidations()
+        assert Cache.query().count() == nb_invalidation + 1
+        assert Cache.query().order_by(Cache.id.desc()).first().key is None
+
+    def test_invalidate_with_arguments_not_serializable(
+            self, rollback_registry):
+        registry = rollback_registry
+        with pytest.raises(CacheException):
+            registry.System.Cache.invalidate(
+                'Model.System.Blok', 'is_installed', object())
+
+    def count_invalidations(self, Cache, key=None):
+        return Cache.query().filter_by(
+            registry_name='Model.System.Blok', method='is_installed',
+            key=key).count()
+
+    def test_invalidation_by_a_precommit_hook(self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        key = get_cache_key(('anyblok-core',), {})
+        nb_invalidation = self.count_invalidations(Cache)
+        nb_key_invalidation = self.count_invalidations(Cache, key)
+        Cache.invalidate('Model.System.Blok', 'is_installed',
+                         'anyblok-core')
+        # called after the flush_invalidations hook
+        registry.precommit_hook('Model.System.Cache', 'invalidate',
+                                'Model.System.Blok', 'is_installed')
+        registry.commit()
+        assert not Cache.get_pending_invalidations()
+        assert self.count_invalidations(Cache) == nb_invalidation + 1
+        assert self.count_invalidations(Cache, key) == (
+            nb_key_invalidation + 1)
+
+    def test_invalidation_by_the_flush_of_the_commit(self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        parameter = registry.System.Parameter.insert(
+            key='flush_invalidation', value={'value': 1})
+        registry.commit()
+        nb_invalidation = self.count_invalidations(Cache)
+
+        def after_flush(session, flush_context):
+            Cache.invalidate('Model.System.Blok', 'is_installed')
+
+        session = registry.session
+        event.listen(session, 'after_flush', after_flush)
+        try:
+            parameter.value = {'value': 2}
+            registry.commit()
+        finally:
+            event.remove(session, 'after_flush', after_flush)
+
+        assert not Cache.get_pending_invalidations()
+        assert self.count_invalidations(Cache) == nb_invalidation + 1
+
+    def test_rollback_drops_the_invalidations(self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        Cache.invalidate('Model.System.Blok', 'is_installed')
+        assert Cache.get_pending_invalidations()
+        registry.rollback()
+        assert not Cache.get_pending_invalidations()
+
+    def test_invalidations_are_kept_by_database(self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        nb_invalidation = self.count_invalidations(Cache)
+        assert not Cache.get_pending_invalidations()
+        pending = EnvironmentManager.get('_cache_invalidations')
+        other = pending['other_database'] = {
+            ('Model.System.Blok', 'is_installed', None): None}
+        try:
+            Cache.invalidate('Model.System.Blok', 'is_installed')
+            registry.commit()
+            assert self.count_invalidations(Cache) == nb_invalidation + 1
+            registry.rollback()
+            assert pending['other_database'] is other
+            assert other
+        finally:
+            pending.pop('other_database', None)
+
+    def test_stats(self, rollback_registry):
+        registry = rollback_registry
+        Blok = registry.System.Blok
+        Cache = registry.System.Cache
+        Cache.reset_stats()
+        Blok.is_installed.cache_clear()
+        Blok.is_installed('anyblok-core')
+        Blok.is_installed('anyblok-core')
+        Cache.invalidate('Model.System.Blok', 'is_installed',
+                         'anyblok-core')
+        stats = Cache.stats(Blok, 'is_installed')
+        assert list(stats) == ['Model.System.Blok']
+        stats = stats['Model.System.Blok']['is_installed']
+        assert (stats['hits'], stats['misses'], stats['currsize'],
+                stats['invalidations']) == (1, 1, 0, 1)
+        assert 'Model.System.Blok' in Cache.stats()
+        Cache.reset_stats()
+        assert Cache.stats(Blok, 'is_installed')['Model.System.Blok'][
+            'is_installed']['hits'] == 0
+
+    def test_invalidate_key_found_by_polling(self, rollback_registry):
+        registry = rollback_registry
+        Blok = registry.System.Blok
+        Cache = registry.System.Cache
+        Cache.clear_invalidate_cache()
+        Blok.is_installed.cache_clear()
+        Blok.is_installed('anyblok-core')
+        Blok.is_installed('unexisting-blok')
+        Cache.insert(registry_name='Model.System.Blok', method='is_installed',
+                     key=get_cache_key(('anyblok-core',), {}))
+        Cache.clear_invalidate_cache()
+        assert Blok.is_installed.cache_info().currsize == 1
+
+
+@pytest.mark.usefixtures('rollback_registry')
+class TestCacheCompaction:
+
+    @pytest.fixture
+    def watermark_interval(self, request):
+        interval = Configuration.get('cache_watermark_interval')
+
+        def reset():
+            Configuration.set('cache_watermark_interval', interval)
+
+        request.addfinalizer(reset)
+
+    def test_watermark_saved_by_polling(self, rollback_registry,
+                                        watermark_interval):
+        registry = rollback_registry
+        Configuration.set('cache_watermark_interval', 0)
+        Cache = registry.System.Cache
+        Watermark = registry.System.CacheWatermark
+        Cache.invalidate('Model.System.Blok', 'is_installed')
+        Cache.flush_invalidations()
+        watermark = Watermark.query().get(Watermark.get_reader_name())
+        assert watermark.last_cache_id == Cache.get_last_id()
+
+    def test_watermark_saved_once_by_interval(self, rollback_registry,
+                                              watermark_interval):
+        registry = rollback_registry
+        Configuration.set('cache_watermark_interval', 3600)
+        Cache = registry.System.Cache
+        Watermark = registry.System.CacheWatermark
+        Cache.save_watermark(force=True)
+        with patch.object(Watermark, 'set') as watermark_set:
+            for i in range(3):
+                Cache.invalidate('Model.System.Blok', 'is_installed')
+                Cache.flush_invalidations()
+
+            assert not watermark_set.called
+            Configuration.set('cache_watermark_interval', 0)
+            Cache.invalidate('Model.System.Blok', 'is_installed')
+            Cache.flush_invalidations()
+
+        watermark_set.assert_called_once_with(Cache.get_last_id())
+
+    def test_compact(self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        for i in range(3):
+            Cache.invalidate('Model.System.Blok', 'is_installed')
+            Cache.flush_invalidations()
+
+        last_id = Cache.get_last_id()
+        Cache.compact()
+        assert Cache.query().count() == 1
+        assert Cache.get_last_id() == last_id
+
+    def test_compact_keeps_the_rows_of_the_other_readers(
+            self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        Watermark = registry.System.CacheWatermark
+        Cache.invalidate('Model.System.Blok', 'is_installed')
+        Cache.flush_invalidations()
+        other_id = Cache.get_last_id()
+        Watermark.insert(reader='other:1', last_cache_id=other_id,
+                         update_date=datetime.now(timezone.utc))
+        Cache.invalidate('Model.System.Blok', 'is_installed')
+        Cache.invalidate_all()
+        Cache.flush_invalidations()
+        nb_invalidation = Cache.query().filter(Cache.id > other_id).count()
+        Cache.compact()
+        assert Cache.query().count() == nb_invalidation
+
+    def test_compact_removes_the_expired_readers(self, rollback_registry):
+        registry = rollback_registry
+        Cache = registry.System.Cache
+        Watermark = registry.System.CacheWatermark
+        Watermark.insert(reader='other:1', last_cache_id=0,
+                         update_date=datetime.now(timezone.utc) - timedelta(
+                             days=2))
+        Cache.invalidate('Model.System.Blok', 'is_installed')
+        Cache.flush_invalidations()
+        Cache.compact(timeout=3600)
+        assert not Watermark.query().filter_by(reader='other:1').count()
+        assert Cache.query().count() == 1
+
+    def test_watermark_updated(self, rollback_registry):
+        registry = rollback_registry
+        Watermark = registry.System.CacheWatermark
+        reader = Watermark.get_reader_name()
+        Watermark.set(1)
+        Watermark.set(2)
+        assert registry.execute(
+            select([Watermark.__table__.c.last_cache_id]).where(
+                Watermark.__table__.c.reader == reader)).fetchall() == [(2,)]
+
+    def test_watermark_without_table(self, rollback_registry):
+        registry = rollback_registry
+        Watermark = registry.System.CacheWatermark
+        nb_watermark = Watermark.query().count()
+        registry.cache_watermark_table = None
+        dialect = type(registry.bind.dialect)
+        try:
+            with patch.object(dialect, 'has_table', return_value=False):
+                registry.System.Cache.save_watermark(force=True)
+                Watermark.set(1)
+        finally:
+            registry.cache_watermark_table = None
+
+        assert Watermark.query().count() == nb_watermark
+
+    def test_watermark_table_checked_once(self, rollback_registry):
+        registry = rollback_registry
+        Watermark = registry.System.CacheWatermark
+        dialect = type(registry.bind.dialect)
+        Watermark.set(0)
+        with patch.object(dialect, 'has_table') as has_table:
+            Watermark.set(1)
+            Watermark.set(2)
+
+        assert not has_table.called
+
+
+class TestCacheWatermark:
+
+    @pytest.fixture(autouse=True)
+    def registry(self, request, commited_db_name):
+        RegistryManager.clear()
+        self.registry = RegistryManager.get(commited_db_name)
+        Watermark = self.registry.System.CacheWatermark
+
+        def reset():
+            self.registry.rollback()
+            with self.registry.engine.begin() as connection:
+                connection.execute(Watermark.__table__.delete().where(
+                    Watermark.__table__.c.reader ==
+                    Watermark.get_reader_name()))
+
+            RegistryManager.clear()
+
+        request.addfinalizer(reset)
+
+    def test_watermark_saved_in_its_own_transaction(self):
+        registry = self.registry
+        Watermark = registry.System.CacheWatermark
+        Watermark.set(1)
+        registry.rollback()
+        watermark = Watermark.query().get(Watermark.get_reader_name())
+        assert watermark.last_cache_id == 1
+
+
+class TestCacheNotification:
+
+    @pytest.fixture(autouse=True)
+    def cache_invalidation_notify(self, request, commited_db_name):
+        self.db_name = commited_db_name
+        RegistryManager.clear()
+        Configuration.set('cache_invalidation_notify', True)
+
+        def reset():
+            Configuration.set('cache_invalidation_notify', False)
+            RegistryManager.clear()
+
+        request.addfinalizer(reset)
+
+    def wait_cache_clear(self, Blok):
+        for i in range(50):
+            if not Blok.is_installed.cache_info().currsize:
+                return True
+
+            sleep(0.1)
+
+        return False
+
+    def test_listener(self):
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        assert registry.cache_listener.thread.is_alive()
+        thread = registry.cache_listener.thread
+        registry.close()
+        assert registry.cache_listener is None
+        assert not thread.is_alive()
+
+    def test_listener_reconnects(self):
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        listener = registry.cache_listener
+        listener.retry_delay = 0.1
+        Blok = registry.System.Blok
+        assert not registry.System.Cache.is_polling()
+        assert Blok.is_installed('anyblok-core')
+        connection = listener.connection
+        # the connection is lost, the next select raises
+        connection.close()
+        for i in range(50):
+            if listener.connection not in (None, connection):
+                break
+
+            sleep(0.1)
+
+        assert listener.connected
+        assert listener.thread.is_alive()
+        assert not registry.System.Cache.is_polling()
+        # the notifications sent without connection are lost
+        assert self.wait_cache_clear(Blok)
+
+    def test_poll_while_the_listener_is_disconnected(self):
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        Cache = registry.System.Cache
+        registry.cache_listener.connected = False
+        try:
+            assert Cache.is_polling()
+        finally:
+            registry.cache_listener.connected = True
+
+        assert not Cache.is_polling()
+
+    def test_without_option(self):
+        Configuration.set('cache_invalidation_notify', False)
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        assert registry.cache_listener is None
+
+    def test_invalidation_notified_by_another_process(self):
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        Blok = registry.System.Blok
+        assert Blok.is_installed('anyblok-core')
+        assert Blok.is_installed.cache_info().currsize == 1
+        with registry.engine.connect() as conn:
+            conn.execution_options(autocommit=True).execute(
+                text('SELECT pg_notify(:channel, :payload)'),
+                channel=CACHE_INVALIDATION_CHANNEL,
+                payload='[["Model.System.Blok", "is_installed", null]]')
+
+        assert self.wait_cache_clear(Blok)
+
+    def test_invalidate_notifies_on_commit(self):
+        registry = RegistryManager.get(self.db_name)
+        # save the invalidations of the load of the registry
+        registry.commit()
+        other = registry.engine.raw_connection()
+        try:
+            other.connection.autocommit = True
+            cursor = other.cursor()
+            cursor.execute('LISTEN %s' % CACHE_INVALIDATION_CHANNEL)
+            Blok = registry.System.Blok
+            assert Blok.is_installed('anyblok-core')
+            registry.System.Cache.invalidate(
+                'Model.System.Blok', 'is_installed')
+            # the cache of the process is cleared without polling
+            assert not Blok.is_installed.cache_info().currsize
+            other.connection.poll()
+            assert not other.connection.notifies
+            registry.commit()
+            sleep(0.1)
+            other.connection.poll()
+            assert [x.payload for x in other.connection.notifies] == [
+                '[["Model.System.Blok", "is_installed", null]]']
+        finally:
+            other.connection.notifies.clear()
+            other.close()
@@ -0,0 +1,239 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from threading import Lock
+from unittest.mock import patch
+from anyblok.cache_backend import FileCacheBackend
+from anyblok.common import MethodCache, get_cache_key
+from anyblok.config import Configuration
+from anyblok.registry import RegistryManager
+
+
+class FakeCache:
+    version = 1
+
+    @classmethod
+    def get_backend_version(cls):
+        return cls.version
+
+
+class FakeRegistry:
+    db_name = 'db'
+
+    class System:
+        Cache = FakeCache
+
+
+class TestFileCacheBackend:
+
+    @pytest.fixture(autouse=True)
+    def backend(self, request, tmp_path):
+        self.backend = FileCacheBackend(str(tmp_path / 'cache.sqlite'))
+        request.addfinalizer(self.backend.close)
+
+    def test_get_and_set(self):
+        assert self.backend.get('db', 'Model.Test', 'method', 'a') == (
+            False, None)
+        self.backend.set('db', 'Model.Test', 'method', 'a', {'value': 1})
+        assert self.backend.get('db', 'Model.Test', 'method', 'a') == (
+            True, {'value': 1})
+        assert self.backend.get('other', 'Model.Test', 'method', 'a') == (
+            False, None)
+
+    def test_version(self):
+        self.backend.set('db', 'Model.Test', 'method', 'a', 1, version=1)
+        assert self.backend.get('db', 'Model.Test', 'method', 'a',
+                                version=1) == (True, 1)
+        assert self.backend.get('db', 'Model.Test', 'method', 'a',
+                                version=2) == (False, None)
+        self.backend.set('db', 'Model.Test', 'method', 'a', 2, version=2)
+        assert self.backend.get('db', 'Model.Test', 'method', 'a',
+                                version=2) == (True, 2)
+        assert self.backend.get('db', 'Model.Test', 'method', 'a',
+                                version=1) == (False, None)
+
+    def test_ttl(self):
+        self.backend.set('db', 'Model.Test', 'method', 'a', 1, ttl=-1)
+        assert self.backend.get('db', 'Model.Test', 'method', 'a') == (
+            False, None)
+
+    def test_value_not_picklable(self):
+        self.backend.set('db', 'Model.Test', 'method', 'a', Lock())
+        assert self.backend.get('db', 'Model.Test', 'method', 'a') == (
+            False, None)
+
+    def test_invalidate(self):
+        self.backend.set('db', 'Model.Test', 'method', 'a', 1)
+        self.backend.set('db', 'Model.Test', 'method', 'b', 2)
+        self.backend.set('db', 'Model.Test', 'other', 'a', 3)
+        self.backend.invalidate('db', 'Model.Test', 'method', 'a')
+        assert not self.backend.get('db', 'Model.Test', 'method', 'a')[0]
+        assert self.backend.get('db', 'Model.Test', 'method', 'b')[0]
+        self.backend.invalidate('db', 'Model.Test', 'method')
+        assert not self.backend.get('db', 'Model.Test', 'method', 'b')[0]
+        assert self.backend.get('db', 'Model.Test', 'other', 'a')[0]
+
+    def test_clear(self):
+        self.backend.set('db', 'Model.Test', 'method', 'a', 1)
+        self.backend.set('other', 'Model.Test', 'method', 'a', 1)
+        self.backend.clear('db')
+        assert not self.backend.get('db', 'Model.Test', 'method', 'a')[0]
+        assert self.backend.get('other', 'Model.Test', 'method', 'a')[0]
+        self.backend.clear()
+        assert not self.backend.get('other', 'Model.Test', 'method', 'a')[0]
+
+    def get_cls(self, calls):
+
+        def method(cls, key):
+            calls.append(key)
+            return len(calls)
+
+        cached = MethodCache(method, backend=self.backend)
+        cached.indentify = ('Model.Test', 'method')
+
+        class Test:
+            registry = FakeRegistry
+            method = classmethod(cached)
+
+        return Test
+
+    def test_shared_by_the_method_caches(self):
+        calls = []
+        # the caches of two processes
+        Test1, Test2 = self.get_cls(calls), self.get_cls(calls)
+        assert Test1.method('a') == 1
+        assert Test2.method('a') == 1
+        assert calls == ['a']
+        assert Test2.method.cache_info().currsize == 1
+
+    def test_not_shared_after_an_invalidation(self):
+        calls = []
+        Test1, Test2 = self.get_cls(calls), self.get_cls(calls)
+        assert Test1.method('a') == 1
+        FakeCache.version = 2
+        try:
+            assert Test2.method('a') == 2
+        finally:
+            FakeCache.version = 1
+
+    def test_not_shared_without_version(self):
+        calls = []
+        Test1, Test2 = self.get_cls(calls), self.get_cls(calls)
+        FakeCache.version = None
+        try:
+            assert Test1.method('a') == 1
+            assert Test2.method('a') == 2
+        finally:
+            FakeCache.version = 1
+
+    def test_arguments_not_serializable(self):
+        calls = []
+        Test1, Test2 = self.get_cls(calls), self.get_cls(calls)
+        key = object()
+        assert Test1.method(key) == 1
+        assert Test1.method(key) == 1
+        # the entry is only in the cache of the process
+        assert Test2.method(key) == 2
+        with pytest.raises(TypeError):
+            Test1.method.cache_invalidate(key)
+
+        Test1.method.cache_invalidate_all()
+        assert Test1.method(key) == 3
+
+
+class TestRegistryCacheBackend:
+
+    @pytest.fixture(autouse=True)
+    def cache_backend(self, request, commited_db_name, tmp_path):
+        self.db_name = commited_db_name
+        RegistryManager.clear()
+        Configuration.set('cache_backend_path',
+                          str(tmp_path / 'cache.sqlite'))
+
+        def reset():
+            Configuration.set('cache_backend_path', None)
+            RegistryManager.clear()
+
+        request.addfinalizer(reset)
+
+    def test_invalidation_on_commit(self):
+        registry = RegistryManager.get(self.db_name)
+        backend = registry.cache_backend
+        assert isinstance(backend, FileCacheBackend)
+        Cache = registry.System.Cache
+        key = get_cache_key(('anyblok-core',), {})
+        # save the invalidations of the load of the registry
+        registry.commit()
+        registry.System.Blok.is_installed.cache_clear()
+        assert registry.System.Blok.is_installed('anyblok-core')
+        version = Cache.get_backend_version()
+        assert backend.get(self.db_name, 'Model.System.Blok', 'is_installed',
+                           key, version=version) == (True, True)
+        Cache.invalidate('Model.System.Blok', 'is_installed', 'anyblok-core')
+        assert backend.get(self.db_name, 'Model.System.Blok', 'is_installed',
+                           key, version=version) == (True, True)
+        registry.commit()
+        assert backend.get(self.db_name, 'Model.System.Blok', 'is_installed',
+                           key, version=version) == (False, None)
+        assert Cache.get_backend_version() > version
+
+    def test_not_shared_with_pending_invalidations(self):
+        registry = RegistryManager.get(self.db_name)
+        Blok = registry.System.Blok
+        Cache = registry.System.Cache
+        key = get_cache_key(('anyblok-core',), {})
+        registry.commit()
+        registry.cache_backend.clear()
+        Cache.invalidate('Model.System.Blok', 'is_installed', 'anyblok-core')
+        assert Cache.get_backend_version() is None
+        assert Blok.is_installed('anyblok-core')
+        registry.rollback()
+        assert registry.cache_backend.get(
+            self.db_name, 'Model.System.Blok', 'is_installed', key,
+            version=Cache.get_backend_version()) == (False, None)
+
+    def test_version_read_once_by_transaction(self):
+        registry = RegistryManager.get(self.db_name)
+        Cache = registry.System.Cache
+        registry.commit()
+        with patch.object(Cache, 'get_last_id',
+                          wraps=Cache.get_last_id) as get_last_id:
+            version = Cache.get_backend_version()
+            assert Cache.get_backend_version() == version
+            assert get_last_id.call_count == 1
+            Cache.invalidate('Model.System.Blok', 'is_installed')
+            Cache.flush_invalidations()
+            assert Cache.get_backend_version() > version
+            registry.rollback()
+            get_last_id.reset_mock()
+            assert Cache.get_backend_version() == version
+            assert Cache.get_backend_version() == version
+            assert get_last_id.call_count == 1
+
+    def test_version_read_by_the_detection(self):
+        registry = RegistryManager.get(self.db_name)
+        Cache = registry.System.Cache
+        registry.commit()
+        Cache.detect_invalidation()
+        with patch.object(Cache, 'get_last_id') as get_last_id:
+            assert Cache.get_backend_version() is not None
+
+        assert not get_last_id.called
+
+    def test_only_the_classmethods_are_shared(self):
+        registry = RegistryManager.get(self.db_name)
+        for namespace, caches in registry.caches.items():
+            Model = registry.get(namespace)
+            for name, method_caches in caches.items():
+                if isinstance(getattr(Model, name), MethodCache):
+                    backend = None
+                else:
+                    backend = registry.cache_backend
+
+                for cache in method_caches:
+                    assert cache.backend is backend
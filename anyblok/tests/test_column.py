@@ -616,6 +616,49 @@ class TestColumns:
         registry.flush()
         assert test.update_at is not None
 
+    def test_datetime_with_auto_update_by_multi_update(self, dt_column_type):
+
+        def add_in_registry():
+
+            from anyblok import Declarations
+
+            @Declarations.register(Declarations.Model)
+            class Test:
+                id = Integer(primary_key=True)
+                update_at = DateTime(auto_update=True)
+                val = String()
+
+        registry = self.init_registry(add_in_registry)
+        test = registry.Test.insert(val='first add')
+        assert test.update_at is None
+        registry.Test.multi_update([test.to_primary_keys()], {'val': 'other'})
+        assert test.val == 'other'
+        assert test.update_at is not None
+
+    def test_datetime_with_auto_update_in_default_timezone(
+            self, dt_column_type):
+
+        def add_in_registry():
+
+            from anyblok import Declarations
+
+            @Declarations.register(Declarations.Model)
+            class Test:
+                id = Integer(primary_key=True)
+                update_at = DateTime(auto_update=True,
+                                     default_timezone='Asia/Tokyo')
+                val = String()
+
+        registry = self.init_registry(add_in_registry)
+        test = registry.Test.insert(val='first add')
+        test.val = 'other'
+        registry.flush()
+        now = datetime.datetime.now(pytz.utc)
+        assert abs(test.update_at - now) < datetime.timedelta(minutes=1)
+        registry.Test.multi_update([test.to_primary_keys()], {'val': 'last'})
+        now = datetime.datetime.now(pytz.utc)
+        assert abs(test.update_at - now) < datetime.timedelta(minutes=1)
+
     def test_datetime_with_default_timezone_tz(self, dt_column_type):
         import datetime
         import pytz
@@ -8,10 +8,13 @@
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
 from anyblok.column import Integer, String, Selection
+from anyblok.field import FieldException
 from anyblok.relationship import Many2One, One2One, Many2Many, One2Many
-from anyblok.declarations import Declarations
+from anyblok.declarations import Declarations, listen
 from anyblok.bloks.anyblok_core.exceptions import SqlBaseException
+from sqlalchemy import event, inspect
 from sqlalchemy.orm.exc import NoResultFound
+from unittest.mock import patch
 from .conftest import init_registry
 
 
@@ -79,6 +82,99 @@ class TestCoreSQLBase:
             assert registry.Test.query().filter(
                 registry.Test.id2 == x).count() == 1
 
+    def test_multi_insert_without_orm(self, registry_declare_model):
+        registry = registry_declare_model
+        assert registry.Test.multi_insert(
+            {'id2': 1}, {'id2': 2, 'select': 'key2'}, {},
+            returning=False) == 3
+        assert not registry.session.identity_map
+        query = registry.Test.query().order_by(registry.Test.id)
+        assert query.dictall('id2', 'select') == [
+            {'id2': 1, 'select': 'key'}, {'id2': 2, 'select': 'key2'},
+            {'id2': None, 'select': 'key'}]
+
+    def test_multi_insert_without_orm_returning(self, registry_declare_model):
+        registry = registry_declare_model
+        res = registry.Test.multi_insert(
+            *[{'id2': x} if x % 2 else {'id2': x, 'select': 'key2'}
+              for x in range(5)],
+            returning=['id', 'id2'], batch_size=2)
+        assert [x['id2'] for x in res] == list(range(5))
+        for entry in res:
+            assert registry.Test.query().get(entry['id']).id2 == entry['id2']
+
+    def test_multi_insert_without_orm_wrong_column(
+        self, registry_declare_model
+    ):
+        registry = registry_declare_model
+        with pytest.raises(SqlBaseException):
+            registry.Test.multi_insert({'id3': 1}, returning=False)
+
+        with pytest.raises(SqlBaseException):
+            registry.Test.multi_insert({'id2': 1}, returning=['id3'])
+
+    def test_multi_insert_without_orm_batch_size(self, registry_declare_model):
+        registry = registry_declare_model
+        dialect = registry.bind.dialect
+        get_batch_size = registry.Test._get_insert_batch_size
+        with patch.object(dialect, 'name', 'postgresql'):
+            assert get_batch_size(dialect, ('id2', 'select'), 1000) == 1000
+            assert get_batch_size(dialect, ('id2', 'select'), 20000) == 15000
+
+        with patch.object(dialect, 'name', 'mssql'):
+            assert get_batch_size(dialect, ('id2', 'select'), 20000) == 1000
+            assert get_batch_size(dialect, ('id2',) * 3, 20000) == 666
+
+        with patch.object(dialect, 'name', 'unknown'):
+            assert get_batch_size(dialect, ('id2', 'select'), 20000) == 499
+
+        with patch.object(dialect, 'supports_multivalues_insert', False):
+            assert get_batch_size(dialect, ('id2', 'select'), 20000) == 1
+
+    def test_multi_insert_without_orm_without_returning(
+        self, registry_declare_model
+    ):
+        registry = registry_declare_model
+        dialect = registry.bind.dialect
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(registry.bind, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            with patch.object(dialect, 'implicit_returning', False):
+                res = registry.Test.multi_insert(
+                    *[{'id2': x} if x % 2 else {'id2': x, 'select': 'key2'}
+                      for x in range(5)] + [{}],
+                    returning=['id', 'id2', 'select'])
+        finally:
+            event.remove(registry.bind, 'before_cursor_execute',
+                         before_cursor_execute)
+
+        # one query by entry, and the query of the returned columns
+        assert len([x for x in statements if x.startswith('INSERT')]) == 6
+        assert statements[-1].startswith('SELECT')
+        assert not [x for x in statements if 'RETURNING' in x]
+        assert [x['id2'] for x in res] == [0, 1, 2, 3, 4, None]
+        assert [x['select'] for x in res] == [
+            'key2', 'key', 'key2', 'key', 'key2', 'key']
+        for entry in res:
+            assert registry.Test.query().get(entry['id']).id2 == entry['id2']
+
+    def test_multi_update_and_multi_delete(self, registry_declare_model):
+        registry = registry_declare_model
+        Test = registry.Test
+        t1, t2, t3 = Test.multi_insert(*[{'id2': x} for x in range(3)])
+        assert Test.multi_update(Test.id2 >= 1, {'select': 'key2'}) == 2
+        assert [t1.select, t2.select, t3.select] == ['key', 'key2', 'key2']
+        with pytest.raises(FieldException):
+            Test.multi_update(Test.id2 >= 1, {'select': 'key3'})
+
+        assert Test.multi_delete(Test.select == 'key2') == 2
+        assert Test.query().all() == [t1]
+
     def test_delete(self, registry_declare_model):
         registry = registry_declare_model
         nb_value = 3
@@ -147,6 +243,81 @@ class TestCoreSQLBase:
         assert t.to_primary_keys() == {'id': t.id}
         assert registry.Test.from_primary_keys(id=t.id) == t
 
+    def count_statements(self, registry, func, *args, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(registry.bind, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            return func(*args, **kwargs), len(statements)
+        finally:
+            event.remove(registry.bind, 'before_cursor_execute',
+                         before_cursor_execute)
+
+    def test_from_primary_keys_in_one_query(self, registry_declare_model):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        registry.expunge_all()
+        t, nb = self.count_statements(
+            registry, registry.Test.from_primary_keys, id=t.id)
+        assert t.id2 == 1
+        assert nb == 1
+        # the instance of the session
+        assert self.count_statements(
+            registry, registry.Test.from_primary_keys, id=t.id) == (t, 0)
+        assert registry.Test.from_primary_keys(id=t.id + 1) is None
+
+    def test_load_from_multi_primary_keys(self, registry_declare_model):
+        registry = registry_declare_model
+        t1, t2, t3 = registry.Test.multi_insert(
+            *[{'id2': x} for x in range(3)])
+        pks = [t3.to_primary_keys(), {'id': t3.id + 1},
+               t1.to_primary_keys(), t3.to_primary_keys()]
+        registry.expire(t1, ['id2'])
+        registry.session.expunge(t3)
+        res, nb = self.count_statements(
+            registry, registry.Test.load_from_multi_primary_keys, *pks,
+            chunk_size=1)
+        # t1 is in the session, t3 and the missing key are loaded
+        assert nb == 2
+        assert res[1:3] == [None, t1]
+        assert res[0] is res[3]
+        assert res[0].id2 == 2
+        assert registry.Test.from_multi_primary_keys(*pks) == [res[0], t1]
+        with pytest.raises(SqlBaseException):
+            registry.Test.load_from_multi_primary_keys({'id2': 1})
+
+    def test_from_primary_keys_coerce_the_values(self, registry_declare_model):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        assert registry.Test.from_primary_keys(id=str(t.id)) is t
+        assert registry.Test.from_multi_primary_keys(
+            {'id': str(t.id)}, {'id': t.id}) == [t]
+
+    def test_from_primary_keys_of_a_deleted_instance(
+        self, registry_declare_model
+    ):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        registry.session.delete(t)
+        assert registry.Test.from_primary_keys(id=t.id) is None
+
+    def test_from_primary_keys_of_an_expired_instance(
+        self, registry_declare_model
+    ):
+        registry = registry_declare_model
+        t1, t2 = registry.Test.multi_insert({'id2': 1}, {'id2': 2})
+        pks = [t1.to_primary_keys(), t2.to_primary_keys()]
+        # the row is deleted without the session
+        table = registry.Test.__table__
+        registry.execute(table.delete().where(table.c.id == t1.id))
+        registry.expire(t1)
+        registry.expire(t2)
+        assert registry.Test.load_from_multi_primary_keys(*pks) == [None, t2]
+
     def test_expire_with_column_selection(self, registry_declare_model):
         registry = registry_declare_model
         t = registry.Test.insert()
@@ -168,6 +339,16 @@ def declare_model_with_m2o():
         name = String()
         test = Many2One(model=Model.Test, one2many="test2")
 
+        multi_events = []
+
+        @listen('Model.Test2', 'after_multi_update')
+        def after_multi_update(cls, pks, values):
+            cls.multi_events.append(('update', pks, values))
+
+        @listen('Model.Test2', 'after_multi_delete')
+        def after_multi_delete(cls, pks):
+            cls.multi_events.append(('delete', pks))
+
 
 @pytest.fixture(scope="class")
 def registry_declare_model_with_m2o(request, bloks_loaded):
@@ -194,6 +375,77 @@ class TestCoreSQLBaseM2O:
         t2.delete()
         assert len(t1.test2) == 0
 
+    def test_multi_insert_without_orm_m2o(
+        self, registry_declare_model_with_m2o
+    ):
+        registry = registry_declare_model_with_m2o
+        t1 = registry.Test.insert(name='t1')
+        registry.Test2.multi_insert({'name': 't2', 'test_id': t1.id},
+                                    returning=False)
+        assert registry.Test2.query().one().test is t1
+        with pytest.raises(SqlBaseException):
+            registry.Test2.multi_insert({'name': 't2', 'test': t1},
+                                        returning=False)
+
+    def test_multi_update(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        del registry.Test2.multi_events[:]
+        t1 = registry.Test.insert(name='t1')
+        t1b = registry.Test.insert(name='t1b')
+        t2 = registry.Test2.insert(name='t2', test=t1)
+        t3 = registry.Test2.insert(name='t3', test=t1)
+        assert t1.test2 == [t2, t3]
+        assert t1b.test2 == []
+        assert registry.Test2.multi_update(
+            [{'id': t2.id}], {'test_id': t1b.id}) == 1
+        assert t2.test is t1b
+        assert t1.test2 == [t3]
+        assert t1b.test2 == [t2]
+        assert registry.Test2.multi_update(
+            registry.Test2.test_id == t1.id, {'name': 'other'}) == 1
+        assert t3.name == 'other'
+        assert registry.Test2.multi_events == [
+            ('update', [{'id': t2.id}], {'test_id': t1b.id}),
+            ('update', [{'id': t3.id}], {'name': 'other'}),
+        ]
+
+    def test_multi_update_several_entries_of_a_relationship(
+            self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        t1 = registry.Test.insert(name='t1')
+        t1b = registry.Test.insert(name='t1b')
+        t2 = registry.Test2.insert(name='t2', test=t1)
+        t3 = registry.Test2.insert(name='t3', test=t1)
+        assert t1.test2 == [t2, t3]
+        assert t1b.test2 == []
+        assert registry.Test2.multi_update(
+            registry.Test2.test_id == t1.id, {'test_id': t1b.id}) == 2
+        assert t1.test2 == []
+        assert sorted(t1b.test2, key=lambda x: x.name) == [t2, t3]
+
+    def test_multi_update_wrong_column(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        with pytest.raises(SqlBaseException):
+            registry.Test2.multi_update([{'id': 1}], {'test': None})
+
+    def test_multi_delete(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        del registry.Test2.multi_events[:]
+        t1 = registry.Test.insert(name='t1')
+        t2 = registry.Test2.insert(name='t2', test=t1)
+        t3 = registry.Test2.insert(name='t3', test=t1)
+        t2_id = t2.id
+        assert t1.test2 == [t2, t3]
+        assert registry.Test2.multi_delete(
+            registry.Test2.name == 't2') == 1
+        assert t2 not in registry.session
+        assert t1.test2 == [t3]
+        assert registry.Test2.multi_delete([t3.to_primary_keys()]) == 1
+        assert t1.test2 == []
+        assert registry.Test2.query().count() == 0
+        assert registry.Test2.multi_events == [
+            ('delete', [{'id': t2_id}]), ('delete', [{'id': t3.id}])]
+
     def test_to_dict_m2o_with_pks(self, registry_declare_model_with_m2o):
         registry = registry_declare_model_with_m2o
         t1 = registry.Test.insert(name='t1')
@@ -210,6 +462,62 @@ class TestCoreSQLBaseM2O:
         assert t1.to_dict('name', 'test2') == {
             'name': 't1', 'test2': [{'id': t2.id}]}
 
+    def test_to_dict_plan(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        Test = registry.Test
+        assert Test.get_to_dict_plan('name', ['test2', ['name']]) == (
+            ('name', False, None), ('test2', True, ('name',)))
+        assert Test.get_to_dict_plan('test2') == (('test2', True, ('id',)),)
+        t1 = Test.insert(name='t1')
+        Test._get_to_dict_plan.cache_clear()
+        t1.to_dict('name')
+        t1.to_dict('name')
+        assert Test._get_to_dict_plan.cache_info()[:2] == (1, 1)
+
+    def test_dictall_with_fields(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        fields = ('name', ('test2', ('name', ('test', ('name',)))))
+        for i in range(3):
+            t1 = registry.Test.insert(name='t%d' % i)
+            for j in range(3):
+                registry.Test2.insert(name='t%d%d' % (i, j), test=t1)
+
+        query = registry.Test.query().order_by(registry.Test.id)
+        expected = [x.to_dict(*fields) for x in query.all()]
+        registry.flush()
+        registry.expunge_all()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(registry.bind, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            assert query.dictall(*fields) == expected
+        finally:
+            event.remove(registry.bind, 'before_cursor_execute',
+                         before_cursor_execute)
+
+        assert len(statements) == 3
+
+    def test_dictall_loads_only_the_fields(
+        self, registry_declare_model_with_m2o
+    ):
+        registry = registry_declare_model_with_m2o
+        t1 = registry.Test.insert(name='t1')
+        registry.Test2.insert(name='t2', test=t1)
+        registry.flush()
+        registry.expunge_all()
+        assert registry.Test2.query().dictall('test') == [
+            {'test': {'id': t1.id}}]
+        t2 = registry.Test2.query().one()
+        assert 'name' not in inspect(t2).dict
+        assert registry.Test2.query().dictone('name') == {'name': 't2'}
+        assert registry.Test2.query().dictfirst() == {
+            'id': t2.id, 'name': 't2', 'test_id': t1.id,
+            'test': {'id': t1.id}}
+
     def test_to_dict_m2o_with_column(self, registry_declare_model_with_m2o):
         registry = registry_declare_model_with_m2o
         t1 = registry.Test.insert(name='t1')
@@ -623,6 +931,18 @@ class TestCoreSQLBasem2m:
         assert t1.to_dict('name', 'test2') == {
             'name': 't1', 'test2': [{'id': t2.id}]}
 
+    def test_dictall_m2m_with_fields(self, registry_declare_model_with_m2m):
+        registry = registry_declare_model_with_m2m
+        t1 = registry.Test.insert(name='t1')
+        t2 = registry.Test2.insert(name='t2')
+        t2.test.append(t1)
+        registry.flush()
+        registry.expunge_all()
+        assert registry.Test2.query().dictall(
+            'name', ('test', ('name', 'test2'))) == [
+                {'name': 't2', 'test': [{'name': 't1',
+                                         'test2': [{'id': t2.id}]}]}]
+
     def test_to_dict_m2m_with_column(self, registry_declare_model_with_m2m):
         registry = registry_declare_model_with_m2m
         t1 = registry.Test.insert(name='t1')
@@ -5,10 +5,14 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
 import pytest
+from threading import Thread
 from anyblok.environment import (EnvironmentManager,
                                  ThreadEnvironment,
-                                 EnvironmentException)
+                                 ContextVarEnvironment,
+                                 EnvironmentException,
+                                 ScopedSession)
 
 
 class MockEnvironment:
@@ -165,3 +169,107 @@ class TestThreadEnvironment:
 
     def test_scoped_function_session(self):
         assert EnvironmentManager.scoped_function_for_session() is None
+
+
+class TestContextVarEnvironment:
+
+    @pytest.fixture(autouse=True)
+    def define_environment(self, request):
+
+        def reset():
+            EnvironmentManager.define_environment_cls(ThreadEnvironment)
+
+        request.addfinalizer(reset)
+        EnvironmentManager.define_environment_cls(ContextVarEnvironment)
+
+    def test_set_and_get_variable(self):
+        EnvironmentManager.set('db_name', 'test db name')
+        assert EnvironmentManager.get('db_name') == 'test db name'
+        assert EnvironmentManager.get('unexisting', 'default') == 'default'
+
+    def test_thread(self):
+        EnvironmentManager.set('db_name', 'main')
+        res = {}
+
+        def run():
+            res['before'] = EnvironmentManager.get('db_name')
+            EnvironmentManager.set('db_name', 'thread')
+            res['after'] = EnvironmentManager.get('db_name')
+
+        thread = Thread(target=run)
+        thread.start()
+        thread.join()
+        assert res == dict(before=None, after='thread')
+        assert EnvironmentManager.get('db_name') == 'main'
+
+    def test_asyncio_tasks(self):
+
+        async def task(db_name):
+            before = EnvironmentManager.get('db_name')
+            EnvironmentManager.set('db_name', db_name)
+            await asyncio.sleep(0)
+            return before, EnvironmentManager.get('db_name')
+
+        async def main():
+            EnvironmentManager.set('db_name', 'main')
+            res = await asyncio.gather(task('db1'), task('db2'))
+            return res, EnvironmentManager.get('db_name')
+
+        res, db_name = asyncio.run(main())
+        assert res == [(None, 'db1'), (None, 'db2')]
+        assert db_name == 'main'
+
+    def test_scoped_function_session(self):
+        scoped_function = EnvironmentManager.scoped_function_for_session()
+        assert scoped_function() == scoped_function()
+
+        async def task():
+            await asyncio.sleep(0)
+            return scoped_function()
+
+        async def main():
+            return await asyncio.gather(task(), task())
+
+        scope1, scope2 = asyncio.run(main())
+        assert scope1 is not scope2
+        assert scoped_function() not in (scope1, scope2)
+        assert scoped_function() is None
+
+    def get_scoped_session(self):
+
+        class Session:
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        return ScopedSession(
+            Session, EnvironmentManager.scoped_function_for_session())
+
+    def test_session_by_thread(self):
+        Session = self.get_scoped_session()
+        res = []
+        thread = Thread(target=lambda: res.append(Session()))
+        thread.start()
+        thread.join()
+        assert Session() is Session()
+        assert res[0] is not Session()
+        # nothing is kept for the threads
+        assert not Session.registry.registry
+
+    def test_session_released_with_the_task(self):
+        Session = self.get_scoped_session()
+
+        async def task():
+            await asyncio.sleep(0)
+            return Session()
+
+        async def main():
+            session1, session2 = await asyncio.gather(task(), task())
+            await asyncio.sleep(0)
+            return session1, session2
+
+        session1, session2 = asyncio.run(main())
+        assert session1 is not session2
+        assert session1.closed and session2.closed
+        assert not Session.registry.registry
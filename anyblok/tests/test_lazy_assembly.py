@@ -0,0 +1,83 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok.config import Configuration
+from anyblok.registry import RegistryManager
+
+
+class TestLazyAssembly:
+
+    @pytest.fixture(autouse=True)
+    def lazy_model_assembly(self, request, commited_db_name):
+        Configuration.set('lazy_model_assembly', True)
+        self.db_name = commited_db_name
+
+        def close():
+            Configuration.set('lazy_model_assembly', False)
+            RegistryManager.clear()
+
+        request.addfinalizer(close)
+
+    def get_registry(self, loadwithoutmigration=True):
+        return RegistryManager.get(
+            self.db_name, loadwithoutmigration=loadwithoutmigration,
+            unittest=True)
+
+    def test_not_assembled(self):
+        registry = self.get_registry()
+        assert 'Model.System.Parameter' in registry.lazy_namespaces
+        assert 'Model.System.Parameter' not in registry.loaded_namespaces
+        assert registry.has('Model.System.Parameter')
+
+    def test_models_with_listener_are_assembled(self):
+        registry = self.get_registry()
+        assert 'Model.System.Blok' in registry.loaded_namespaces
+        assert 'Model.System.Blok' not in registry.lazy_namespaces
+
+    def test_assemble_by_get(self):
+        registry = self.get_registry()
+        Parameter = registry.get('Model.System.Parameter')
+        assert 'Model.System.Parameter' in registry.loaded_namespaces
+        assert Parameter is registry.System.Parameter
+        Parameter.set('lazy', True)
+        assert Parameter.get('lazy') is True
+
+    def test_assemble_by_attribute(self):
+        registry = self.get_registry()
+        Parameter = registry.System.Parameter
+        assert 'Model.System.Parameter' in registry.loaded_namespaces
+        assert Parameter is registry.get('Model.System.Parameter')
+
+    def test_assemble_sub_namespace(self):
+        registry = self.get_registry()
+        assert 'Model.Documentation' in registry.lazy_namespaces
+        Field = registry.Documentation.Model.Field
+        assert Field is registry.get('Model.Documentation.Model.Field')
+        assert 'Model.Documentation.Blok' in registry.lazy_namespaces
+        assert registry.Documentation.Blok is registry.get(
+            'Model.Documentation.Blok')
+
+    def test_assemble_with_inherited_models(self):
+        registry = self.get_registry()
+        Column = registry.System.Column
+        assert 'Model.System.Field' in registry.loaded_namespaces
+        assert Column.query().filter_by(
+            model='Model.System.Blok', name='name').count() == 1
+
+    def test_assemble_lazy_namespaces(self):
+        registry = self.get_registry()
+        registry.assemble_lazy_namespaces()
+        assert not registry.lazy_namespaces
+        assert set(registry.loaded_namespaces) == set(
+            registry.loaded_registries['Model_names'])
+        assert registry.System.Model.query().count()
+
+    def test_no_lazy_assembly_with_migration(self):
+        registry = self.get_registry(loadwithoutmigration=False)
+        assert not registry.lazy_namespaces
+        assert 'Model.System.Parameter' in registry.loaded_namespaces
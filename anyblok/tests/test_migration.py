@@ -351,6 +351,43 @@ class TestMigration:
         with pytest.raises(MigrationException):
             registry.migration.detect_changed()
 
+    def test_schema_fingerprint(self, registry):
+        fingerprint = registry.migration.get_metadata_fingerprint()
+        assert fingerprint == registry.migration.get_metadata_fingerprint()
+        assert registry.System.Parameter.get(
+            registry.migration.schema_fingerprint_key) == fingerprint
+        assert registry.migration.is_schema_up_to_date()
+
+    def test_schema_fingerprint_changed(self, registry):
+        fingerprint = registry.migration.get_metadata_fingerprint()
+        registry.migration.ignore_migration_for['test'] = True
+        assert fingerprint != registry.migration.get_metadata_fingerprint()
+        assert not registry.migration.is_schema_up_to_date()
+
+    def test_schema_fingerprint_with_force_auto_migration(self, registry):
+        registry.migration.force_auto_migration = True
+        assert not registry.migration.is_schema_up_to_date()
+
+    def test_schema_fingerprint_with_reinit_all(self, registry):
+        registry.migration.reinit_all = True
+        assert not registry.migration.is_schema_up_to_date()
+
+    def test_apply_model_schema_without_detect_changed(self, registry):
+        with patch('anyblok.migration.Migration.detect_changed') as detect:
+            registry.apply_model_schema_on_table([])
+
+        detect.assert_not_called()
+
+    def test_apply_model_schema_with_force_auto_migration(self, registry):
+        Configuration.set('force_auto_migration', True)
+        try:
+            with patch('anyblok.migration.Migration.detect_changed') as detect:
+                registry.apply_model_schema_on_table([])
+        finally:
+            Configuration.set('force_auto_migration', False)
+
+        detect.assert_called_once_with(schema_only=False)
+
     def test_detect_column_added(self, registry):
         # Remove a column on the table force the detection to found new column
         # which is existing in metadata but not in table
@@ -0,0 +1,135 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+import tracemalloc
+from anyblok.config import Configuration
+from anyblok.registry import RegistryManager
+from anyblok.profiler import StartupProfiler, StartupProfilerException
+
+
+class TestStartupProfiler:
+
+    @pytest.fixture(autouse=True)
+    def profiler(self, request):
+        self.profiler = StartupProfiler()
+        self.profiler.start()
+        request.addfinalizer(self.profiler.stop)
+
+    def test_phase(self):
+        with self.profiler.phase('phase', blok='blok'):
+            self.profiler.count_sql_statement()
+
+        with self.profiler.phase('phase', blok='blok'):
+            pass
+
+        measure = self.profiler.report()[0]
+        assert measure['phase'] == 'phase'
+        assert measure['blok'] == 'blok'
+        assert measure['calls'] == 2
+        assert measure['sql'] == 1
+        assert measure['duration'] > 0
+
+    def test_nested_phases_are_exclusive(self):
+        with self.profiler.phase('parent'):
+            self.profiler.count_sql_statement()
+            with self.profiler.phase('child'):
+                self.profiler.count_sql_statement()
+                self.profiler.count_sql_statement()
+
+        measures = {x['phase']: x for x in self.profiler.report()}
+        assert measures['parent']['sql'] == 1
+        assert measures['child']['sql'] == 2
+
+    def test_no_measure_after_stop(self):
+        self.profiler.stop()
+        with self.profiler.phase('phase'):
+            pass
+
+        assert self.profiler.report() == []
+
+    def test_stop_tracemalloc(self):
+        assert tracemalloc.is_tracing()
+        self.profiler.stop()
+        assert not tracemalloc.is_tracing()
+
+    def test_report_sorted(self):
+        with self.profiler.phase('phase 1', blok='blok'):
+            self.profiler.count_sql_statement()
+
+        with self.profiler.phase('phase 2', blok='blok'):
+            self.profiler.count_sql_statement()
+            self.profiler.count_sql_statement()
+
+        with self.profiler.phase('phase 3'):
+            pass
+
+        assert [x['phase'] for x in self.profiler.report(sort_by='sql')] == [
+            'phase 2', 'phase 1', 'phase 3']
+        bloks = self.profiler.report_by_blok(sort_by='sql')
+        assert [(x['blok'], x['sql'], x['calls']) for x in bloks] == [
+            ('blok', 3, 2), (None, 0, 1)]
+
+    def test_report_with_unknown_column(self):
+        with pytest.raises(StartupProfilerException):
+            self.profiler.report(sort_by='unknown')
+
+    def test_merge(self):
+        with self.profiler.phase('phase', blok='blok'):
+            self.profiler.count_sql_statement()
+
+        profiler = StartupProfiler()
+        profiler.merge(self.profiler)
+        profiler.merge(self.profiler)
+        measure = profiler.report()[0]
+        assert measure['calls'] == 2
+        assert measure['sql'] == 2
+
+    def test_format(self):
+        with self.profiler.phase('phase', blok='blok'):
+            pass
+
+        text = self.profiler.format(limit=1)
+        assert 'Phases' in text
+        assert 'Bloks' in text
+        assert 'phase' in text
+
+
+class TestRegistryStartupProfile:
+
+    @pytest.fixture(autouse=True)
+    def profile_startup(self, request, commited_db_name):
+        self.db_name = commited_db_name
+
+        def close():
+            Configuration.set('profile_startup', False)
+            RegistryManager.clear()
+
+        request.addfinalizer(close)
+
+    def get_registry(self):
+        return RegistryManager.get(self.db_name, unittest=True)
+
+    def test_without_profile(self):
+        registry = self.get_registry()
+        assert registry.startup_profiler is None
+        assert registry.startup_profile is None
+
+    def test_profile(self):
+        Configuration.set('profile_startup', True)
+        registry = self.get_registry()
+        assert registry.startup_profiler.running is False
+        measures = {(x['phase'], x['blok']): x
+                    for x in registry.startup_profile}
+        assert ('Registry.load_bloks', 'anyblok-core') in measures
+        assert ('Registry.assemble_entries.Model', None) in measures
+        assert ('Registry.create_session_factory', None) in measures
+        assert ('Registry.apply_model_schema_on_table', None) in measures
+        assert ('System.Blok.load_all', 'anyblok-core') in measures
+        assert ('Model.plugins.TableMapperPlugin.transform_base',
+                None) in measures
+        assert sum(x['sql'] for x in measures.values())
@@ -10,7 +10,7 @@
 import pytest
 from .conftest import init_registry
 from anyblok.testing import TestCase, LogCapture
-from anyblok.registry import RegistryManager
+from anyblok.registry import RegistryManager, Registry
 from anyblok.config import Configuration
 from anyblok.blok import BlokManager, Blok
 from anyblok.column import Integer
@@ -694,3 +694,33 @@ class TestRegistry2:
             messages = logs.get_error_messages()
             message = messages[0]
             assert 'Here one exception' in message
+
+
+class TestRegistrySessionAttributes:
+
+    def test_session_attributes_without_getattr(self, registry_blok):
+        registry = registry_blok
+        Parameter = registry.System.Parameter
+        with patch.object(Registry, '__getattr__',
+                          side_effect=AssertionError) as getattr_:
+            assert registry.session is registry.Session()
+            assert registry.add == registry.Session().add
+            assert registry.query == registry.Session().query
+            Parameter.insert(key='session_attributes', value={'value': 1})
+            assert Parameter.query().filter_by(
+                key='session_attributes').count() == 1
+
+        getattr_.assert_not_called()
+
+    def test_session_attributes_without_session(self, registry_blok):
+        registry = registry_blok
+        Session = registry.Session
+        registry.Session = None
+        try:
+            with pytest.raises(AttributeError):
+                registry.session
+
+            with pytest.raises(AttributeError):
+                registry.add
+        finally:
+            registry.Session = Session
@@ -7,11 +7,25 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
-from anyblok.registry import RegistryManager
+from threading import Thread
+from time import sleep
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm.exc import UnmappedClassError
+from sqlalchemy_utils.functions import (
+    database_exists, create_database, drop_database)
+from anyblok.config import Configuration
+from anyblok.registry import (
+    RegistryManager, SharedRegistry, RegistryException)
 from anyblok.blok import BlokManager
 from anyblok.model import Model
 from anyblok.environment import EnvironmentManager
 
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
 
 class TestRegistryManager:
 
@@ -158,3 +172,249 @@ class TestRegistryManager:
             assert not RegistryManager.has_blok_property('myproperty')
         finally:
             EnvironmentManager.set('current_blok', oldblok)
+
+
+class TestRegistryManagerGet:
+
+    @pytest.fixture(autouse=True)
+    def db_name(self, request, commited_db_name):
+        self.db_name = commited_db_name
+        self.load_registry = RegistryManager.load_registry
+        request.addfinalizer(RegistryManager.clear)
+
+    def slow_load_registry(self, db_name, **kwargs):
+        # let the other threads wait for the lock
+        sleep(0.2)
+        return self.load_registry(db_name, **kwargs)
+
+    def test_single_flight(self):
+        registries = []
+
+        def get():
+            registries.append(
+                RegistryManager.get(self.db_name, unittest=True))
+
+        with patch.object(RegistryManager, 'load_registry',
+                          side_effect=self.slow_load_registry) as load:
+            threads = [Thread(target=get) for i in range(4)]
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        assert load.call_count == 1
+        assert len(registries) == 4
+        assert all(x is registries[0] for x in registries)
+        assert RegistryManager.registries[self.db_name] is registries[0]
+
+    def test_preload(self):
+        with patch.object(RegistryManager, 'load_registry',
+                          side_effect=self.slow_load_registry) as load:
+            registries = RegistryManager.preload(
+                [self.db_name, self.db_name], parallel=2, unittest=True)
+
+        assert load.call_count == 1
+        assert registries == {
+            self.db_name: RegistryManager.registries[self.db_name]}
+
+    def test_preload_sequential(self):
+        registries = RegistryManager.preload([self.db_name], unittest=True)
+        assert registries[self.db_name].System.Blok.query().count()
+
+
+class TestRegistryManagerPool:
+
+    @pytest.fixture(autouse=True)
+    def db_name(self, request, commited_db_name):
+        self.db_name = commited_db_name
+        RegistryManager.clear()
+        RegistryManager.reset_stats()
+
+        def reset():
+            Configuration.set('registry_pool_size', None)
+            RegistryManager.clear()
+
+        request.addfinalizer(reset)
+
+    def test_stats(self):
+        RegistryManager.get(self.db_name, unittest=True)
+        RegistryManager.get(self.db_name, unittest=True)
+        assert RegistryManager.get_stats() == dict(
+            hits=1, misses=1, evictions=0, size=1)
+        RegistryManager.reset_stats()
+        assert RegistryManager.get_stats() == dict(
+            hits=0, misses=0, evictions=0, size=1)
+
+    def test_without_pool_size(self):
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        RegistryManager.get(Configuration.get('db_name'), unittest=True)
+        assert RegistryManager.registries[self.db_name] is registry
+        assert RegistryManager.get_stats()['evictions'] == 0
+
+    def test_evict_least_recently_used(self):
+        Configuration.set('registry_pool_size', 2)
+        other_db_name = Configuration.get('db_name')
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        other_registry = RegistryManager.get(other_db_name, unittest=True)
+        # the registry of self.db_name becomes the most recently used
+        RegistryManager.get(self.db_name, unittest=True)
+        Configuration.set('registry_pool_size', 1)
+        RegistryManager.evict_registries()
+        assert list(RegistryManager.registries) == [self.db_name]
+        assert RegistryManager.registries[self.db_name] is registry
+        assert other_registry.loaded_namespaces == {}
+        assert RegistryManager.get_stats()['evictions'] == 1
+
+    def test_evict_when_a_registry_is_loaded(self):
+        Configuration.set('registry_pool_size', 1)
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        Blok = registry.System.Blok
+        RegistryManager.get(Configuration.get('db_name'), unittest=True)
+        assert self.db_name not in RegistryManager.registries
+        assert RegistryManager.get_stats() == dict(
+            hits=0, misses=2, evictions=1, size=1)
+        with pytest.raises(UnmappedClassError):
+            class_mapper(Blok)
+
+        new_registry = RegistryManager.get(self.db_name, unittest=True)
+        assert new_registry is not registry
+        assert new_registry.System.Blok.query().count()
+
+    def test_do_not_evict_a_used_registry(self):
+        Configuration.set('registry_pool_size', 1)
+        with RegistryManager.use(self.db_name, unittest=True) as registry:
+            RegistryManager.get(Configuration.get('db_name'), unittest=True)
+            assert RegistryManager.registries[self.db_name] is registry
+            assert registry.loaded_namespaces
+
+        assert self.db_name not in RegistryManager.registries
+        assert registry.loaded_namespaces == {}
+        assert RegistryManager.get_stats()['evictions'] == 1
+
+    def test_defer_the_eviction_until_release(self):
+        registry = RegistryManager.acquire(self.db_name, unittest=True)
+        RegistryManager.acquire(self.db_name, unittest=True)
+        RegistryManager.evict(self.db_name)
+        assert RegistryManager.registries[self.db_name] is registry
+        RegistryManager.release(registry)
+        assert registry.System.Blok.query().count()
+        RegistryManager.release(registry)
+        assert self.db_name not in RegistryManager.registries
+        assert registry.loaded_namespaces == {}
+        assert RegistryManager.get_stats()['evictions'] == 1
+
+
+@pytest.fixture(scope='class')
+def tenant_db_name(request, commited_db_name):
+    """Name of a copy of the commited database"""
+    db_name = commited_db_name + '_tenant'
+    url = Configuration.get('get_url')(db_name=db_name)
+    if database_exists(url):
+        drop_database(url)
+
+    RegistryManager.clear()
+    create_database(url, template=commited_db_name)
+
+    def drop():
+        RegistryManager.clear()
+        drop_database(url)
+
+    request.addfinalizer(drop)
+    return db_name
+
+
+class TestRegistryManagerShared:
+
+    @pytest.fixture(autouse=True)
+    def share_registry_template(self, request, commited_db_name,
+                                tenant_db_name):
+        self.db_name = commited_db_name
+        self.tenant_db_name = tenant_db_name
+        RegistryManager.clear()
+        Configuration.set('share_registry_template', True)
+
+        def reset():
+            Configuration.set('share_registry_template', False)
+            RegistryManager.clear()
+
+        request.addfinalizer(reset)
+
+    def get_registries(self):
+        template = RegistryManager.get(
+            self.db_name, loadwithoutmigration=True, unittest=True)
+        tenant = RegistryManager.get(
+            self.tenant_db_name, loadwithoutmigration=True, unittest=True)
+        return template, tenant
+
+    def test_share_the_models(self):
+        template, tenant = self.get_registries()
+        assert not isinstance(template, SharedRegistry)
+        assert isinstance(tenant, SharedRegistry)
+        assert tenant.template is template
+        assert tenant.System.Blok is template.System.Blok
+        assert tenant.bind is not template.bind
+        assert tenant.System.Blok.query().filter_by(
+            name='anyblok-core', state='installed').count() == 1
+
+    def test_registry_of_the_models_by_database(self):
+        template, tenant = self.get_registries()
+        assert template.System.Parameter.registry is tenant
+        tenant.System.Parameter.set('tenant', True)
+        RegistryManager.get(self.db_name)
+        assert template.System.Parameter.registry is template
+        assert template.System.Parameter.get('tenant', False) is False
+        RegistryManager.get(self.tenant_db_name)
+        assert tenant.System.Parameter.get('tenant') is True
+
+    def test_cache_by_database(self):
+        template, tenant = self.get_registries()
+        Blok = tenant.System.Blok
+        Blok.is_installed.cache_clear()
+        assert Blok.is_installed('anyblok-core')
+        RegistryManager.get(self.db_name)
+        assert Blok.is_installed('anyblok-core')
+        assert Blok.is_installed.cache_info().currsize == 2
+
+    def test_without_loadwithoutmigration(self):
+        template = RegistryManager.get(self.db_name, unittest=True)
+        registry = RegistryManager.get(self.tenant_db_name, unittest=True)
+        assert not isinstance(registry, SharedRegistry)
+        assert registry.System.Blok is not template.System.Blok
+
+    def test_without_template(self):
+        registry = RegistryManager.get(
+            self.tenant_db_name, loadwithoutmigration=True, unittest=True)
+        assert not isinstance(registry, SharedRegistry)
+        assert list(RegistryManager.templates.values()) == [registry]
+
+    def test_upgrade_is_forbidden(self):
+        template, tenant = self.get_registries()
+        with pytest.raises(RegistryException):
+            tenant.upgrade(install=('anyblok-test',))
+
+    def test_close_the_tenant(self):
+        template, tenant = self.get_registries()
+        tenant.close()
+        assert template.tenants == {}
+        assert self.tenant_db_name not in RegistryManager.registries
+        with pytest.raises(RegistryException):
+            template.System.Blok.registry
+
+    def test_registry_of_an_unknown_database(self):
+        template, tenant = self.get_registries()
+        EnvironmentManager.set('db_name', 'unknown_database')
+        with pytest.raises(RegistryException):
+            template.System.Blok.registry
+
+        RegistryManager.get(self.db_name)
+        assert template.System.Blok.registry is template
+
+    def test_dispose_the_template(self):
+        template, tenant = self.get_registries()
+        Blok = tenant.System.Blok
+        RegistryManager.evict(self.db_name)
+        assert RegistryManager.templates == {}
+        class_mapper(Blok)
+        RegistryManager.get(self.tenant_db_name)
+        assert Blok.query().count()
@@ -0,0 +1,127 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from sqlalchemy import event, func
+from sqlalchemy.exc import OperationalError
+from anyblok.config import Configuration
+from anyblok.testing import sgdb_in
+from anyblok.registry import RegistryManager
+
+
+class TestReplica:
+
+    @pytest.fixture(autouse=True)
+    def replica(self, request, commited_db_name):
+        self.db_name = commited_db_name
+        # keep the URL object, its string hides the password
+        self.url = Configuration.get('get_url')(db_name=commited_db_name)
+        self.statements = []
+
+        def close():
+            Configuration.set('db_replica_urls', None)
+            RegistryManager.clear()
+
+        request.addfinalizer(close)
+
+    def get_registry(self, *urls):
+        Configuration.set('db_replica_urls', list(urls))
+        registry = RegistryManager.get(self.db_name, unittest=True)
+        for engine in registry.replica_engines:
+            event.listen(engine, 'before_cursor_execute',
+                         self.before_cursor_execute)
+
+        return registry
+
+    def before_cursor_execute(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_without_replica(self):
+        registry = self.get_registry()
+        assert registry.replica_engines == []
+        assert registry.get_replica_engine() is None
+        assert registry.System.Blok.query().on_replica().count()
+
+    def test_query_on_replica(self):
+        registry = self.get_registry(self.url)
+        Blok = registry.System.Blok
+        assert Blok.query().filter_by(name='anyblok-core').count()
+        assert not self.statements
+        assert Blok.query().on_replica().filter_by(
+            name='anyblok-core').count()
+        assert len(self.statements) == 1
+        assert not registry.unavailable_replicas
+
+    def test_scope_on_replica(self):
+        registry = self.get_registry(self.url)
+        with registry.on_replica():
+            registry.System.Blok.query().all()
+
+        assert len(self.statements) == 1
+        registry.System.Blok.query().all()
+        assert len(self.statements) == 1
+        assert not registry.unavailable_replicas
+
+    def test_round_robin(self):
+        registry = self.get_registry(self.url, self.url)
+        engine1 = registry.get_replica_engine()
+        engine2 = registry.get_replica_engine()
+        assert engine1 is not engine2
+        assert registry.get_replica_engine() is engine1
+
+    def test_with_for_update_on_primary(self):
+        registry = self.get_registry(self.url)
+        with registry.on_replica():
+            registry.System.Blok.query().with_for_update().all()
+
+        assert not self.statements
+
+    def test_flush_on_primary(self):
+        registry = self.get_registry(self.url)
+        with registry.on_replica():
+            registry.System.Parameter.set('replica', True)
+
+        assert not [x for x in self.statements if x.startswith('INSERT')]
+        assert registry.System.Parameter.get('replica') is True
+
+    def test_fall_back_on_primary(self):
+        url = Configuration.get('get_url')(db_name='unexisting_replica')
+        registry = self.get_registry(url)
+        replica = registry.replica_engines[0]
+        assert registry.System.Blok.query().on_replica().filter_by(
+            name='anyblok-core').count() == 1
+        assert replica in registry.unavailable_replicas
+        assert registry.get_replica_engine() is None
+
+    @pytest.mark.skipif(not sgdb_in(['PostgreSQL']),
+                        reason="statement_timeout is only for PostgreSQL")
+    def test_do_not_fall_back_on_a_timeout(self):
+        registry = self.get_registry(self.url)
+        replica = registry.replica_engines[0]
+
+        def connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('SET statement_timeout = 10')
+            cursor.close()
+
+        event.listen(replica, 'connect', connect)
+        with pytest.raises(OperationalError):
+            registry.System.Blok.query(func.pg_sleep(1)).on_replica().all()
+
+        assert not registry.unavailable_replicas
+
+    def test_replica_available_after_the_delay(self):
+        url = Configuration.get('get_url')(db_name='unexisting_replica')
+        registry = self.get_registry(url)
+        replica = registry.replica_engines[0]
+        Configuration.set('db_replica_retry_delay', 0)
+        try:
+            registry.set_replica_unavailable(replica)
+        finally:
+            Configuration.set('db_replica_retry_delay', 30)
+
+        assert registry.get_replica_engine() is replica
@@ -0,0 +1,96 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2021 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import pytest
+from os.path import isfile
+from anyblok.blok import BlokManager
+from anyblok.config import Configuration
+from anyblok.registry import RegistryManager, Registry
+from anyblok.snapshot import get_bloks_fingerprint, get_blok_declaration_hash
+
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+class TestSnapshot:
+
+    @pytest.fixture(autouse=True)
+    def snapshot_dir(self, request, commited_db_name, tmpdir):
+        Configuration.set('registry_snapshot_dir', str(tmpdir))
+        self.db_name = commited_db_name
+
+        def close():
+            Configuration.set('registry_snapshot_dir', None)
+            RegistryManager.clear()
+
+        request.addfinalizer(close)
+
+    def get_registry(self):
+        return RegistryManager.get(self.db_name, unittest=True)
+
+    def test_declaration_hash(self):
+        assert get_blok_declaration_hash('anyblok-core') == (
+            get_blok_declaration_hash('anyblok-core'))
+        assert get_blok_declaration_hash('anyblok-core') != (
+            get_blok_declaration_hash('anyblok-test'))
+
+    def test_fingerprint(self):
+        fingerprint = get_bloks_fingerprint([('anyblok-core', '1.0.0')])
+        assert fingerprint == get_bloks_fingerprint(
+            [('anyblok-core', '1.0.0')])
+        assert fingerprint != get_bloks_fingerprint(
+            [('anyblok-core', '0.9.0')])
+
+    def test_fingerprint_with_unexisting_blok(self):
+        assert get_bloks_fingerprint([('unexisting-blok', '1.0.0')]) is None
+
+    def test_snapshot_saved_after_commit(self):
+        registry = self.get_registry()
+        assert registry.loaded_from_snapshot is False
+        assert not isfile(registry.snapshot.path)
+        registry.commit()
+        assert isfile(registry.snapshot.path)
+        assert registry.snapshot.is_up_to_date()
+        assert registry.snapshot.match_models()
+
+    def test_warm_start(self):
+        registry = self.get_registry()
+        registry.commit()
+        registry.close()
+        with patch.object(Registry, 'update_blok_list') as update_blok_list:
+            registry = self.get_registry()
+
+        assert registry.loaded_from_snapshot is True
+        update_blok_list.assert_not_called()
+        assert registry.System.Blok.list_by_state('installed') == (
+            registry.snapshot.bloks)
+
+    def test_cold_start_if_fingerprint_changed(self):
+        registry = self.get_registry()
+        registry.commit()
+        registry.close()
+        with patch.object(BlokManager.bloks['anyblok-test'], 'version',
+                          '100.0.0'):
+            registry = self.get_registry()
+
+        assert registry.loaded_from_snapshot is False
+
+    def test_cold_start_if_models_changed(self):
+        registry = self.get_registry()
+        registry.commit()
+        data = registry.snapshot.data
+        data['models'].pop('Model.System.Blok')
+        with open(registry.snapshot.path, 'w') as fp:
+            json.dump(data, fp)
+
+        registry.close()
+        registry = self.get_registry()
+        assert registry.loaded_from_snapshot is False
@@ -97,6 +97,8 @@ setup(
             'anyblok_nose=anyblok.scripts:anyblok_nose',
             'anyblok_interpreter=anyblok.scripts:anyblok_interpreter',
             'anyblok_doc=anyblok.scripts:anyblok2doc',
+            'anyblok_startup_profile=anyblok.scripts:anyblok_startup_profile',
+            'anyblok_compact_cache=anyblok.scripts:anyblok_compact_cache',
         ],
         'bloks': [
             'anyblok-core=anyblok.bloks.anyblok_core:AnyBlokCore',